@@ -3,16 +3,31 @@
 from __future__ import annotations
 
 import argparse
+import codecs
+import functools
+import io
+import json
+import logging
+import os
+import queue
 import re
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import typing
+from dataclasses import dataclass, fields
 from datetime import datetime
+from datetime import time as datetime_time
 from importlib import metadata
 from typing import Optional, cast
 
 from mplugin import (
     Check,
+    CheckError,
     Context,
+    Cookie,
     Metric,
     Performance,
     Resource,
@@ -20,10 +35,24 @@ from mplugin import (
     guarded,
     log,
 )
-from mplugin.cli import setup_argparser
-from mplugin.timespan import TIMESPAN_FORMAT_HELP, convert_timespan_to_sec
 
-__version__: str = metadata.version("check_zpool_scrub")
+if typing.TYPE_CHECKING:
+    from check_zpool_scrub.durations import ScrubDurations
+    from check_zpool_scrub.history import Trend
+    from check_zpool_scrub.iostat import Iostat, IostatRecord
+    from check_zpool_scrub.vdevs import VdevTree
+
+__version__: str
+
+
+def __getattr__(name: str) -> typing.Any:
+    # The version is looked up only on demand, because
+    # :func:`importlib.metadata.version` scans all installed distributions.
+    if name == "__version__":
+        version = metadata.version("check_zpool_scrub")
+        globals()["__version__"] = version
+        return version
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class OptionContainer:
@@ -32,12 +61,76 @@ class OptionContainer:
     verbose: int
     warning: int
     critical: int
+    timeout: Optional[float]
+    pool_timeout: Optional[float]
+    jobs: int
+    cache_ttl: Optional[float]
+    cache_file: Optional[str]
+    daemon: bool
+    socket: Optional[str]
+    socket_mode: int
+    socket_group: Optional[str]
+    interval: float
+    exporter_port: Optional[int]
+    exporter_address: str
+    events: bool
+    textfile: Optional[str]
+    history_dir: Optional[str]
+    history_size: int
+    slowdown: float
+    iostat: Optional[float]
+    orchestrate: bool
+    max_scrubs: int
+    domain: Optional[list[tuple[str, str]]]
+    due: Optional[int]
+    govern: bool
+    max_latency: float
+    pause_window: Optional[tuple[datetime_time, datetime_time]]
+    icinga_url: Optional[str]
+    icinga_user: str
+    icinga_password: Optional[str]
+    icinga_host: Optional[str]
+    icinga_service: str
+    icinga_ca: Optional[str]
+    analyze: Optional[list[str]]
+    analyze_format: str
+    self_timing: bool
+    vdevs: bool
+    wait: bool
+    wait_timeout: Optional[float]
+    progress_interval: float
+    durations_dir: Optional[str]
+    checkmk: bool
 
 
 opts: OptionContainer = OptionContainer()
 
+_zpool_status_json_supported: Optional[bool] = None
+"""Whether the installed ``zpool`` command supports JSON output (OpenZFS
+2.3+). ``None`` as long as the support has not been detected yet."""
+
+_timings: Optional[dict[str, float]] = None
+"""The durations of the phases of the check in seconds, with the perfdata
+labels as keys. ``None`` unless ``--self-timing`` is specified."""
+
+_timings_lock: threading.Lock = threading.Lock()
+
+
+def _add_timing(label: str, seconds: float) -> None:
+    """Add the duration of a phase if ``--self-timing`` is specified. The
+    pools may be probed in parallel threads."""
+    if _timings is None:
+        return
+    with _timings_lock:
+        _timings[label] = _timings.get(label, 0.0) + seconds
+
 
-def _list_pools() -> list[str]:
+def _exec_label(pool: Optional[str]) -> str:
+    return "zpool_exec_seconds" if pool is None else f"{pool}: zpool_exec_seconds"
+
+
+def _list_pools(timeout: Optional[float] = None) -> list[str]:
+    begin: float = time.monotonic()
     pools: list[str] = (
         subprocess.check_output(
             [
@@ -50,26 +143,682 @@ def _list_pools() -> list[str]:
                 "name",
             ],
             encoding="utf-8",
+            timeout=timeout,
         )
         .strip()
         .splitlines()
     )
+    _add_timing("zpool_list_seconds", time.monotonic() - begin)
     log.debug("Output from %s: %s", "zpool list -H -o name", pools)
     return pools
 
 
+_KSTAT_DIR: str = "/proc/spl/kstat/zfs"
+"""On Linux, each imported pool has a directory of kernel statistics here."""
+
+_ZPOOL_CACHE: str = "/etc/zfs/zpool.cache"
+"""Rewritten by ZFS whenever a pool is created, destroyed, imported or
+exported."""
+
+
+def _kstat_pools() -> Optional[list[str]]:
+    """The imported pools from the kstat directory of the Linux kernel
+    module.
+
+    :return: ``None`` if the directory does not exist, for example on
+      FreeBSD."""
+    try:
+        with os.scandir(_KSTAT_DIR) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir())
+    except OSError:
+        return None
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _discover_pools(
+    timeout: Optional[float] = None, cache_file: Optional[str] = None
+) -> list[str]:
+    """List the imported pools without forking ``zpool list`` if possible.
+
+    The pools are read from the kstat directory (:data:`_KSTAT_DIR`).
+    Otherwise the output of ``zpool list`` is cached as long as the
+    modification times of :data:`_ZPOOL_CACHE` and the kstat directory do not
+    change. ``zpool list`` runs only if neither source is available.
+
+    :param cache_file: The cache of the pool names (default: a file under
+      ``/run``)."""
+    pools = _kstat_pools()
+    if pools is not None:
+        log.debug("Pools in %s: %s", _KSTAT_DIR, pools)
+        return pools
+    stamp: list[Optional[int]] = [_mtime(_ZPOOL_CACHE), _mtime(_KSTAT_DIR)]
+    if stamp == [None, None]:
+        return _list_pools(timeout)
+    try:
+        with Cookie(cache_file or _run_file("check_zpool_scrub.pools.json")) as cookie:
+            entry: Optional[dict[str, typing.Any]] = cookie.get("pools")
+            if entry is not None and entry["stamp"] == stamp:
+                log.debug("Cached pools: %s", entry["names"])
+                return entry["names"]
+            pools = _list_pools(timeout)
+            cookie["pools"] = {"stamp": stamp, "names": pools}
+            return pools
+    except (OSError, ValueError) as e:
+        log.info("The cache of the pool names is not usable: %s", e)
+    return _list_pools(timeout) if pools is None else pools
+
+
+def _zpool_status(pool: Optional[str] = None) -> str:
+    """Run ``zpool status`` for one pool or, if ``pool`` is omitted, for all
+    imported pools at once."""
+    # https://github.com/openzfs/zfs/blob/master/cmd/zpool/zpool_main.c
+    args: list[str] = ["zpool", "status"]
+    if pool is not None:
+        args.append(pool)
+    output: str = subprocess.check_output(args, encoding="UTF-8")
+    log.debug("Output from %s: %s", " ".join(args), output)
+    return output
+
+
+def _zpool_scrub(pool: str, pause: bool = False) -> bool:
+    """Start or resume (``zpool scrub POOL``) or pause (``zpool scrub -p
+    POOL``) the scrub of a pool.
+
+    :return: ``False`` if ``zpool`` refused, the message is logged."""
+    args: list[str] = ["zpool", "scrub", pool]
+    if pause:
+        args.insert(2, "-p")
+    try:
+        subprocess.check_output(args, encoding="UTF-8", stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        log.warning("%s failed: %s", " ".join(args), (e.output or "").strip())
+        return False
+    return True
+
+
+_JSON_KEY: re.Pattern[str] = re.compile(r'"(scan_stats|vdevs)"\s*:\s*')
+
+
+def _stream_scan_stats_json(
+    args: list[str], pool: str, timeout: Optional[float] = None
+) -> Optional[dict[str, typing.Any]]:
+    """Read the output of ``zpool status -j --json-int POOL`` in chunks while
+    it arrives and stop as soon as the ``scan_stats`` object of the pool is
+    complete.
+
+    ``zpool`` writes the scan stats of a pool before its vdevs, so the vdevs
+    are neither read nor decoded. If the vdevs come first, the whole output
+    is read and decoded.
+
+    :return: The ``pools`` object of the JSON output or ``None`` if the JSON
+      output is not supported."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")("replace")
+    text: str = ""
+    searched: int = 0
+    scan_stats: Optional[dict[str, typing.Any]] = None
+    # The vdevs come first, the whole output is needed.
+    whole: bool = False
+    eof: bool = False
+    timed_out: bool = False
+    begin: float = time.monotonic()
+    parsing: float = 0.0
+
+    with subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    ) as process:
+
+        def kill() -> None:
+            nonlocal timed_out
+            timed_out = True
+            process.kill()
+
+        watchdog: Optional[threading.Timer] = None
+        if timeout is not None:
+            watchdog = threading.Timer(timeout, kill)
+            watchdog.start()
+        try:
+            # A pipe in binary mode is buffered.
+            stdout = cast(io.BufferedReader, process.stdout)
+            while scan_stats is None:
+                data: bytes = stdout.read1(65536)
+                eof = not data
+                text += utf8.decode(data, final=eof)
+                if eof:
+                    break
+                if whole:
+                    continue
+                started: float = time.monotonic()
+                while (match := _JSON_KEY.search(text, searched)) is not None:
+                    if match[1] == "vdevs":
+                        whole = True
+                        break
+                    try:
+                        value, _ = decoder.raw_decode(text, match.end())
+                    except ValueError:
+                        # The object is not complete yet.
+                        searched = match.start()
+                        break
+                    if isinstance(value, dict) and "function" in value:
+                        scan_stats = value
+                        break
+                    searched = match.end()
+                else:
+                    # A key may be cut off at the end of the chunk.
+                    searched = max(searched, len(text) - 64)
+                parsing += time.monotonic() - started
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+        if not eof:
+            # The rest of the output is not needed.
+            process.terminate()
+        returncode: int = process.wait()
+    _add_timing(_exec_label(pool), time.monotonic() - begin - parsing)
+    if timed_out:
+        raise subprocess.TimeoutExpired(args, typing.cast(float, timeout))
+    if scan_stats is not None:
+        _add_timing("parse_seconds", parsing)
+        return {pool: {"name": pool, "scan_stats": scan_stats}}
+    if returncode == 2:
+        # usage error: invalid option 'j'
+        return None
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+    log.debug("Output from %s: %s", " ".join(args), text)
+    started = time.monotonic()
+    pools = json.loads(text)["pools"]
+    _add_timing("parse_seconds", parsing + time.monotonic() - started)
+    return pools
+
+
+def _zpool_status_json(
+    pool: Optional[str] = None, timeout: Optional[float] = None, vdevs: bool = False
+) -> Optional[dict[str, typing.Any]]:
+    """Run ``zpool status -j --json-int`` for one pool or for all pools.
+
+    The support of the JSON output is detected only once per run. If the
+    installed ``zpool`` command is too old, it exits with a usage error. The
+    result of the detection is kept in the cache file until ``zpool`` is
+    upgraded (see :func:`_probe_pools_cached` and
+    :func:`_probe_pools_uncached`).
+
+    For a single pool, the output is streamed and ``zpool`` is terminated
+    after the scan stats, unless the vdevs are needed (see
+    :func:`_stream_scan_stats_json`). For all pools, the whole output is
+    read, as for the human-readable output.
+
+    :param timeout: Kill the command after so many seconds and raise
+      :class:`subprocess.TimeoutExpired`.
+    :param vdevs: The vdevs of the pools are needed.
+
+    :return: The ``pools`` object of the JSON output (pool names as keys) or
+      ``None`` if the JSON output is not supported."""
+    global _zpool_status_json_supported
+    if _zpool_status_json_supported is False:
+        return None
+    args: list[str] = ["zpool", "status", "-j", "--json-int"]
+    if pool is not None:
+        args.append(pool)
+    pools: Optional[dict[str, typing.Any]] = None
+    try:
+        if pool is not None and not vdevs:
+            pools = _stream_scan_stats_json(args, pool, timeout)
+        else:
+            begin: float = time.monotonic()
+            output: str = subprocess.check_output(
+                args, encoding="UTF-8", stderr=subprocess.PIPE, timeout=timeout
+            )
+            _add_timing(_exec_label(pool), time.monotonic() - begin)
+            log.debug("Output from %s: %s", " ".join(args), output)
+            begin = time.monotonic()
+            pools = json.loads(output)["pools"]
+            _add_timing("parse_seconds", time.monotonic() - begin)
+    except subprocess.CalledProcessError as e:
+        # zpool exits with 2 on an unknown option, with 1 on an unknown pool.
+        if e.returncode != 2:
+            raise
+    except (ValueError, KeyError, TypeError):
+        pass
+    _zpool_status_json_supported = pools is not None
+    return pools
+
+
+@dataclass(frozen=True, slots=True)
+class ScrubRecord:
+    """The scrub values of a pool. The record is filled either from the
+    human-readable text or from the JSON output of ``zpool status``."""
+
+    progress: Optional[float] = None
+    """A floating point number from ``0`` to ``1`` that represents the
+    progress (for example ``0.853``)."""
+
+    speed: Optional[float] = None
+    """MB per second."""
+
+    time_to_go: Optional[int] = None
+    """Time to go in seconds."""
+
+    last_scrub: Optional[datetime] = None
+    """The start time of a scrub in progress or the end time of a finished or
+    canceled scrub."""
+
+    scanned: Optional[int] = None
+    """The bytes scanned (read as metadata) so far by the scrub in
+    progress."""
+
+    issued: Optional[int] = None
+    """The bytes issued (read as data from the disks) so far by the scrub in
+    progress."""
+
+    total: Optional[int] = None
+    """The bytes to scrub in total."""
+
+    repaired: Optional[int] = None
+    """The bytes repaired by the scrub in progress or by the last scrub."""
+
+    issue_speed: Optional[float] = None
+    """MB per second issued. ``speed`` is the scan speed, a scan speed much
+    higher than the issue speed means the scrub waits for the disks."""
+
+    paused: Optional[bool] = None
+    """``True`` if the scrub in progress is paused (``zpool scrub -p``)."""
+
+
+_HEADER: re.Pattern[str] = re.compile(r"^ *([a-z]+):(?: |$)", re.MULTILINE)
+"""Matches the header lines of ``zpool status`` (for example ``scan:`` or
+``config:``)."""
+
+_SCAN: re.Pattern[str] = re.compile(
+    r"(?:canceled on|in progress since|errors on|started on) (?P<date>[^\n]+)"
+    # scrub paused since ..., followed by: scrub started on ...
+    r"|(?P<paused>paused since)"
+    r"|at (?P<speed>\d+(?:[.,]\d+)?)(?P<speed_unit>[BKMGTPE])/s"
+    # 9,12T scanned out of 9,48T
+    r"|out of (?P<out_of>\d+(?:[.,]\d+)?)(?P<out_of_unit>[BKMGTPE]?)"
+    # scrub repaired 0B in 00:23:45 with 0 errors on ...
+    r"|repaired (?P<repaired>\d+(?:[.,]\d+)?)(?P<repaired_unit>[BKMGTPE]?) in "
+    # All remaining values start with a number, a common prefix is cheaper
+    # than one alternative per value:
+    # 96,19% done, 52.05% done
+    # 55h33m to go, 0 days 01:01:21 to go, 01:01:21 to go
+    # 461G scanned at 120M/s, 258G issued at 67.2M/s, 496G total, 0B repaired
+    # https://github.com/openzfs/zfs/blob/cdf89f413c72fb17107a2b830a86161a21c74f82/cmd/zpool/zpool_main.c#L10229
+    r"|(?P<number>\d+(?:[.,]\d+)?)(?:(?P<done>% done)"
+    r"|(?: days (?P<clock>\d+:\d+:\d+)|h(?P<minutes>\d+)m|:(?P<clock_rest>\d+:\d+)) to go"
+    r"|(?P<unit>[BKMGTPE]?) (?P<counter>scanned|issued|total|repaired)"
+    r"(?: at (?P<rate>\d+(?:[.,]\d+)?)(?P<rate_unit>[BKMGTPE])/s)?)"
+)
+"""Matches all values of interest in the ``scan:`` block of ``zpool
+status``."""
+
+_CTIME: re.Pattern[str] = re.compile(
+    r"\w{3} (?P<month>\w{3}) +(?P<day>\d+) "
+    r"(?P<hour>\d+):(?P<minute>\d+):(?P<second>\d+) (?P<year>\d{4})"
+)
+"""Matches a date in the format of ``ctime(3)``."""
+
+_MONTHS: dict[str, int] = {
+    month: number
+    for number, month in enumerate(
+        [
+            "Jan",
+            "Feb",
+            "Mar",
+            "Apr",
+            "May",
+            "Jun",
+            "Jul",
+            "Aug",
+            "Sep",
+            "Oct",
+            "Nov",
+            "Dec",
+        ],
+        start=1,
+    )
+}
+
+_UNITS: str = "BKMGTPE"
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_ctime(date: str) -> datetime:
+    """Parse a date in the format of ``ctime(3)``, which ``zpool status``
+    always uses regardless of the locale (for example ``Thu Aug 17 10:25:48
+    2017``)."""
+    match = _CTIME.match(date)
+    if match is None or match["month"] not in _MONTHS:
+        return datetime.strptime(date, "%c")
+    return datetime(
+        int(match["year"]),
+        _MONTHS[match["month"]],
+        int(match["day"]),
+        int(match["hour"]),
+        int(match["minute"]),
+        int(match["second"]),
+    )
+
+
+def _to_bytes(number: str, unit: str) -> int:
+    """Convert a size like ``9,12`` ``T`` of ``zpool status`` to bytes.
+
+    ``zpool`` rounds the sizes to three significant digits, so the result is
+    exact only to that precision."""
+    size = float(number.replace(",", "."))
+    if unit:
+        size *= 1024 ** _UNITS.index(unit)
+    return round(size)
+
+
+def _to_megabytes(number: str, unit: str) -> float:
+    """Convert a rate like ``1,90`` ``M`` of ``zpool status`` to MB."""
+    speed = float(number.replace(",", "."))
+    exponent = _UNITS.index(unit) - _UNITS.index("M")
+    if exponent != 0:
+        speed *= 1024**exponent
+    return speed
+
+
+def _scan_record(block: str) -> ScrubRecord:
+    """Fill a record with a single pass of the scanner over the ``scan:``
+    block."""
+    values: dict[str, typing.Any] = {}
+    for match in _SCAN.finditer(block):
+        if match["date"] is not None:
+            values.setdefault("last_scrub", _parse_ctime(match["date"].strip()))
+        elif match["paused"] is not None:
+            values["paused"] = True
+        elif match["speed"] is not None:
+            values.setdefault(
+                "speed", _to_megabytes(match["speed"], match["speed_unit"])
+            )
+        elif match["out_of"] is not None:
+            values.setdefault("total", _to_bytes(match["out_of"], match["out_of_unit"]))
+        elif match["repaired"] is not None:
+            values.setdefault(
+                "repaired", _to_bytes(match["repaired"], match["repaired_unit"])
+            )
+        elif match["counter"] is not None:
+            counter = match["counter"]
+            values.setdefault(counter, _to_bytes(match["number"], match["unit"]))
+            if match["rate"] is not None:
+                values.setdefault(
+                    "speed" if counter == "scanned" else "issue_speed",
+                    _to_megabytes(match["rate"], match["rate_unit"]),
+                )
+        elif match["done"] is not None:
+            values.setdefault(
+                "progress", float(match["number"].replace(",", ".")) / 100
+            )
+        else:
+            number = int(match["number"])
+            if match["clock"] is not None:
+                # 0 days 01:01:21
+                hours, minutes, seconds = map(int, match["clock"].split(":"))
+                hours += number * 24
+            elif match["clock_rest"] is not None:
+                # 01:01:21
+                hours = number
+                minutes, seconds = map(int, match["clock_rest"].split(":"))
+            else:
+                # 55h33m
+                hours, minutes, seconds = number, int(match["minutes"]), 0
+            values.setdefault("time_to_go", (hours * 60 + minutes) * 60 + seconds)
+    return ScrubRecord(**values)
+
+
+def _parse_zpool_status(output: str) -> ScrubRecord:
+    """Scrape the scrub values from the human-readable ``zpool status``
+    output of one pool.
+
+    Only the ``scan:`` block is scanned, the output following the block (for
+    example the ``config:`` section) is not touched."""
+    start = output.find("scan: ")
+    if start == -1:
+        return ScrubRecord()
+    end = _HEADER.search(output, start + 6)
+    return _scan_record(output[start : end.start() if end is not None else None])
+
+
+def _scan_pools(
+    lines: typing.Iterable[str],
+    pool: Optional[str] = None,
+    vdevs: Optional[dict[str, VdevTree]] = None,
+) -> dict[str, ScrubRecord]:
+    """Scan the lines of the ``zpool status`` output as they arrive.
+
+    Only the lines of the ``scan:`` blocks are kept, all other lines (for
+    example the vdevs of the ``config:`` section) are dropped immediately.
+
+    :param lines: The lines of the output of one or more pools.
+    :param pool: If specified, reading stops as soon as the ``scan:`` block
+      of this pool is complete.
+    :param vdevs: If specified, the ``config:`` section of each pool is read
+      line by line into a :class:`~check_zpool_scrub.vdevs.VdevTree`, which
+      is stored in this dictionary. Reading does not stop early then.
+
+    :return: The scrub values of each pool, with the pool names as keys."""
+    records: dict[str, ScrubRecord] = {}
+    current: Optional[str] = None
+    block: Optional[list[str]] = None
+    tree: Optional[VdevTree] = None
+    for line in lines:
+        header = _HEADER.match(line)
+        if header is None:
+            if block is not None:
+                block.append(line)
+            elif tree is not None:
+                tree.add_line(line)
+            continue
+        tree = None
+        if block is not None and current is not None:
+            records[current] = _scan_record("".join(block))
+            block = None
+            if current == pool and vdevs is None:
+                return records
+        if header[1] == "pool":
+            current = line[header.end() :].strip()
+            records[current] = ScrubRecord()
+        elif header[1] == "scan":
+            block = [line]
+        elif header[1] == "config" and vdevs is not None and current is not None:
+            from check_zpool_scrub.vdevs import VdevTree
+
+            tree = vdevs[current] = VdevTree()
+    if block is not None and current is not None:
+        records[current] = _scan_record("".join(block))
+    return records
+
+
+def _debug_enabled() -> bool:
+    """Whether a debug message reaches a handler.
+
+    mplugin sets its logger to the level ``DEBUG`` and filters the messages by
+    the level of its handler, which depends on the verbosity. So
+    :meth:`logging.Logger.isEnabledFor` alone is always true."""
+    if not log.isEnabledFor(logging.DEBUG):
+        return False
+    logger: Optional[logging.Logger] = log
+    while logger is not None:
+        if any(handler.level <= logging.DEBUG for handler in logger.handlers):
+            return True
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    return False
+
+
+def _zpool_status_stream(
+    pool: Optional[str] = None,
+    timeout: Optional[float] = None,
+    vdevs: Optional[dict[str, VdevTree]] = None,
+) -> dict[str, ScrubRecord]:
+    """Run ``zpool status`` and hand the lines of its output to the parser
+    while they arrive.
+
+    If a pool is specified, the command is terminated as soon as the ``scan:``
+    block has been read, so the memory usage and the run time do not grow with
+    the number of vdevs.
+
+    :param timeout: Kill the command after so many seconds and raise
+      :class:`subprocess.TimeoutExpired`.
+    :param vdevs: Read the vdev trees into this dictionary, see
+      :func:`_scan_pools`."""
+    args: list[str] = ["zpool", "status"]
+    if pool is not None:
+        args.append(pool)
+    debug: bool = _debug_enabled()
+    eof: bool = False
+    timed_out: bool = False
+    timing: bool = _timings is not None
+    # With --self-timing: the time the parser waits for the output of zpool.
+    waiting: float = 0.0
+
+    def read_lines(stdout: typing.Iterable[str]) -> typing.Iterator[str]:
+        nonlocal eof
+        for line in stdout:
+            if debug:
+                log.debug("Output from %s: %s", " ".join(args), line.rstrip("\n"))
+            yield line
+        eof = True
+
+    def timed(stdout: typing.Iterable[str]) -> typing.Iterator[str]:
+        nonlocal waiting
+        lines = iter(stdout)
+        while True:
+            start = time.monotonic()
+            line = next(lines, None)
+            waiting += time.monotonic() - start
+            if line is None:
+                return
+            yield line
+
+    begin: float = time.monotonic()
+    parsing: float = 0.0
+
+    with subprocess.Popen(args, stdout=subprocess.PIPE, encoding="UTF-8") as process:
+
+        def kill() -> None:
+            nonlocal timed_out
+            timed_out = True
+            process.kill()
+
+        watchdog: Optional[threading.Timer] = None
+        if timeout is not None:
+            watchdog = threading.Timer(timeout, kill)
+            watchdog.start()
+        try:
+            assert process.stdout is not None
+            started: float = time.monotonic()
+            records = _scan_pools(
+                read_lines(timed(process.stdout) if timing else process.stdout),
+                pool,
+                vdevs,
+            )
+            parsing = time.monotonic() - started - waiting
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+        if not eof:
+            # The rest of the output is not needed.
+            process.terminate()
+        returncode: int = process.wait()
+    if timing:
+        _add_timing(_exec_label(pool), time.monotonic() - begin - parsing)
+        _add_timing("parse_seconds", parsing)
+    if timed_out:
+        raise subprocess.TimeoutExpired(args, typing.cast(float, timeout))
+    if returncode != 0 and eof:
+        raise subprocess.CalledProcessError(returncode, args)
+    return records
+
+
+def _parse_scan_stats(scan_stats: Optional[dict[str, typing.Any]]) -> ScrubRecord:
+    """Read the scrub values from the ``scan_stats`` object of the JSON output
+    of ``zpool status -j --json-int``.
+
+    The calculations follow the function ``print_scan_scrub_resilver_status``
+    of ``zpool_main.c``."""
+    if scan_stats is None or scan_stats.get("function", "NONE") == "NONE":
+        return ScrubRecord()
+
+    state: str = scan_stats["state"]
+    if state == "SCANNING":
+        total: int = scan_stats["to_examine"] - scan_stats["skipped"]
+        issued: int = scan_stats["issued"]
+        elapsed: float = (
+            datetime.now().timestamp()
+            - scan_stats["pass_start"]
+            - scan_stats["scrub_spent_paused"]
+        )
+        elapsed = max(elapsed, 1)
+        issue_rate: float = scan_stats["issued_bytes_per_scan"] / elapsed
+        return ScrubRecord(
+            progress=round(issued / total, 4) if total > 0 else None,
+            speed=round(scan_stats["bytes_per_scan"] / elapsed / 1024**2, 2),
+            time_to_go=round((total - issued) / issue_rate) if issue_rate > 0 else None,
+            last_scrub=datetime.fromtimestamp(scan_stats["start_time"]),
+            scanned=scan_stats["examined"],
+            issued=issued,
+            total=total,
+            repaired=scan_stats["processed"],
+            issue_speed=round(issue_rate / 1024**2, 2),
+            paused=True if scan_stats.get("scrub_pause") else None,
+        )
+    if state in ("FINISHED", "CANCELED"):
+        # Like the scan line of the human-readable output, which has no
+        # repaired count for a canceled scrub.
+        return ScrubRecord(
+            last_scrub=datetime.fromtimestamp(scan_stats["end_time"]),
+            repaired=scan_stats["processed"] if state == "FINISHED" else None,
+        )
+    return ScrubRecord()
+
+
 class PoolScrubStatus:
     pool: str
 
-    __zpool_status_output: str
+    record: ScrubRecord
 
-    def __init__(self, pool: str) -> None:
+    vdevs: Optional[VdevTree]
+
+    probed_at: datetime
+    """When ``zpool status`` was executed, earlier than now for a status
+    served from the cache or the daemon."""
+
+    def __init__(
+        self,
+        pool: str,
+        zpool_status_output: Optional[str] = None,
+        record: Optional[ScrubRecord] = None,
+        vdevs: Optional[VdevTree] = None,
+        probed_at: Optional[datetime] = None,
+    ) -> None:
+        """
+        :param pool: The name of the pool.
+        :param zpool_status_output: The section of an already fetched
+          ``zpool status`` output that belongs to the pool. If omitted,
+          ``zpool status POOL`` is executed.
+        :param record: The already parsed scrub values of the pool, for
+          example read from the JSON output.
+        :param vdevs: The vdev tree read from the same output, see
+          ``--vdevs``.
+        :param probed_at: When the record was read, by default now."""
         self.pool = pool
-        # https://github.com/openzfs/zfs/blob/master/cmd/zpool/zpool_main.c
-        self.__zpool_status_output = subprocess.check_output(
-            ["zpool", "status", pool], encoding="UTF-8"
-        )
-        log.debug("Output from %s: %s", "zpool status", self.__zpool_status_output)
+        self.probed_at = probed_at if probed_at is not None else datetime.now()
+        if record is None:
+            if zpool_status_output is None:
+                zpool_status_output = _zpool_status(pool)
+            record = _parse_zpool_status(zpool_status_output)
+        self.record = record
+        self.vdevs = vdevs
 
     @property
     def progress(self) -> Optional[float]:
@@ -77,60 +826,472 @@ class PoolScrubStatus:
 
         :return: A floating point number from ``0`` to ``1`` that represents the progress
         (for example ``0.853``)."""
-        match = re.search(r"(\d+,\d+)% done", self.__zpool_status_output)
-        if match is None:
-            return None
-        progress = match[1]
-        progress = progress.replace(",", ".")
-        return float(progress) / 100
+        return self.record.progress
 
     @property
     def speed(self) -> Optional[float]:
         """MB per second."""
-        match = re.search(r"at (\d+,\d+)M/s", self.__zpool_status_output)
-        if match is None:
-            return None
-        speed = match[1]
-        speed = speed.replace(",", ".")
-        return float(speed)
+        return self.record.speed
 
     @property
     def time_to_go(self) -> Optional[int]:
-        """Time to go in seconds.
-
-        https://github.com/openzfs/zfs/blob/cdf89f413c72fb17107a2b830a86161a21c74f82/cmd/zpool/zpool_main.c#L10229"""
-        match = re.search(r"(\d+)h(\d+)m to go\n", self.__zpool_status_output)
-        if match is None:
-            return None
-        return (int(match[1]) * 60 + int(match[2])) * 60
+        """Time to go in seconds."""
+        return self.record.time_to_go
 
     @property
     def last_scrub(self) -> Optional[datetime]:
-        match = re.search(
-            r"(canceled on|in progress since|errors on) (.*)\n",
-            self.__zpool_status_output,
-        )
-        if match is None:
-            return None
+        return self.record.last_scrub
+
+    @property
+    def scanned(self) -> Optional[int]:
+        """Bytes scanned so far."""
+        return self.record.scanned
 
-        return datetime.strptime(match[2], "%c")
+    @property
+    def issued(self) -> Optional[int]:
+        """Bytes issued so far."""
+        return self.record.issued
+
+    @property
+    def total(self) -> Optional[int]:
+        """Bytes to scrub in total."""
+        return self.record.total
+
+    @property
+    def repaired(self) -> Optional[int]:
+        """Bytes repaired."""
+        return self.record.repaired
+
+    @property
+    def issue_speed(self) -> Optional[float]:
+        """MB per second issued."""
+        return self.record.issue_speed
+
+    @property
+    def paused(self) -> Optional[bool]:
+        return self.record.paused
 
     @property
     def last_scrub_timespan(self) -> Optional[int]:
         """Time interval in seconds for last scrub."""
-        if self.last_scrub is not None:
-            return round(datetime.now().timestamp() - self.last_scrub.timestamp())
+        last_scrub = self.record.last_scrub
+        if last_scrub is not None:
+            return round(datetime.now().timestamp() - last_scrub.timestamp())
+        return None
+
+
+def _probe_pools(
+    pool: Optional[str] = None, timeout: Optional[float] = None, vdevs: bool = False
+) -> dict[str, PoolScrubStatus]:
+    """Probe one pool or all pools with a single ``zpool status`` call.
+
+    The JSON output is used if the installed ``zpool`` supports it, otherwise
+    the human-readable output is scraped.
+
+    :param timeout: Kill ``zpool`` after so many seconds and raise
+      :class:`subprocess.TimeoutExpired`.
+    :param vdevs: Also read the vdev trees from the same output.
+
+    :return: The scrub status of each pool, with the pool names as keys."""
+    pools = _zpool_status_json(pool, timeout, vdevs)
+    if pools is not None:
+        begin: float = time.monotonic()
+        if vdevs:
+            from check_zpool_scrub.vdevs import VdevTree
+        statuses = {
+            name: PoolScrubStatus(
+                name,
+                record=_parse_scan_stats(data.get("scan_stats")),
+                vdevs=VdevTree.from_json(data) if vdevs else None,
+            )
+            for name, data in pools.items()
+        }
+        _add_timing("parse_seconds", time.monotonic() - begin)
+        return statuses
+    trees: Optional[dict[str, VdevTree]] = {} if vdevs else None
+    records = _zpool_status_stream(pool, timeout, trees)
+    return {
+        name: PoolScrubStatus(
+            name, record=record, vdevs=None if trees is None else trees.get(name)
+        )
+        for name, record in records.items()
+    }
+
+
+_PROBE_ERRORS: tuple[type[Exception], ...] = (
+    subprocess.SubprocessError,
+    OSError,
+    ValueError,
+    CheckError,
+)
+"""The errors of probing the pools: ``zpool`` fails, hangs or is missing,
+its output cannot be parsed or a pool is unknown."""
+
+
+def _probe_pools_concurrently(
+    pools: list[str],
+    pool_timeout: float,
+    jobs: int,
+    deadline: Optional[float] = None,
+    vdevs: bool = False,
+) -> dict[str, typing.Union[PoolScrubStatus, str]]:
+    """Probe each pool with its own ``zpool status POOL`` call in a pool of
+    daemon threads.
+
+    ``zpool status`` can block indefinitely on a suspended or faulted pool.
+    Such a pool is isolated: its ``zpool`` process is killed after
+    ``pool_timeout`` seconds while the other pools are probed as usual.
+
+    :param jobs: The maximum number of ``zpool`` processes running at the same
+      time.
+    :param deadline: The overall time budget as a value of
+      :func:`time.monotonic`. No pool is probed beyond this point in time.
+    :param vdevs: Also read the vdev trees.
+
+    :return: The scrub status or an error message of each pool."""
+
+    def probe(pool: str) -> PoolScrubStatus:
+        timeout: float = pool_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise subprocess.TimeoutExpired(["zpool", "status", pool], 0)
+        return _probe_pools(pool, timeout, vdevs)[pool]
+
+    todo: queue.Queue[str] = queue.Queue()
+    for pool in pools:
+        todo.put(pool)
+    finished: queue.Queue[tuple[str, typing.Union[PoolScrubStatus, str]]] = (
+        queue.Queue()
+    )
+
+    def work() -> None:
+        while True:
+            try:
+                pool = todo.get_nowait()
+            except queue.Empty:
+                return
+            result: typing.Union[PoolScrubStatus, str]
+            try:
+                result = probe(pool)
+            except subprocess.TimeoutExpired as e:
+                result = f"no answer within {e.timeout:g}s"
+            except _PROBE_ERRORS as e:
+                result = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                # A bug, but the other pools are still reported.
+                log.exception("Probing the pool %s failed", pool)
+                result = f"{type(e).__name__}: {e}"
+            finished.put((pool, result))
+
+    # Daemon threads: the plugin exits at the deadline even if a ``zpool``
+    # process hangs in the kernel and keeps its output open after the kill.
+    for _ in range(min(jobs, len(pools))):
+        threading.Thread(target=work, daemon=True).start()
+
+    results: dict[str, typing.Union[PoolScrubStatus, str]] = {}
+    while len(results) < len(pools):
+        remaining: Optional[float] = None
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0)
+        try:
+            pool, result = finished.get(timeout=remaining)
+        except queue.Empty:
+            break
+        results[pool] = result
+    return {
+        pool: results.get(pool, "no answer within the overall timeout")
+        for pool in pools
+    }
+
+
+def _collect(
+    pool: Optional[str] = None, deadline: Optional[float] = None
+) -> dict[str, typing.Union[PoolScrubStatus, str]]:
+    """Probe one pool or all pools as specified by the command line options.
+
+    :param deadline: The overall time budget as a value of
+      :func:`time.monotonic`.
+
+    :return: The scrub status or an error message of each pool."""
+
+    def remaining(timeout: Optional[float] = None) -> Optional[float]:
+        if deadline is None:
+            return timeout
+        left = deadline - time.monotonic()
+        return left if timeout is None else min(timeout, left)
+
+    if pool is None and opts.pool_timeout is not None:
+        return _probe_pools_concurrently(
+            _discover_pools(remaining()),
+            opts.pool_timeout,
+            opts.jobs,
+            deadline,
+            opts.vdevs,
+        )
+    # A single ``zpool status`` call covers all pools (or the given pool), so
+    # there is no need to fork ``zpool list`` and one ``zpool status`` per
+    # pool.
+    if pool is None:
+        return dict(_probe_pools(timeout=remaining(), vdevs=opts.vdevs))
+    statuses: dict[str, PoolScrubStatus] = {}
+    try:
+        statuses = _probe_pools(pool, remaining(opts.pool_timeout), opts.vdevs)
+    except subprocess.CalledProcessError:
+        pass
+    if pool not in statuses:
+        # Only in this error case the list of pools is needed.
+        _raise_unknown_pool(pool, _discover_pools(remaining()))
+    return dict(statuses)
+
+
+def _raise_unknown_pool(pool: str, pools: typing.Iterable[str]) -> typing.NoReturn:
+    formatted_pools = map(lambda pool: f"'{pool}'", pools)
+    raise ValueError(
+        f"Unknown pool '{pool}'. Available pools: {', '.join(formatted_pools)}"
+    )
+
+
+_CACHE_TTL_SCRUBBING: float = 60
+"""The maximum time to live in seconds of a cache entry while a scrub is in
+progress, so that the progress and the time to go stay fresh."""
+
+_JSON_SUPPORT_KEY: str = "zpool -j"
+"""The entry of the cache file that remembers whether the installed ``zpool``
+supports the JSON output. It is not a valid pool name."""
+
+
+def _zpool_stamp() -> Optional[list[typing.Any]]:
+    """The path and the modification time of the installed ``zpool`` command,
+    which change on an upgrade of OpenZFS."""
+    path: Optional[str] = shutil.which("zpool")
+    if path is None:
         return None
+    return [path, _mtime(path)]
+
+
+def _load_json_support(cookie: Cookie, stamp: list[typing.Any]) -> None:
+    """Take the JSON support detected by an earlier run, unless ``zpool`` has
+    been upgraded since."""
+    global _zpool_status_json_supported
+    support: Optional[dict[str, typing.Any]] = cookie.get(_JSON_SUPPORT_KEY)
+    if (
+        _zpool_status_json_supported is None
+        and support is not None
+        and support["stamp"] == stamp
+    ):
+        _zpool_status_json_supported = support["supported"]
+
+
+def _store_json_support(cookie: Cookie, stamp: list[typing.Any]) -> None:
+    if _zpool_status_json_supported is not None:
+        cookie[_JSON_SUPPORT_KEY] = {
+            "stamp": stamp,
+            "supported": _zpool_status_json_supported,
+        }
+
+
+def _run_file(filename: str) -> str:
+    """A per-host file in the runtime directory of the systemd service
+    (``RUNTIME_DIRECTORY``), under ``/run`` (a tmpfs) or, if ``/run`` is not
+    writable, in the temporary directory."""
+    directory = os.environ.get("RUNTIME_DIRECTORY")
+    if not directory:
+        directory = "/run" if os.access("/run", os.W_OK) else tempfile.gettempdir()
+    return os.path.join(directory, filename)
+
+
+def _dump_record(record: ScrubRecord) -> dict[str, typing.Any]:
+    data = {field.name: getattr(record, field.name) for field in fields(record)}
+    if record.last_scrub is not None:
+        data["last_scrub"] = record.last_scrub.timestamp()
+    return data
+
+
+def _load_record(data: dict[str, typing.Any], age: float) -> ScrubRecord:
+    """
+    :param age: The age of the cache entry in seconds. The time to go is
+      reduced by the age."""
+    values = {
+        field.name: data[field.name]
+        for field in fields(ScrubRecord)
+        if data.get(field.name) is not None
+    }
+    if "time_to_go" in values:
+        values["time_to_go"] = max(round(values["time_to_go"] - age), 0)
+    if "last_scrub" in values:
+        values["last_scrub"] = datetime.fromtimestamp(values["last_scrub"])
+    return ScrubRecord(**values)
+
+
+def _dump_status(status: PoolScrubStatus) -> dict[str, typing.Any]:
+    """The scrub values and, with ``--vdevs``, the vdev tree of a pool."""
+    data = _dump_record(status.record)
+    if status.vdevs is not None:
+        data["vdevs"] = status.vdevs.dump()
+    return data
+
+
+def _load_status(
+    pool: str, data: dict[str, typing.Any], probed_at: float, now: float
+) -> PoolScrubStatus:
+    """
+    :param probed_at: When the status was probed.
+    :param now: The current time."""
+    vdevs: Optional[VdevTree] = None
+    if "vdevs" in data:
+        from check_zpool_scrub.vdevs import VdevTree
+
+        vdevs = VdevTree.load(data["vdevs"])
+    return PoolScrubStatus(
+        pool,
+        record=_load_record(data, now - probed_at),
+        vdevs=vdevs,
+        probed_at=datetime.fromtimestamp(probed_at),
+    )
+
+
+def _probe_pools_cached(
+    cache_file: str,
+    ttl: float,
+    key: str,
+    probe: typing.Callable[[], dict[str, typing.Union[PoolScrubStatus, str]]],
+) -> dict[str, typing.Union[PoolScrubStatus, str]]:
+    """Serve the scrub status from a cache file that is shared by all
+    invocations on the host.
+
+    The cache file is locked exclusively while it is read and refreshed (see
+    :class:`mplugin.Cookie`). Concurrent invocations wait for the lock, so
+    only the first one runs ``zpool`` on an expired entry and the others read
+    the refreshed entry.
+
+    :param ttl: The time to live of an entry in seconds. It shrinks to
+      :data:`_CACHE_TTL_SCRUBBING` while a scrub is in progress.
+    :param key: The entry in the cache file, for example the name of the pool
+      or an empty string for all pools.
+    :param probe: Probes the pools if the entry is missing or expired.
+      Results with errors are not cached. The pools are also probed if the
+      cache file cannot be read or written, for example if it is corrupt.
+
+    Whether ``zpool`` supports the JSON output is also kept in the cache file,
+    with the path and the modification time of ``zpool`` as a stamp, so an
+    older ``zpool`` is not run twice on each cache miss."""
+    results: Optional[dict[str, typing.Union[PoolScrubStatus, str]]] = None
+    probed: bool = False
+    try:
+        with Cookie(cache_file) as cookie:
+            now: float = datetime.now().timestamp()
+            entry: Optional[dict[str, typing.Any]] = cookie.get(key)
+            if entry is not None:
+                age: float = now - entry["time"]
+                pools: dict[str, dict[str, typing.Any]] = entry["pools"]
+                if any(data["progress"] is not None for data in pools.values()):
+                    ttl = min(ttl, _CACHE_TTL_SCRUBBING)
+                if 0 <= age < ttl:
+                    log.debug("Cache hit for %r, age %.0fs", key, age)
+                    return {
+                        pool: _load_status(pool, data, entry["time"], now)
+                        for pool, data in pools.items()
+                    }
+            # Spare the detection of the JSON support on each run.
+            stamp = _zpool_stamp()
+            if stamp is not None:
+                _load_json_support(cookie, stamp)
+            probed = True
+            results = probe()
+            if stamp is not None:
+                _store_json_support(cookie, stamp)
+            if all(isinstance(result, PoolScrubStatus) for result in results.values()):
+                cookie[key] = {
+                    "time": now,
+                    "pools": {
+                        pool: _dump_status(typing.cast(PoolScrubStatus, result))
+                        for pool, result in results.items()
+                    },
+                }
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if probed and results is None:
+            # Raised by the probe, not by the cache.
+            raise
+        log.warning("The cache file %s is not usable: %s", cache_file, e)
+    return probe() if results is None else results
+
+
+def _probe_pools_uncached(
+    cache_file: str,
+    probe: typing.Callable[[], dict[str, typing.Union[PoolScrubStatus, str]]],
+) -> dict[str, typing.Union[PoolScrubStatus, str]]:
+    """Probe the pools without ``--cache-ttl``. Only whether ``zpool``
+    supports the JSON output is kept in the cache file (see
+    :func:`_probe_pools_cached`), so an older ``zpool`` is not run twice on
+    each check.
+
+    The cache file is locked only to read and to store the detected support,
+    not while the pools are probed."""
+    stamp = _zpool_stamp()
+    if stamp is None:
+        return probe()
+    try:
+        with Cookie(cache_file) as cookie:
+            _load_json_support(cookie, stamp)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        log.warning("The cache file %s is not usable: %s", cache_file, e)
+        return probe()
+    detected: bool = _zpool_status_json_supported is not None
+    results = probe()
+    if not detected and _zpool_status_json_supported is not None:
+        try:
+            with Cookie(cache_file) as cookie:
+                _store_json_support(cookie, stamp)
+        except (OSError, ValueError) as e:
+            log.warning("The cache file %s is not usable: %s", cache_file, e)
+    return results
 
 
 class PoolResource(Resource):
     pool: str
 
-    def __init__(self, pool: str) -> None:
+    status: Optional[PoolScrubStatus]
+
+    error: Optional[str]
+
+    trend: Optional[Trend]
+
+    iostat: Optional[IostatRecord]
+
+    durations: Optional[ScrubDurations]
+
+    def __init__(
+        self,
+        pool: str,
+        status: Optional[PoolScrubStatus] = None,
+        error: Optional[str] = None,
+        trend: Optional[Trend] = None,
+        iostat: Optional[IostatRecord] = None,
+        durations: Optional[ScrubDurations] = None,
+    ) -> None:
+        """
+        :param status: The already probed scrub status of the pool.
+        :param error: The pool could not be probed, it is reported as
+          UNKNOWN.
+        :param trend: Derived from the scrub history of the pool, see
+          ``--history-dir``.
+        :param iostat: The I/O load of the pool, see ``--iostat``.
+        :param durations: The durations of the past scrubs, see
+          ``--durations-dir``."""
         self.pool = pool
+        self.status = status
+        self.error = error
+        self.trend = trend
+        self.iostat = iostat
+        self.durations = durations
 
     def probe(self) -> typing.Generator[Metric, typing.Any, None]:
-        status = PoolScrubStatus(self.pool)
+        if self.error is not None:
+            raise CheckError(f"Pool “{self.pool}”: {self.error}")
+        status = self.status
+        if status is None:
+            status = _probe_pools(self.pool)[self.pool]
         yield Metric(f"{self.pool}: progress", status.progress, context="progress")
         yield Metric(f"{self.pool}: speed", status.speed, context="speed")
         yield Metric(
@@ -146,6 +1307,64 @@ class PoolResource(Resource):
             status.last_scrub_timespan,
             context="last_scrub_timespan",
         )
+        if self.durations is not None:
+            for name, value in (
+                ("last_scrub_duration", self.durations.last),
+                ("mean_scrub_duration", self.durations.mean),
+                ("scrub_interval", self.durations.interval),
+            ):
+                yield Metric(f"{self.pool}: {name}", value, context=name)
+        yield Metric(
+            f"{self.pool}: issue_speed", status.issue_speed, context="issue_speed"
+        )
+        for counter in ("scanned", "issued", "total", "repaired"):
+            yield Metric(
+                f"{self.pool}: {counter}", getattr(status, counter), context=counter
+            )
+        if self.trend is not None:
+            for name in ("measured_speed", "smoothed_time_to_go", "speed_ratio"):
+                yield Metric(
+                    f"{self.pool}: {name}", getattr(self.trend, name), context=name
+                )
+        if status.vdevs is not None:
+            read, write, checksum = status.vdevs.errors()
+            yield Metric(f"{self.pool}: read_errors", read, context="read_errors")
+            yield Metric(f"{self.pool}: write_errors", write, context="write_errors")
+            yield Metric(
+                f"{self.pool}: checksum_errors", checksum, context="checksum_errors"
+            )
+            yield Metric(
+                f"{self.pool}: vdev_state", status.vdevs.worst(), context="vdev_state"
+            )
+        if self.iostat is not None:
+            for field in fields(self.iostat):
+                yield Metric(
+                    f"{self.pool}: {field.name}",
+                    getattr(self.iostat, field.name),
+                    context=field.name,
+                )
+
+
+class SelfTimingResource(Resource):
+    """The durations of the phases of the check itself, see
+    ``--self-timing``."""
+
+    begin: float
+
+    def __init__(self, begin: float) -> None:
+        """
+        :param begin: The start of the check as a value of
+          :func:`time.monotonic`."""
+        self.begin = begin
+
+    def probe(self) -> typing.Generator[Metric, typing.Any, None]:
+        for label, seconds in sorted((_timings or {}).items()):
+            yield Metric(label, round(seconds, 6), context="self_timing")
+        yield Metric(
+            "check_duration",
+            round(time.monotonic() - self.begin, 6),
+            context="self_timing",
+        )
 
 
 class ProgressContext(Context):
@@ -159,8 +1378,8 @@ class ProgressContext(Context):
 
 
 class SpeedContext(Context):
-    def __init__(self) -> None:
-        super().__init__("speed")
+    def __init__(self, name: str = "speed") -> None:
+        super().__init__(name)
 
     def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
         if metric.value is None:
@@ -168,6 +1387,16 @@ class SpeedContext(Context):
         return Performance(label=metric.name, value=metric.value, uom="m/s")
 
 
+class BytesContext(Context):
+    """The byte counters of a scrub: ``scanned``, ``issued``, ``total`` and
+    ``repaired``."""
+
+    def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
+        if metric.value is None:
+            return None
+        return Performance(label=metric.name, value=metric.value, uom="B")
+
+
 class TimeToGoContext(Context):
     def __init__(self) -> None:
         super().__init__("time_to_go")
@@ -178,6 +1407,110 @@ class TimeToGoContext(Context):
         return Performance(label=metric.name, value=metric.value, uom="s")
 
 
+class DurationContext(Context):
+    """A duration in seconds without thresholds, for example the duration of
+    the last scrub or the run time of the check itself."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+
+    def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
+        if metric.value is None:
+            return None
+        return Performance(label=metric.name, value=metric.value, uom="s")
+
+
+class IostatContext(Context):
+    """The I/O load from ``zpool iostat``: operations per second, bytes per
+    second and latencies in seconds."""
+
+    uom: Optional[str]
+
+    def __init__(self, name: str, uom: Optional[str] = None) -> None:
+        super().__init__(name)
+        self.uom = uom
+
+    def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
+        if metric.value is None:
+            return None
+        return Performance(label=metric.name, value=metric.value, uom=self.uom)
+
+
+class SpeedRatioContext(Context):
+    """Warn if the scrub in progress is much slower than the past scrubs."""
+
+    def __init__(self) -> None:
+        super().__init__("speed_ratio")
+
+    def evaluate(self, metric: Metric, resource: Resource) -> Result:
+        r = cast(PoolResource, resource)
+
+        if metric.value is not None and metric.value < opts.slowdown:
+            return self.warning(
+                metric=metric,
+                hint=f"Pool “{r.pool}”: The scrub runs at {metric.value:g} times "
+                f"the speed of the past scrubs (< {opts.slowdown:g})",
+            )
+
+        return self.ok(metric=metric)
+
+    def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
+        if metric.value is None:
+            return None
+        return Performance(label=metric.name, value=metric.value)
+
+
+class VdevErrorsContext(Context):
+    """Warn if the devices of a pool have read, write or checksum errors, for
+    example found by a scrub."""
+
+    def evaluate(self, metric: Metric, resource: Resource) -> Result:
+        r = cast(PoolResource, resource)
+
+        if metric.value:
+            return self.warning(
+                metric=metric,
+                hint=f"Pool “{r.pool}”: {metric.value} "
+                f"{self.name.replace('_', ' ')} of the devices",
+            )
+
+        return self.ok(metric=metric)
+
+    def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
+        return Performance(label=metric.name, value=metric.value)
+
+
+class VdevStateContext(Context):
+    """Evaluate the worst state of the vdevs of a pool. The value of the
+    metric is the code of the state and the name of the vdev."""
+
+    def __init__(self) -> None:
+        super().__init__("vdev_state")
+
+    def evaluate(self, metric: Metric, resource: Resource) -> Result:
+        r = cast(PoolResource, resource)
+
+        if metric.value is None:
+            return self.ok(metric=metric)
+
+        from check_zpool_scrub.vdevs import VDEV_STATES
+
+        code, vdev = metric.value
+        state = VDEV_STATES[code]
+        hint = f"Pool “{r.pool}”: vdev “{vdev}” is {state}"
+        if state in ("UNAVAIL", "FAULTED"):
+            return self.critical(metric=metric, hint=hint)
+        if state in ("OFFLINE", "DEGRADED", "REMOVED"):
+            return self.warning(metric=metric, hint=hint)
+
+        return self.ok(metric=metric)
+
+    def performance(self, metric: Metric, resource: Resource) -> Optional[Performance]:
+        if metric.value is None:
+            return None
+        return Performance(label=metric.name, value=metric.value[0])
+
+
 class LastScrubTimestampContext(Context):
     def __init__(self) -> None:
         super().__init__("last_scrub_timestamp")
@@ -221,32 +1554,194 @@ class LastScrubTimespanContext(Context):
         return Performance(label=metric.name, value=metric.value, uom="s")
 
 
+_EPILOG: str = (
+    "Performance data:\n"
+    "\n"
+    "POOL is the name of the pool\n"
+    "\n"
+    " - POOL_last_scrub\n"
+    "    Time interval in seconds for last scrub.\n"
+    " - POOL_progress\n"
+    "    Percent 0 - 100\n"
+    " - POOL_speed\n"
+    "    MB per second.\n"
+    " - POOL_time_to_go\n"
+    "    Time to go in seconds.\n"
+    " - POOL_issue_speed\n"
+    "    MB per second issued to the disks.\n"
+    " - POOL_scanned, POOL_issued, POOL_total\n"
+    "    Bytes scanned, issued and to scrub in total.\n"
+    " - POOL_repaired\n"
+    "    Bytes repaired.\n"
+    " - POOL_last_scrub_duration, POOL_mean_scrub_duration (with\n"
+    "   --durations-dir)\n"
+    "    Duration of the last and mean duration of the past scrubs in seconds.\n"
+    " - POOL_scrub_interval (with --durations-dir)\n"
+    "    Mean time between the starts of the past scrubs in seconds.\n"
+    " - POOL_measured_speed (with --history-dir)\n"
+    "    MB per second issued since the previous check.\n"
+    " - POOL_smoothed_time_to_go (with --history-dir)\n"
+    "    Time to go in seconds, extrapolated from the last 6 hours.\n"
+    " - POOL_speed_ratio (with --history-dir)\n"
+    "    Speed of the scrub relative to the past scrubs.\n"
+    " - POOL_read_ops, POOL_write_ops (with --iostat)\n"
+    "    Operations per second.\n"
+    " - POOL_read_bandwidth, POOL_write_bandwidth (with --iostat)\n"
+    "    Bytes per second.\n"
+    " - POOL_{total,disk,syncq,asyncq}_wait_{read,write}, POOL_scrub_wait\n"
+    "   (with --iostat)\n"
+    "    Average latencies in seconds.\n"
+    " - argparse_seconds, zpool_list_seconds, [POOL_]zpool_exec_seconds,\n"
+    "   parse_seconds, check_duration (with --self-timing)\n"
+    "    Durations of the phases of the check in seconds.\n"
+    " - POOL_read_errors, POOL_write_errors, POOL_checksum_errors (with\n"
+    "   --vdevs)\n"
+    "    Errors of the devices from the config: section.\n"
+    " - POOL_vdev_state (with --vdevs)\n"
+    "    The worst state of the vdevs: 0 ONLINE, 1 AVAIL, 2 INUSE, 3 OFFLINE,\n"
+    "    4 DEGRADED, 5 REMOVED, 6 UNAVAIL, 7 FAULTED.\n"
+    "\n"
+    "Set the environment variable CHECK_ZPOOL_SCRUB_PROFILE=PATH to write a\n"
+    "cProfile and tracemalloc report of the run to PATH.\n"
+    "\n"
+    "Details about the implementation of this monitoring plugin:\n"
+    "\n"
+    "This monitoring plugin grabs the last scrub date from the command\n"
+    "'zpool status POOL'.\n"
+)
+
+
+def _evaluate(resource: PoolResource) -> tuple[int, str, list[str]]:
+    """Evaluate a single pool with the contexts of :func:`main`.
+
+    :return: The exit status, the status line and the performance data."""
+    check = Check(*_contexts(), resource)
+    check.name = "zpool_scrub"
+    check()
+    summary = check.summary_str.strip()
+    output = f"{check.name.upper()} {str(check.state).upper()}"
+    if summary:
+        output += f" - {summary}"
+    return check.exitcode, output, check.perfdata
+
+
+def _expand_deferred(text: str) -> str:
+    """Replace the placeholders of :func:`get_argparser` by the texts that
+    are only needed if the help or the version is printed."""
+    if "@VERSION@" in text:
+        text = text.replace("@VERSION@", __getattr__("__version__"))
+    if "@YEAR@" in text:
+        text = text.replace("@YEAR@", str(datetime.now().year))
+    if "@EPILOG@" in text:
+        from mplugin.timespan import TIMESPAN_FORMAT_HELP
+
+        text = text.replace("@EPILOG@", _EPILOG + TIMESPAN_FORMAT_HELP)
+    return text
+
+
+class _DeferredVersionAction(argparse._VersionAction):
+    def __call__(
+        self,
+        parser: argparse.ArgumentParser,
+        namespace: argparse.Namespace,
+        values: typing.Any,
+        option_string: Optional[str] = None,
+    ) -> None:
+        if self.version is not None:
+            self.version = _expand_deferred(self.version)
+        super().__call__(parser, namespace, values, option_string)
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    """Like the parser of :func:`mplugin.cli.setup_argparser`, but the
+    placeholders of the description and the epilog are only filled in if the
+    help is printed."""
+
+    def exit(self, status: int = 3, message: Optional[str] = None) -> typing.NoReturn:
+        # Exit with Unknown after --help and --version according to the
+        # Monitoring Plugin Guidelines.
+        super().exit(status, message)
+
+    def format_help(self) -> str:
+        if self.description is not None:
+            self.description = _expand_deferred(self.description)
+        if self.epilog is not None:
+            self.epilog = _expand_deferred(self.epilog)
+        return super().format_help()
+
+
+def _contexts() -> list[Context]:
+    return [
+        ProgressContext(),
+        SpeedContext(),
+        SpeedContext("issue_speed"),
+        TimeToGoContext(),
+        LastScrubTimestampContext(),
+        LastScrubTimespanContext(),
+        DurationContext("last_scrub_duration"),
+        DurationContext("mean_scrub_duration"),
+        DurationContext("scrub_interval"),
+        BytesContext("scanned"),
+        BytesContext("issued"),
+        BytesContext("total"),
+        BytesContext("repaired"),
+        SpeedContext("measured_speed"),
+        DurationContext("smoothed_time_to_go"),
+        SpeedRatioContext(),
+        IostatContext("read_ops"),
+        IostatContext("write_ops"),
+        IostatContext("read_bandwidth", "B"),
+        IostatContext("write_bandwidth", "B"),
+        *(
+            IostatContext(f"{queue}_wait_{direction}", "s")
+            for queue in ("total", "disk", "syncq", "asyncq")
+            for direction in ("read", "write")
+        ),
+        IostatContext("scrub_wait", "s"),
+        DurationContext("self_timing"),
+        VdevErrorsContext("read_errors"),
+        VdevErrorsContext("write_errors"),
+        VdevErrorsContext("checksum_errors"),
+        VdevStateContext(),
+    ]
+
+
 def get_argparser() -> argparse.ArgumentParser:
-    parser: argparse.ArgumentParser = setup_argparser(
-        name="zpool_scrub",
-        version=__version__,
-        license="MIT",
-        repository="https://github.com/Josef-Friedrich/check_zpool_scrub",
-        copyright=f"Copyright (c) 2016-{datetime.now().year} Josef Friedrich <josef@friedrich.rocks>",
-        description="Monitoring plugin to check how long ago the last ZFS scrub was performed.",
-        epilog="Performance data:\n"
-        "\n"
-        "POOL is the name of the pool\n"
-        "\n"
-        " - POOL_last_scrub\n"
-        "    Time interval in seconds for last scrub.\n"
-        " - POOL_progress\n"
-        "    Percent 0 - 100\n"
-        " - POOL_speed\n"
-        "    MB per second.\n"
-        " - POOL_time_to_go\n"
-        "    Time to go in seconds.\n"
-        "\n"
-        "Details about the implementation of this monitoring plugin:\n"
-        "\n"
-        "This monitoring plugin grabs the last scrub date from the command\n"
-        "'zpool status POOL'.\n" + TIMESPAN_FORMAT_HELP,
-        verbose=True,
+    from mplugin.timespan import convert_timespan_to_sec
+
+    # The version, the copyright year and the long epilog are filled in only
+    # if the help or the version is printed, see _expand_deferred().
+    parser = _ArgumentParser(
+        prog="check_zpool_scrub",
+        formatter_class=lambda prog: argparse.RawDescriptionHelpFormatter(
+            prog, width=80
+        ),
+        description="\n".join(
+            [
+                "version @VERSION@",
+                "Licensed under the MIT.",
+                "Repository: https://github.com/Josef-Friedrich/check_zpool_scrub.",
+                "Copyright (c) 2016-@YEAR@ Josef Friedrich <josef@friedrich.rocks>",
+                "",
+                "Monitoring plugin to check how long ago the last ZFS scrub was performed.",
+            ]
+        ),
+        epilog="@EPILOG@",
+    )
+
+    parser.add_argument(
+        "-V",
+        "--version",
+        action=_DeferredVersionAction,
+        version="%(prog)s @VERSION@",
+    )
+
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Increase the output verbosity.",
     )
 
     parser.add_argument(
@@ -275,6 +1770,365 @@ def get_argparser() -> argparse.ArgumentParser:
         type=convert_timespan_to_sec,
     )
 
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        metavar="SECONDS",
+        type=float,
+        default=50,
+        help="Overall time budget in seconds. A zpool command that takes "
+        "longer is killed. The default stays below the usual timeout of 60 "
+        "seconds of the monitoring systems (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--pool-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="Probe each pool with its own 'zpool status POOL' call in "
+        "parallel and kill the call after so many seconds. A pool that does "
+        "not answer in time is reported as UNKNOWN, the other pools are "
+        "checked as usual.",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        metavar="NUMBER",
+        type=int,
+        default=8,
+        help="The maximum number of pools that are probed in parallel if "
+        "--pool-timeout is specified and the number of processes of "
+        "--analyze (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="SECONDS",
+        type=float,
+        help="Serve the scrub status from a cache file shared by all "
+        "invocations on the host if it is not older than so many seconds. "
+        f"While a scrub is in progress, at most {_CACHE_TTL_SCRUBBING:g} "
+        "seconds are used.",
+    )
+
+    parser.add_argument(
+        "--cache-file",
+        metavar="PATH",
+        help="The cache file for --cache-ttl. Without --cache-ttl it only "
+        "keeps whether zpool supports the JSON output (default: "
+        "check_zpool_scrub.json in $RUNTIME_DIRECTORY, in /run or, if /run is "
+        "not writable, in the temporary directory).",
+    )
+
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run as a daemon that keeps the scrub status of all pools in "
+        "memory, refreshes it every --interval seconds and serves it on the "
+        "Unix socket --socket.",
+    )
+
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="The Unix socket of the daemon (default: "
+        "check_zpool_scrub.sock in $RUNTIME_DIRECTORY, in /run or, if /run is "
+        "not writable, in the temporary directory). Without --daemon the scrub status is "
+        "fetched from the daemon listening on this socket. If the daemon "
+        "does not answer, the pools are probed directly.",
+    )
+
+    def parse_mode(value: str) -> int:
+        return int(value, 8)
+
+    parser.add_argument(
+        "--socket-mode",
+        metavar="MODE",
+        type=parse_mode,
+        default=0o666,
+        help="The permissions of the socket of the daemon as an octal number, "
+        "for example 660 together with --socket-group (default: 666).",
+    )
+
+    parser.add_argument(
+        "--socket-group",
+        metavar="GROUP",
+        help="The group of the socket of the daemon, for example the group of "
+        "the user of the monitoring system.",
+    )
+
+    parser.add_argument(
+        "--interval",
+        metavar="SECONDS",
+        type=float,
+        default=300,
+        help="The refresh interval of the daemon in seconds (default: "
+        f"%(default)s). While a scrub is in progress, at most "
+        f"{_CACHE_TTL_SCRUBBING:g} seconds are used.",
+    )
+
+    parser.add_argument(
+        "--events",
+        action="store_true",
+        help="Follow 'zpool events -f' in the daemon and refresh a pool as soon "
+        "as a scrub or a resilver starts, pauses or ends or the pool is "
+        "imported or exported. A long --interval is sufficient then.",
+    )
+
+    parser.add_argument(
+        "--exporter-port",
+        metavar="PORT",
+        type=int,
+        help="Run as a Prometheus exporter that serves the metrics of all "
+        "pools as gauges with the pool as label on http://ADDRESS:PORT/metrics. "
+        "The metrics are refreshed every --interval seconds in the "
+        "background.",
+    )
+
+    parser.add_argument(
+        "--exporter-address",
+        metavar="ADDRESS",
+        default="",
+        help="The address the Prometheus exporter listens on (default: all addresses).",
+    )
+
+    parser.add_argument(
+        "--textfile",
+        metavar="PATH",
+        help="Write the Prometheus metrics of all pools atomically to a file "
+        "for the textfile collector of the node_exporter and exit. Combined "
+        "with --daemon or --exporter-port, the file is rewritten after each "
+        "refresh.",
+    )
+
+    parser.add_argument(
+        "--history-dir",
+        metavar="PATH",
+        help="Keep a history of the scrubs in progress in this directory, one "
+        "file of constant size per pool. The history adds the measured speed, a "
+        "smoothed time to go and the speed relative to the past scrubs.",
+    )
+
+    parser.add_argument(
+        "--history-size",
+        metavar="SAMPLES",
+        type=int,
+        default=1024,
+        help="The number of samples a new history file holds, the oldest "
+        "samples are overwritten (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--slowdown",
+        metavar="RATIO",
+        type=float,
+        default=0.5,
+        help="Warn if the scrub in progress runs slower than RATIO times the "
+        "median speed of the past scrubs in the history (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--iostat",
+        metavar="SECONDS",
+        type=float,
+        help="Measure the I/O load of the pools with 'zpool iostat' over SECONDS "
+        "while the scrub status is probed. Adds the operations, the bandwidth "
+        "and the latencies of each pool to the performance data.",
+    )
+
+    parser.add_argument(
+        "--orchestrate",
+        action="store_true",
+        help="Start the scrubs of the pools whose last scrub is older than "
+        "--due, the pool closest to -w first. At most --max-scrubs scrubs run "
+        "at the same time, at most one per contention domain. The next scrub "
+        "is started as soon as one finishes (checked every --interval "
+        "seconds). Exits after the last scrub is started.",
+    )
+
+    parser.add_argument(
+        "--max-scrubs",
+        metavar="K",
+        type=int,
+        default=1,
+        help="The maximum number of scrubs running at the same time with "
+        "--orchestrate (default: %(default)s).",
+    )
+
+    def parse_domain(value: str) -> tuple[str, str]:
+        from check_zpool_scrub.orchestrator import _parse_domain
+
+        return _parse_domain(value)
+
+    parser.add_argument(
+        "--domain",
+        metavar="PATTERN=DOMAIN",
+        action="append",
+        type=parse_domain,
+        help="Put the pools matching the shell pattern PATTERN in the "
+        "contention domain DOMAIN, for example a shared HBA or enclosure. Can "
+        "be specified multiple times, the first matching pattern wins. A pool "
+        "without a domain is a domain of its own.",
+    )
+
+    parser.add_argument(
+        "--due",
+        metavar="TIMESPAN",
+        type=convert_timespan_to_sec,
+        help="With --orchestrate: scrub the pools whose last scrub is older "
+        "(default: half of -w).",
+    )
+
+    parser.add_argument(
+        "--govern",
+        action="store_true",
+        help="Measure the latency of the pools with 'zpool iostat' every "
+        "--interval seconds and pause ('zpool scrub -p') a scrub whose pool "
+        "is slower than --max-latency. The scrub is resumed when the latency "
+        "drops to half of the limit, outside --pause-window or when it would "
+        "not finish before -c otherwise. Runs until it is terminated.",
+    )
+
+    parser.add_argument(
+        "--max-latency",
+        metavar="SECONDS",
+        type=float,
+        default=0.05,
+        help="The limit of the average read or write latency of a pool for "
+        "--govern (default: %(default)s).",
+    )
+
+    def parse_window(value: str) -> tuple[datetime_time, datetime_time]:
+        from check_zpool_scrub.governor import _parse_window
+
+        return _parse_window(value)
+
+    parser.add_argument(
+        "--pause-window",
+        metavar="HH:MM-HH:MM",
+        type=parse_window,
+        help="Pause scrubs with --govern only within this time of the day, "
+        "for example 08:00-18:00 (default: always).",
+    )
+
+    parser.add_argument(
+        "--icinga-url",
+        metavar="URL",
+        help="Submit the result of each pool as a passive check result to the "
+        "Icinga 2 API at URL (for example https://icinga.example.com:5665) "
+        "instead of printing a single result.",
+    )
+
+    parser.add_argument(
+        "--icinga-user",
+        metavar="USER",
+        default="root",
+        help="The API user, it needs the permission "
+        "actions/process-check-result (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--icinga-password",
+        metavar="PASSWORD",
+        help="The password of the API user (default: the environment variable "
+        "ICINGA_API_PASSWORD, which does not show up in the process list).",
+    )
+
+    parser.add_argument(
+        "--icinga-host",
+        metavar="NAME",
+        help="The name of the host object (default: the FQDN of this host).",
+    )
+
+    parser.add_argument(
+        "--icinga-service",
+        metavar="NAME",
+        default="zpool_scrub_{pool}",
+        help="The name of the service object of a pool, {pool} is replaced by "
+        "the name of the pool (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--icinga-ca",
+        metavar="PATH",
+        help="Verify the certificate of the API with this CA certificate, for "
+        "example /var/lib/icinga2/certs/ca.crt (default: the system's CA "
+        "certificates).",
+    )
+
+    parser.add_argument(
+        "--analyze",
+        metavar="PATH",
+        nargs="+",
+        help="Evaluate captured 'zpool status' or 'zpool status -j "
+        "--json-int' outputs with -w and -c instead of checking this host and "
+        "print one row per pool. PATH is a file, a directory, a tar archive "
+        "or - for the standard input, which may also be a tar stream.",
+    )
+
+    parser.add_argument(
+        "--analyze-format",
+        choices=("csv", "jsonl"),
+        default="csv",
+        help="The format of the rows of --analyze (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--self-timing",
+        action="store_true",
+        help="Add the durations of the phases of the check to the performance "
+        "data: argument parsing, 'zpool list', each 'zpool status' call, "
+        "parsing and the whole check up to the evaluation.",
+    )
+
+    parser.add_argument(
+        "--vdevs",
+        action="store_true",
+        help="Also read the vdevs of the config: section from the same "
+        "'zpool status' output and report the errors of the devices and the "
+        "worst state of the vdevs.",
+    )
+
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Block until the scrubs of the pool (or of all pools) have "
+        "finished with 'zpool wait -t scrub', then check as usual.",
+    )
+
+    parser.add_argument(
+        "--wait-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="Stop waiting after so many seconds (default: never).",
+    )
+
+    parser.add_argument(
+        "--progress-interval",
+        metavar="SECONDS",
+        type=float,
+        default=600,
+        help="Print the progress of the scrubs every so many seconds while "
+        "waiting, 0 for never (default: %(default)s).",
+    )
+
+    parser.add_argument(
+        "--durations-dir",
+        metavar="PATH",
+        help="Read the durations of the past scrubs from 'zpool history -il "
+        "POOL' and keep a checkpoint per pool in this directory, so only the "
+        "newer events are parsed on the next run.",
+    )
+
+    parser.add_argument(
+        "--checkmk",
+        action="store_true",
+        help="Print the results of the pool (or of all pools) as a section of "
+        "the Checkmk agent, one line per pool, instead of the check output. "
+        "With --cache-ttl, the section is marked as cached for the time to "
+        "live.",
+    )
+
     parser.add_argument(
         "-d",
         "--debug",
@@ -286,37 +2140,238 @@ def get_argparser() -> argparse.ArgumentParser:
     return parser
 
 
+def _record_history(status: PoolScrubStatus) -> Optional[Trend]:
+    """Append the scrub in progress to the history of the pool if
+    ``--history-dir`` is specified.
+
+    A history that cannot be written is logged and skipped, the check goes
+    on without the trend."""
+    if opts.history_dir is None or status.progress is None:
+        return None
+    if status.last_scrub is None:
+        return None
+    from check_zpool_scrub.history import Sample, record
+
+    issued = status.issued
+    if issued is None and status.total is not None:
+        issued = round(status.progress * status.total)
+    try:
+        return record(
+            opts.history_dir,
+            status.pool,
+            Sample(
+                start=round(status.last_scrub.timestamp()),
+                time=round(datetime.now().timestamp()),
+                progress=status.progress,
+                issued=issued or 0,
+            ),
+            opts.history_size,
+        )
+    except (OSError, ValueError) as e:
+        log.warning("The history of %s could not be recorded: %s", status.pool, e)
+        return None
+
+
+def _scrub_durations(
+    status: PoolScrubStatus, deadline: Optional[float] = None
+) -> Optional[ScrubDurations]:
+    """Read the durations of the past scrubs of the pool if
+    ``--durations-dir`` is specified."""
+    if opts.durations_dir is None:
+        return None
+    from check_zpool_scrub.durations import scrub_durations
+
+    timeout: Optional[float] = None
+    if deadline is not None:
+        timeout = max(deadline - time.monotonic(), 0)
+    try:
+        return scrub_durations(
+            opts.durations_dir,
+            status.pool,
+            timeout,
+            last_scrub=status.last_scrub,
+            scrubbing=status.progress is not None,
+        )
+    except subprocess.SubprocessError as e:
+        log.warning("The history of %s could not be read: %s", status.pool, e)
+        return None
+
+
 @guarded(verbose=0)
 def main() -> None:
-    global opts
+    global opts, _timings
+
+    begin: float = time.monotonic()
+    profile: Optional[str] = os.environ.get("CHECK_ZPOOL_SCRUB_PROFILE")
+    if profile:
+        from check_zpool_scrub.profiling import _start_profiler
+
+        _start_profiler(profile)
 
     opts = cast(OptionContainer, get_argparser().parse_args())
 
+    _timings = None
+    if opts.self_timing:
+        _timings = {"argparse_seconds": time.monotonic() - begin}
+
     if opts.warning > opts.critical:
         raise ValueError(
             f"-w SECONDS must be smaller than -c SECONDS. -w {opts.warning} > -c {opts.critical}"
         )
 
-    checks: list[typing.Union[Resource, Context]] = [
-        ProgressContext(),
-        SpeedContext(),
-        TimeToGoContext(),
-        LastScrubTimestampContext(),
-        LastScrubTimespanContext(),
-    ]
+    checks: list[typing.Union[Resource, Context]] = [*_contexts()]
+
+    if opts.analyze is not None:
+        from check_zpool_scrub.analyzer import _run_analyzer
+
+        counts = _run_analyzer(opts.analyze, opts.jobs, opts.analyze_format)
+        log.info("Analyzed pools per state: %s", counts)
+        return
 
-    pools = _list_pools()
+    if opts.daemon or opts.exporter_port is not None:
+        from check_zpool_scrub.daemon import _run_daemon
 
-    if opts.pool is not None:
-        if opts.pool not in pools:
-            formatted_pools = map(lambda pool: f"'{pool}'", pools)
+        _run_daemon(
+            opts.interval,
+            socket_path=opts.socket or _run_file("check_zpool_scrub.sock")
+            if opts.daemon
+            else None,
+            exporter_address=(opts.exporter_address, opts.exporter_port)
+            if opts.exporter_port is not None
+            else None,
+            textfile=opts.textfile,
+            events=opts.events,
+            socket_mode=opts.socket_mode,
+            socket_group=opts.socket_group,
+        )
+        return
+
+    if opts.govern:
+        from check_zpool_scrub.governor import Governor
+
+        Governor(opts.max_latency, opts.interval, opts.pause_window).run(
+            threading.Event()
+        )
+        return
+
+    if opts.orchestrate:
+        from check_zpool_scrub.orchestrator import _orchestrate
+
+        _orchestrate(
+            opts.max_scrubs,
+            opts.domain or [],
+            opts.due if opts.due is not None else opts.warning / 2,
+            opts.interval,
+        )
+        return
+
+    if opts.wait:
+        from check_zpool_scrub.wait import _wait
+
+        _wait(
+            [opts.pool] if opts.pool is not None else _discover_pools(),
+            opts.progress_interval,
+            opts.wait_timeout,
+        )
+
+    deadline: Optional[float] = None
+    if opts.timeout is not None:
+        deadline = time.monotonic() + opts.timeout
+
+    if opts.textfile is not None:
+        from check_zpool_scrub.daemon import _write_textfile
+
+        _write_textfile(opts.textfile, _collect(deadline=deadline))
+        return
+
+    iostat: Optional[Iostat] = None
+    if opts.iostat is not None:
+        from check_zpool_scrub.iostat import Iostat
+
+        iostat = Iostat(
+            opts.pool,
+            opts.iostat,
+            None if deadline is None else deadline - time.monotonic(),
+        )
+
+    results: Optional[dict[str, typing.Union[PoolScrubStatus, str]]] = None
+    if opts.socket is not None:
+        from check_zpool_scrub.daemon import _QUERY_TIMEOUT, _query_daemon
+
+        # A hung daemon must leave the time to probe the pools.
+        query_timeout: float = _QUERY_TIMEOUT
+        if deadline is not None:
+            query_timeout = min(query_timeout, (deadline - time.monotonic()) / 4)
+        results = _query_daemon(opts.socket, query_timeout, opts.vdevs)
+        if results is not None and opts.pool is not None:
+            if opts.pool not in results:
+                _raise_unknown_pool(opts.pool, results)
+            results = {opts.pool: results[opts.pool]}
+
+    cache_file: str = opts.cache_file or _run_file("check_zpool_scrub.json")
+    if results is None and opts.cache_ttl is not None:
+        results = _probe_pools_cached(
+            cache_file,
+            opts.cache_ttl,
+            # An entry without the vdev trees does not serve --vdevs.
+            (opts.pool or "") + (" --vdevs" if opts.vdevs else ""),
+            lambda: _collect(opts.pool, deadline),
+        )
+    elif results is None:
+        results = _probe_pools_uncached(
+            cache_file, lambda: _collect(opts.pool, deadline)
+        )
+
+    iostat_records: dict[str, IostatRecord] = {}
+    if iostat is not None:
+        iostat_records = iostat.result()
+
+    resources: list[PoolResource] = []
+    for pool, result in results.items():
+        if isinstance(result, PoolScrubStatus):
+            resources.append(
+                PoolResource(
+                    pool,
+                    result,
+                    trend=_record_history(result),
+                    iostat=iostat_records.get(pool),
+                    durations=_scrub_durations(result, deadline),
+                )
+            )
+        else:
+            resources.append(PoolResource(pool, error=result))
+
+    if opts.checkmk:
+        from check_zpool_scrub.checkmk import _format_section
+
+        print(_format_section(resources, opts.cache_ttl), end="")
+        return
+
+    if opts.icinga_url is not None:
+        from check_zpool_scrub.icinga import _submit
+
+        errors = _submit(
+            resources,
+            opts.icinga_url,
+            opts.icinga_user,
+            opts.icinga_password or os.environ.get("ICINGA_API_PASSWORD", ""),
+            host=opts.icinga_host,
+            service=opts.icinga_service,
+            ca_file=opts.icinga_ca,
+            timeout=opts.timeout,
+        )
+        if errors:
             raise ValueError(
-                f"Unknown pool '{opts.pool}'. Available pools: {', '.join(formatted_pools)}"
+                f"The Icinga 2 API did not accept {len(errors)} of "
+                f"{len(resources)} results: {'; '.join(errors)}"
             )
-        checks.append(PoolResource(opts.pool))
-    else:
-        for pool in pools:
-            checks.append(PoolResource(pool))
+        print(f"Submitted the results of {len(resources)} pools to {opts.icinga_url}")
+        return
+
+    checks.extend(resources)
+    if opts.self_timing:
+        # Probed last, so the evaluation of the pools is included.
+        checks.append(SelfTimingResource(begin))
 
     check: Check = Check(*checks)
     check.name = "zpool_scrub"
@@ -0,0 +1,227 @@
+"""Evaluate captured ``zpool status`` outputs offline, for example the outputs
+collected from a fleet of hosts, and stream one summary row per pool."""
+
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import typing
+from typing import Optional
+
+import check_zpool_scrub
+from check_zpool_scrub import (
+    OptionContainer,
+    PoolResource,
+    PoolScrubStatus,
+    ScrubRecord,
+    _evaluate,
+    _parse_scan_stats,
+    _scan_pools,
+)
+
+_FIELDS: tuple[str, ...] = (
+    "source",
+    "pool",
+    "state",
+    "exit_status",
+    "output",
+    "last_scrub",
+    "last_scrub_timespan",
+    "progress",
+    "speed",
+    "issue_speed",
+    "time_to_go",
+    "scanned",
+    "issued",
+    "total",
+    "repaired",
+)
+
+_STATES: tuple[str, ...] = ("ok", "warning", "critical", "unknown")
+
+_COMPRESSION_MAGIC: tuple[bytes, ...] = (b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")
+
+
+def _is_tar_stream(stream: typing.BinaryIO) -> bool:
+    """Whether a buffered stream holds a (compressed) tar archive, without
+    consuming it."""
+    head = typing.cast(io.BufferedReader, stream).peek(512)[:512]
+    return head.startswith(_COMPRESSION_MAGIC) or head[257:262] == b"ustar"
+
+
+def _read_tar(
+    source: str, archive: tarfile.TarFile
+) -> typing.Iterator[tuple[str, bytes]]:
+    """Read the regular files of an archive one after another, also from a
+    stream that cannot seek."""
+    for member in archive:
+        if not member.isfile():
+            continue
+        file = archive.extractfile(member)
+        if file is not None:
+            yield f"{source}:{member.name}", file.read()
+
+
+def _read_inputs(paths: typing.Iterable[str]) -> typing.Iterator[tuple[str, bytes]]:
+    """Read the captured outputs lazily.
+
+    :param paths: Files, directories (searched recursively), tar archives or
+      ``-`` for the standard input, which may also be a tar stream.
+
+    :return: The name of the source and the captured output of each file."""
+    for path in paths:
+        if path == "-":
+            stdin = typing.cast(io.BufferedReader, sys.stdin.buffer)
+            if not hasattr(stdin, "peek"):
+                stdin = io.BufferedReader(typing.cast(typing.Any, stdin))
+            if _is_tar_stream(stdin):
+                with tarfile.open(fileobj=stdin, mode="r|*") as archive:
+                    yield from _read_tar(path, archive)
+            else:
+                yield path, stdin.read()
+        elif os.path.isdir(path):
+            for directory, directories, files in os.walk(path):
+                directories.sort()
+                yield from _read_inputs(
+                    os.path.join(directory, file) for file in sorted(files)
+                )
+        elif tarfile.is_tarfile(path):
+            with tarfile.open(path, mode="r|*") as archive:
+                yield from _read_tar(path, archive)
+        else:
+            with open(path, "rb") as file:
+                yield path, file.read()
+
+
+def _parse_capture(data: bytes) -> dict[str, ScrubRecord]:
+    """Parse a captured ``zpool status`` or ``zpool status -j --json-int``
+    output of one or more pools."""
+    text = data.decode(errors="replace")
+    if text.lstrip().startswith("{"):
+        return {
+            name: _parse_scan_stats(pool.get("scan_stats"))
+            for name, pool in json.loads(text).get("pools", {}).items()
+        }
+    return _scan_pools(text.splitlines(keepends=True))
+
+
+def _analyze(source: str, data: bytes) -> list[dict[str, typing.Any]]:
+    """Evaluate each pool of a captured output with ``-w`` and ``-c``.
+
+    :return: One summary row per pool. A capture without any pool yields a
+      single UNKNOWN row."""
+    try:
+        records = _parse_capture(data)
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        # A JSON capture that does not have the structure of zpool status.
+        return [_row(source, "", 3, f"Invalid capture: {error}")]
+    if not records:
+        return [_row(source, "", 3, "No pool found")]
+    rows: list[dict[str, typing.Any]] = []
+    for pool, record in records.items():
+        status = PoolScrubStatus(pool, record=record)
+        exit_status, output, _ = _evaluate(PoolResource(pool, status))
+        last_scrub = status.last_scrub
+        rows.append(
+            _row(
+                source,
+                pool,
+                exit_status,
+                output,
+                last_scrub=None if last_scrub is None else last_scrub.isoformat(),
+                last_scrub_timespan=status.last_scrub_timespan,
+                progress=status.progress,
+                speed=status.speed,
+                issue_speed=status.issue_speed,
+                time_to_go=status.time_to_go,
+                scanned=status.scanned,
+                issued=status.issued,
+                total=status.total,
+                repaired=status.repaired,
+            )
+        )
+    return rows
+
+
+def _row(
+    source: str, pool: str, exit_status: int, output: str, **values: typing.Any
+) -> dict[str, typing.Any]:
+    row = dict.fromkeys(_FIELDS)
+    row.update(
+        source=source,
+        pool=pool,
+        state=_STATES[exit_status],
+        exit_status=exit_status,
+        output=output,
+        **values,
+    )
+    return row
+
+
+def _init_worker(options: OptionContainer) -> None:
+    # Started with the spawn or forkserver method, a worker does not inherit
+    # the parsed options.
+    check_zpool_scrub.opts = options
+
+
+def _analyze_all(
+    inputs: typing.Iterable[tuple[str, bytes]], jobs: int
+) -> typing.Iterator[dict[str, typing.Any]]:
+    """Evaluate the captures in ``jobs`` worker processes.
+
+    At most ``2 * jobs`` captures are read ahead, the rows are yielded in
+    the order of the inputs."""
+    if jobs <= 1:
+        for source, data in inputs:
+            yield from _analyze(source, data)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(check_zpool_scrub.opts,),
+    ) as executor:
+        pending: collections.deque[
+            concurrent.futures.Future[list[dict[str, typing.Any]]]
+        ] = collections.deque()
+        for source, data in inputs:
+            pending.append(executor.submit(_analyze, source, data))
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _write_rows(
+    rows: typing.Iterable[dict[str, typing.Any]],
+    output_format: str,
+    out: Optional[typing.TextIO] = None,
+) -> dict[str, int]:
+    """Write the rows as CSV with a header line or as JSON lines.
+
+    :return: The number of pools per state."""
+    if out is None:
+        out = sys.stdout
+    counts = dict.fromkeys(_STATES, 0)
+    writer: Optional[csv.DictWriter[str]] = None
+    if output_format == "csv":
+        writer = csv.DictWriter(out, _FIELDS, lineterminator="\n")
+        writer.writeheader()
+    for row in rows:
+        counts[row["state"]] += 1
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row) + "\n")
+    return counts
+
+
+def _run_analyzer(paths: list[str], jobs: int, output_format: str) -> dict[str, int]:
+    """Analyze the captured outputs and write the summary to the standard
+    output."""
+    return _write_rows(_analyze_all(_read_inputs(paths), jobs), output_format)
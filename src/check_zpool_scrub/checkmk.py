@@ -0,0 +1,60 @@
+"""Print the scrub status of all pools as a section of the Checkmk agent, so
+one agent run covers all pools instead of one active check per pool."""
+
+from __future__ import annotations
+
+import typing
+from datetime import datetime
+from typing import Optional
+
+from mplugin import CheckError
+
+from check_zpool_scrub import PoolResource
+
+SECTION: str = "zpool_scrub"
+
+
+def _format_value(value: typing.Any) -> str:
+    if isinstance(value, datetime):
+        return str(round(value.timestamp()))
+    if isinstance(value, tuple):
+        # vdev_state: the code and the name of the vdev
+        return str(value[0])
+    return str(value)
+
+
+def _format_line(resource: PoolResource) -> str:
+    """``tank<TAB>progress=0.9619<TAB>speed=1.9<TAB>...`` with the values of
+    :meth:`check_zpool_scrub.PoolResource.probe`. Missing values are left
+    out. A pool that could not be probed gets ``error=MESSAGE``.
+
+    The fields are separated by tabs, pool names never contain one."""
+    fields: list[str] = [resource.pool]
+    try:
+        for metric in resource.probe():
+            if metric.value is None:
+                continue
+            name = metric.name.removeprefix(f"{resource.pool}: ")
+            fields.append(f"{name}={_format_value(metric.value)}")
+    except CheckError as e:
+        fields.append(f"error={' '.join(str(e).split())}")
+    return "\t".join(fields)
+
+
+def _format_section(
+    resources: typing.Iterable[PoolResource], interval: Optional[float] = None
+) -> str:
+    """
+    :param interval: Mark the section as cached for so many seconds, see
+      ``--cache-ttl``. The creation time is the time the oldest status was
+      probed, so a status served from the cache does not look fresh."""
+    resources = list(resources)
+    header = f"{SECTION}:sep(9)"
+    if interval is not None:
+        created = min(
+            (r.status.probed_at for r in resources if r.status is not None),
+            default=datetime.now(),
+        )
+        header += f":cached({round(created.timestamp())},{round(interval)})"
+    lines = [f"<<<{header}>>>", *(_format_line(r) for r in resources)]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,566 @@
+"""Serve the scrub status from a long-running process: a daemon with a Unix
+socket for the check and a Prometheus exporter. The daemon refreshes the scrub
+status on a schedule and, optionally, on the events of ``zpool events -f``."""
+
+from __future__ import annotations
+
+import functools
+import http.server
+import json
+import os
+import shutil
+import socket
+import socketserver
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+from datetime import datetime
+from typing import Optional
+
+from mplugin import log
+
+import check_zpool_scrub
+from check_zpool_scrub import (
+    _CACHE_TTL_SCRUBBING,
+    _PROBE_ERRORS,
+    PoolResource,
+    PoolScrubStatus,
+    _collect,
+    _dump_status,
+    _load_status,
+)
+
+
+class Collector:
+    """Keeps the scrub status of all pools in memory and refreshes it on its
+    own schedule."""
+
+    interval: float
+
+    results: dict[str, typing.Union[PoolScrubStatus, str]]
+
+    time: float
+    """The time of the last refresh of all pools as a Unix timestamp."""
+
+    times: dict[str, float]
+    """The time of the last refresh of each pool as a Unix timestamp."""
+
+    lock: threading.Lock
+
+    listeners: list[
+        typing.Callable[[dict[str, typing.Union[PoolScrubStatus, str]]], None]
+    ]
+    """Called with the new results after each refresh."""
+
+    def __init__(self, interval: float) -> None:
+        """
+        :param interval: The refresh interval in seconds. It shrinks to
+          :data:`check_zpool_scrub._CACHE_TTL_SCRUBBING` while a scrub is in progress."""
+        self.interval = interval
+        self.results = {}
+        self.time = 0
+        self.times = {}
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def refresh(self) -> None:
+        deadline: Optional[float] = None
+        if check_zpool_scrub.opts.timeout is not None:
+            deadline = time.monotonic() + check_zpool_scrub.opts.timeout
+        results = _collect(deadline=deadline)
+        with self.lock:
+            self.results = results
+            self.time = datetime.now().timestamp()
+            self.times = dict.fromkeys(results, self.time)
+        for listener in self.listeners:
+            listener(results)
+
+    def refresh_pool(self, pool: str) -> None:
+        """Probe a single pool and keep the results of the other pools. A pool
+        that no longer exists (exported or destroyed) is removed."""
+        deadline: Optional[float] = None
+        if check_zpool_scrub.opts.timeout is not None:
+            deadline = time.monotonic() + check_zpool_scrub.opts.timeout
+        try:
+            result = _collect(pool, deadline)[pool]
+        except ValueError:
+            result = None
+        with self.lock:
+            results = dict(self.results)
+            if result is None:
+                results.pop(pool, None)
+                self.times.pop(pool, None)
+            else:
+                results[pool] = result
+                self.times[pool] = datetime.now().timestamp()
+            self.results = results
+        for listener in self.listeners:
+            listener(results)
+
+    def next_interval(self) -> float:
+        with self.lock:
+            results = list(self.results.values())
+        for result in results:
+            if isinstance(result, PoolScrubStatus) and result.progress is not None:
+                return min(self.interval, _CACHE_TTL_SCRUBBING)
+        return self.interval
+
+    def run(self, stop: threading.Event) -> None:
+        """Refresh until ``stop`` is set. Errors are logged, the last
+        results are kept."""
+        while not stop.wait(self.next_interval()):
+            try:
+                self.refresh()
+            except _PROBE_ERRORS as e:
+                log.warning("Refreshing the scrub status failed: %s", e)
+            except Exception:
+                log.exception("Refreshing the scrub status failed")
+
+    def dump(self) -> dict[str, typing.Any]:
+        """The results in the format of a cache entry (see
+        :func:`check_zpool_scrub._probe_pools_cached`) plus the refresh
+        ``interval``. Pools that could not be probed have an
+        ``error`` instead of the scrub values. Pools refreshed on their own
+        have the ``time`` of their refresh."""
+        with self.lock:
+            pools: dict[str, dict[str, typing.Any]] = {}
+            for pool, result in self.results.items():
+                if isinstance(result, PoolScrubStatus):
+                    pools[pool] = _dump_status(result)
+                else:
+                    pools[pool] = {"error": result}
+                if self.times.get(pool, self.time) != self.time:
+                    pools[pool]["time"] = self.times[pool]
+            return {"time": self.time, "interval": self.interval, "pools": pools}
+
+
+_EVENT_CLASSES: frozenset[str] = frozenset(
+    f"sysevent.fs.zfs.{name}"
+    for name in (
+        "scrub_start",
+        "scrub_finish",
+        "scrub_abort",
+        "scrub_paused",
+        "scrub_resume",
+        "resilver_start",
+        "resilver_finish",
+        "pool_create",
+        "pool_destroy",
+        "pool_import",
+        "pool_export",
+    )
+)
+"""The events that change the scrub status of a pool."""
+
+
+def _parse_events(
+    lines: typing.Iterable[str],
+) -> typing.Iterator[tuple[str, str, float]]:
+    """Parse the output of ``zpool events -v -H``.
+
+    An event starts with a line of the time and the class, followed by
+    indented ``name = value`` lines and an empty line::
+
+        Aug 17 2017 10:25:48.123456789\tsysevent.fs.zfs.scrub_start
+                class = "sysevent.fs.zfs.scrub_start"
+                pool = "tank"
+                time = 0x5995614c 0x75bcd15
+
+    :return: The class, the pool and the time (a Unix timestamp) of each
+      event with a pool."""
+    event_class: Optional[str] = None
+    pool: Optional[str] = None
+    timestamp: float = 0
+    for line in lines:
+        if line[:1].isspace():
+            name, _, value = line.strip().partition(" = ")
+            if name == "pool":
+                pool = value.strip('"')
+            elif name == "time":
+                seconds, _, nanoseconds = value.partition(" ")
+                timestamp = int(seconds, 16) + int(nanoseconds or "0", 16) / 1e9
+            continue
+        if event_class is not None and pool is not None:
+            yield event_class, pool, timestamp
+        event_class, pool, timestamp = None, None, 0
+        if line.strip():
+            event_class = line.split()[-1]
+    if event_class is not None and pool is not None:
+        yield event_class, pool, timestamp
+
+
+class EventWatcher:
+    """Follows ``zpool events -f`` and refreshes the pool of each scrub,
+    resilver, import or export event.
+
+    ``zpool events -f`` prints the events of the past first. These are
+    skipped, the collector has already probed the pools."""
+
+    collector: Collector
+
+    start: float
+    """Events before this time (a Unix timestamp) are skipped."""
+
+    restart_delay: float
+
+    process: Optional[subprocess.Popen[str]]
+
+    def __init__(self, collector: Collector, restart_delay: float = 10) -> None:
+        """
+        :param restart_delay: Restart ``zpool events`` after so many seconds
+          if it exits."""
+        self.collector = collector
+        self.start = datetime.now().timestamp()
+        self.restart_delay = restart_delay
+        self.process = None
+
+    def follow(self, lines: typing.Iterable[str]) -> None:
+        for event_class, pool, timestamp in _parse_events(lines):
+            if event_class not in _EVENT_CLASSES or timestamp < self.start:
+                continue
+            log.info("Event %s of pool %s", event_class, pool)
+            try:
+                self.collector.refresh_pool(pool)
+            except _PROBE_ERRORS as e:
+                log.warning("Refreshing the scrub status of %s failed: %s", pool, e)
+            except Exception:
+                log.exception("Refreshing the scrub status of %s failed", pool)
+
+    def run(self, stop: threading.Event) -> None:
+        """Follow the events until ``stop`` is set."""
+        args = ["zpool", "events", "-f", "-v", "-H"]
+        while not stop.is_set():
+            try:
+                with subprocess.Popen(
+                    args, stdout=subprocess.PIPE, encoding="UTF-8"
+                ) as self.process:
+                    assert self.process.stdout is not None
+                    self.follow(self.process.stdout)
+            except OSError as e:
+                log.warning("%s failed: %s", " ".join(args), e)
+            if not stop.is_set():
+                log.warning("%s exited, restarting", " ".join(args))
+            stop.wait(self.restart_delay)
+
+    def terminate(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+class _SocketHandler(socketserver.StreamRequestHandler):
+    server: _SocketServer
+
+    def handle(self) -> None:
+        self.wfile.write(json.dumps(self.server.collector.dump()).encode())
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Remove the socket of a daemon that is no longer running.
+
+    :raise FileExistsError: If the path is not a socket or a daemon still
+      answers on it."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise FileExistsError(f"{path} is in use by a running daemon")
+
+
+class _SocketServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    collector: Collector
+
+    def __init__(
+        self,
+        path: str,
+        collector: Collector,
+        mode: int = 0o666,
+        group: Optional[str] = None,
+    ) -> None:
+        """
+        :param mode: The permissions of the socket. The socket is not created
+          with the umask of the daemon, which would usually lock out the
+          user of the monitoring system.
+        :param group: The group of the socket."""
+        self.collector = collector
+        _remove_stale_socket(path)
+        super().__init__(path, _SocketHandler)
+        if group is not None:
+            shutil.chown(path, group=group)
+        os.chmod(path, mode)
+
+
+_PROMETHEUS_METRICS: dict[str, tuple[str, str]] = {
+    "progress": (
+        "zpool_scrub_progress_ratio",
+        "The progress of the scrub in progress from 0 to 1.",
+    ),
+    "speed": (
+        "zpool_scrub_speed_mebibytes_per_second",
+        "The speed of the scrub in progress in MiB per second.",
+    ),
+    "time_to_go": (
+        "zpool_scrub_time_to_go_seconds",
+        "The estimated time to go of the scrub in progress in seconds.",
+    ),
+    "last_scrub_timestamp": (
+        "zpool_scrub_last_scrub_timestamp_seconds",
+        (
+            "The start time of the scrub in progress or the end time of the last "
+            "scrub as a Unix timestamp."
+        ),
+    ),
+    "last_scrub_timespan": (
+        "zpool_scrub_last_scrub_timespan_seconds",
+        "The seconds since the last scrub.",
+    ),
+    "issue_speed": (
+        "zpool_scrub_issue_speed_mebibytes_per_second",
+        (
+            "The speed of the scrub in progress issuing data to the disks in MiB "
+            "per second."
+        ),
+    ),
+    "scanned": (
+        "zpool_scrub_scanned_bytes",
+        "The bytes scanned by the scrub in progress.",
+    ),
+    "issued": (
+        "zpool_scrub_issued_bytes",
+        "The bytes issued by the scrub in progress.",
+    ),
+    "total": (
+        "zpool_scrub_total_bytes",
+        "The bytes to scrub in total.",
+    ),
+    "repaired": (
+        "zpool_scrub_repaired_bytes",
+        "The bytes repaired by the scrub in progress or by the last scrub.",
+    ),
+}
+"""The Prometheus names and help texts of the metrics of
+:meth:`check_zpool_scrub.PoolResource.probe`, with the context names as keys."""
+
+
+def _format_prometheus(results: dict[str, typing.Union[PoolScrubStatus, str]]) -> str:
+    """Format the metrics of :meth:`check_zpool_scrub.PoolResource.probe` as labelled gauges in
+    the Prometheus text exposition format.
+
+    The gauge ``zpool_scrub_up`` is ``0`` for a pool that could not be
+    probed."""
+    samples: dict[str, list[str]] = {"up": []}
+    for name, _ in _PROMETHEUS_METRICS.values():
+        samples[name] = []
+    for pool, result in results.items():
+        label = pool.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        label = f'{{pool="{label}"}}'
+        samples["up"].append(
+            f"zpool_scrub_up{label} {int(isinstance(result, PoolScrubStatus))}"
+        )
+        if not isinstance(result, PoolScrubStatus):
+            continue
+        for metric in PoolResource(pool, result).probe():
+            if metric.value is None or metric.context not in _PROMETHEUS_METRICS:
+                continue
+            value = metric.value
+            if isinstance(value, datetime):
+                value = round(value.timestamp())
+            name = _PROMETHEUS_METRICS[metric.context][0]
+            samples[name].append(f"{name}{label} {value}")
+    lines: list[str] = [
+        "# HELP zpool_scrub_up Whether the pool could be probed.",
+        "# TYPE zpool_scrub_up gauge",
+        *samples["up"],
+    ]
+    for name, description in _PROMETHEUS_METRICS.values():
+        lines += [
+            f"# HELP {name} {description}",
+            f"# TYPE {name} gauge",
+            *samples[name],
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _write_textfile(
+    path: str, results: dict[str, typing.Union[PoolScrubStatus, str]]
+) -> None:
+    """Write the metrics for the textfile collector of the node_exporter.
+
+    The file is replaced atomically, so the node_exporter never reads a
+    partially written file."""
+    directory, filename = os.path.split(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(
+        "w", dir=directory, prefix=f".{filename}.", delete=False, encoding="utf-8"
+    ) as file:
+        file.write(_format_prometheus(results))
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+class _ExporterHandler(http.server.BaseHTTPRequestHandler):
+    server: _ExporterServer
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.body
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        log.debug(format, *args)
+
+
+class _ExporterServer(http.server.ThreadingHTTPServer):
+    """Serves the metrics on ``/metrics``.
+
+    The metrics are formatted once per refresh of the collector, every
+    scrape in between gets the same response. A refresh never blocks a
+    response."""
+
+    daemon_threads = True
+
+    body: bytes
+
+    def __init__(self, address: tuple[str, int], collector: Collector) -> None:
+        self.body = _format_prometheus(collector.results).encode()
+        collector.listeners.append(self.update)
+        super().__init__(address, _ExporterHandler)
+
+    def update(self, results: dict[str, typing.Union[PoolScrubStatus, str]]) -> None:
+        self.body = _format_prometheus(results).encode()
+
+
+def _run_daemon(
+    interval: float,
+    socket_path: Optional[str] = None,
+    exporter_address: Optional[tuple[str, int]] = None,
+    textfile: Optional[str] = None,
+    events: bool = False,
+    socket_mode: int = 0o666,
+    socket_group: Optional[str] = None,
+) -> None:
+    """Collect the scrub status on a schedule and serve it until the process
+    is terminated.
+
+    :param socket_path: Serve the scrub status on this Unix socket.
+    :param socket_mode: The permissions of the socket.
+    :param socket_group: The group of the socket.
+    :param exporter_address: Serve the Prometheus metrics over HTTP on this
+      address.
+    :param textfile: Write the Prometheus metrics to this file after each
+      refresh.
+    :param events: Refresh a pool as soon as ``zpool events`` reports a change
+      of its scrub status."""
+    collector = Collector(interval)
+    if textfile is not None:
+        collector.listeners.append(functools.partial(_write_textfile, textfile))
+    servers: list[socketserver.BaseServer] = []
+    if socket_path is not None:
+        try:
+            servers.append(
+                _SocketServer(socket_path, collector, socket_mode, socket_group)
+            )
+        except FileExistsError as e:
+            raise SystemExit(f"check_zpool_scrub: {e}") from None
+        log.info("Serving the scrub status on %s", socket_path)
+    if exporter_address is not None:
+        servers.append(_ExporterServer(exporter_address, collector))
+        log.info("Serving the Prometheus metrics on %s:%s", *exporter_address)
+    # The clients wait in the backlog of the servers until the first refresh.
+    collector.refresh()
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    stop = threading.Event()
+    watcher: Optional[EventWatcher] = None
+    if events:
+        watcher = EventWatcher(collector)
+        threading.Thread(target=watcher.run, args=(stop,), daemon=True).start()
+    try:
+        collector.run(stop)
+    finally:
+        stop.set()
+        if watcher is not None:
+            watcher.terminate()
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if socket_path is not None:
+            os.unlink(socket_path)
+
+
+_QUERY_TIMEOUT: float = 2.0
+"""The daemon answers from memory. A daemon that takes longer is hung and
+the check probes the pools itself."""
+
+
+def _query_daemon(
+    path: str, timeout: float = _QUERY_TIMEOUT, vdevs: bool = False
+) -> Optional[dict[str, typing.Union[PoolScrubStatus, str]]]:
+    """Fetch the scrub status of all pools from the daemon.
+
+    The scrub status is rejected if the daemon has not refreshed it for more
+    than twice its refresh interval, for example because the collector is
+    stuck.
+
+    :param timeout: The time for the whole answer, not only for a single
+      read from the socket.
+    :param vdevs: The vdev trees are needed, see ``--vdevs``. A daemon that
+      does not read them is not used.
+
+    :return: The scrub status or an error message of each pool or ``None`` if
+      the daemon does not answer or its scrub status is stale."""
+    chunks: list[bytes] = []
+    end: float = time.monotonic() + timeout
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(path)
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no answer within {timeout:g}s")
+                client.settimeout(remaining)
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        entry: dict[str, typing.Any] = json.loads(b"".join(chunks))
+    except (OSError, ValueError) as e:
+        log.warning("The daemon on %s does not answer: %s", path, e)
+        return None
+    now: float = datetime.now().timestamp()
+    if now - entry["time"] > 2 * entry["interval"]:
+        log.warning(
+            "The scrub status of the daemon on %s is stale, age %.0fs",
+            path,
+            now - entry["time"],
+        )
+        return None
+    if vdevs and any(
+        "error" not in data and "vdevs" not in data for data in entry["pools"].values()
+    ):
+        log.warning("The daemon on %s does not read the vdevs", path)
+        return None
+    return {
+        pool: _load_status(pool, data, data.get("time", entry["time"]), now)
+        if "error" not in data
+        else data["error"]
+        for pool, data in entry["pools"].items()
+    }
@@ -0,0 +1,227 @@
+"""The durations of the past scrubs and the interval between them from the
+internal events of ``zpool history -il POOL``.
+
+The history of a long-lived pool has hundreds of thousands of lines. A
+checkpoint per pool remembers the last event read and the completed scrubs,
+so a later run only parses the newer events."""
+
+from __future__ import annotations
+
+import os
+import re
+import statistics
+import subprocess
+import threading
+import typing
+import urllib.parse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from mplugin import Cookie, log
+
+_KEEP: int = 64
+"""The number of completed scrubs kept in a checkpoint."""
+
+_EVENT: re.Pattern[str] = re.compile(
+    r"(?P<time>\d{4}-\d\d-\d\d\.\d\d:\d\d:\d\d) \["
+    # OpenZFS: [txg:1234] scan setup func=1 mintxg=0 maxtxg=1234
+    r"(?:txg:\d+\] scan (?P<event>setup|done|cancelled)(?: func=(?P<func>\d+))?"
+    # Older releases: [internal pool scrub txg:1234] func=1 mintxg=0 ...
+    # and [internal pool scrub done txg:1300] complete=1
+    r"|internal pool scrub (?P<done>done )?txg:\d+\]"
+    r"(?: func=(?P<old_func>\d+)| complete=(?P<complete>\d))?)"
+)
+
+_SCRUB: str = "1"
+"""The scan function of a scrub, ``2`` is a resilver."""
+
+_SLACK: int = 60
+"""The seconds the times of ``zpool status`` and of the events of the same
+scrub may differ."""
+
+
+@dataclass(frozen=True, slots=True)
+class ScrubDurations:
+    last: Optional[int] = None
+    """The duration of the last completed scrub in seconds."""
+
+    mean: Optional[int] = None
+    """The mean duration of the completed scrubs in seconds."""
+
+    interval: Optional[int] = None
+    """The mean time between the starts of the completed scrubs in
+    seconds."""
+
+
+def _timestamp(time: str) -> int:
+    return round(datetime.strptime(time, "%Y-%m-%d.%H:%M:%S").timestamp())
+
+
+class _Parser:
+    """Reads the lines of ``zpool history -il`` in a single pass."""
+
+    time: str
+    """The time of the last line read, ``YYYY-MM-DD.HH:MM:SS``."""
+
+    seen: int
+    """The number of lines read with this time."""
+
+    start: Optional[int]
+    """The start of the scrub in progress."""
+
+    scrubs: list[list[int]]
+    """The start and the end of the completed scrubs."""
+
+    end: Optional[int]
+    """The end of the last finished or canceled scrub, ``None`` if no scrub
+    has ended yet."""
+
+    read: bool
+    """Whether the history has been read before."""
+
+    def __init__(self, checkpoint: Optional[dict[str, typing.Any]] = None) -> None:
+        self.read = checkpoint is not None
+        checkpoint = checkpoint or {}
+        self.time = checkpoint.get("time", "")
+        self.seen = checkpoint.get("seen", 0)
+        self.start = checkpoint.get("start")
+        self.scrubs = checkpoint.get("scrubs", [])
+        self.end = checkpoint.get("end", self.scrubs[-1][1] if self.scrubs else None)
+
+    def checkpoint(self) -> dict[str, typing.Any]:
+        return {
+            "time": self.time,
+            "seen": self.seen,
+            "start": self.start,
+            "scrubs": self.scrubs[-_KEEP:],
+            "end": self.end,
+        }
+
+    def feed(self, lines: typing.Iterable[str]) -> None:
+        skip = self.seen
+        for line in lines:
+            time = line[:19]
+            # The times are in chronological order and compare as strings.
+            if time < self.time:
+                continue
+            if time == self.time:
+                if skip:
+                    skip -= 1
+                    continue
+                self.seen += 1
+            else:
+                if not time[:1].isdigit():
+                    # History for 'tank':
+                    continue
+                self.time = time
+                self.seen = 1
+                skip = 0
+            if " scan " in line or " pool scrub " in line:
+                self.event(line)
+
+    def event(self, line: str) -> None:
+        match = _EVENT.match(line)
+        if match is None:
+            return
+        time = _timestamp(match["time"])
+        if match["event"] == "setup" or (match["event"] is None and not match["done"]):
+            func = match["func"] or match["old_func"]
+            self.start = time if func in (None, _SCRUB) else None
+        elif self.start is None:
+            # The end of a resilver
+            return
+        elif match["event"] == "cancelled" or match["complete"] == "0":
+            self.end = time
+            self.start = None
+        else:
+            self.scrubs.append([self.start, time])
+            self.end = time
+            self.start = None
+
+    def covers(self, last_scrub: Optional[datetime], scrubbing: bool) -> bool:
+        """Whether the events up to the checkpoint already include the last
+        scrub of ``zpool status``, so the history has nothing new.
+
+        :param last_scrub: The start of the scrub in progress or the end of
+          the last finished or canceled scrub, ``None`` if the pool has never
+          been scrubbed.
+        :param scrubbing: Whether a scrub is in progress."""
+        if not self.read:
+            return False
+        if last_scrub is None:
+            # A new scrub would show up in zpool status.
+            return self.start is None
+        time = last_scrub.timestamp()
+        if scrubbing:
+            return self.start is not None and abs(self.start - time) <= _SLACK
+        return (
+            self.start is None
+            and self.end is not None
+            and abs(self.end - time) <= _SLACK
+        )
+
+    def durations(self) -> ScrubDurations:
+        if not self.scrubs:
+            return ScrubDurations()
+        durations = [end - start for start, end in self.scrubs]
+        starts = [start for start, _ in self.scrubs]
+        return ScrubDurations(
+            last=durations[-1],
+            mean=round(statistics.fmean(durations)),
+            interval=round((starts[-1] - starts[0]) / (len(starts) - 1))
+            if len(starts) > 1
+            else None,
+        )
+
+
+def checkpoint_file(directory: str, pool: str) -> str:
+    return os.path.join(directory, urllib.parse.quote(pool, safe="") + ".json")
+
+
+def scrub_durations(
+    directory: str,
+    pool: str,
+    timeout: Optional[float] = None,
+    last_scrub: Optional[datetime] = None,
+    scrubbing: bool = False,
+) -> ScrubDurations:
+    """Stream ``zpool history -il POOL`` and parse the events after the
+    checkpoint of the pool in ``directory``.
+
+    ``zpool`` is not executed at all if the checkpoint already covers the last
+    scrub of ``zpool status``.
+
+    :param timeout: Kill ``zpool`` after so many seconds and raise
+      :class:`subprocess.TimeoutExpired`.
+    :param last_scrub: The last scrub from ``zpool status``, see
+      :meth:`_Parser.covers`.
+    :param scrubbing: Whether a scrub is in progress."""
+    args: list[str] = ["zpool", "history", "-il", pool]
+    os.makedirs(directory, exist_ok=True)
+    with Cookie(checkpoint_file(directory, pool)) as cookie:
+        parser = _Parser(cookie.get("checkpoint"))
+        if parser.covers(last_scrub, scrubbing):
+            log.debug("The checkpoint of %s covers the last scrub", pool)
+            return parser.durations()
+        with subprocess.Popen(
+            args, stdout=subprocess.PIPE, encoding="UTF-8", errors="replace"
+        ) as process:
+            watchdog: Optional[threading.Timer] = None
+            if timeout is not None:
+                watchdog = threading.Timer(timeout, process.kill)
+                watchdog.start()
+            try:
+                assert process.stdout is not None
+                parser.feed(process.stdout)
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+            returncode = process.wait()
+        if returncode < 0 and timeout is not None:
+            raise subprocess.TimeoutExpired(args, timeout)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, args)
+        log.debug("Checkpoint of %s: %s %s", pool, parser.time, parser.seen)
+        cookie["checkpoint"] = parser.checkpoint()
+    return parser.durations()
@@ -0,0 +1,156 @@
+"""Pause the scrubs of pools under load and resume them when the load drops,
+without risking that a scrub misses the critical threshold."""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime
+from datetime import time as dtime
+from typing import Optional
+
+from mplugin import log
+
+import check_zpool_scrub
+from check_zpool_scrub import (
+    _PROBE_ERRORS,
+    PoolScrubStatus,
+    _collect,
+    _zpool_scrub,
+)
+from check_zpool_scrub.iostat import Iostat, IostatRecord
+
+_RESUME_RATIO: float = 0.5
+"""A paused scrub is resumed when the latency drops below this fraction of
+the limit, because the resumed scrub adds load again."""
+
+
+def _parse_window(value: str) -> tuple[dtime, dtime]:
+    """Parse the argument of ``--pause-window HH:MM-HH:MM``."""
+    begin, separator, end = value.partition("-")
+    if not separator:
+        raise ValueError(f"Expected HH:MM-HH:MM, got '{value}'")
+    return dtime.fromisoformat(begin.strip()), dtime.fromisoformat(end.strip())
+
+
+def _in_window(now: dtime, window: tuple[dtime, dtime]) -> bool:
+    """A window whose end is before its begin spans midnight."""
+    begin, end = window
+    if begin <= end:
+        return begin <= now < end
+    return now >= begin or now < end
+
+
+def _latency(record: Optional[IostatRecord]) -> Optional[float]:
+    """The higher of the average read and write latencies."""
+    if record is None:
+        return None
+    latencies = [
+        latency
+        for latency in (record.total_wait_read, record.total_wait_write)
+        if latency is not None
+    ]
+    return max(latencies, default=None)
+
+
+class Governor:
+    """Samples the latency of the pools with ``zpool iostat`` and pauses a
+    scrub that pushes the latency of its pool over the limit.
+
+    Only scrubs paused by the governor are resumed: when the latency drops,
+    outside the pause window, or when the scrub would not finish before the
+    critical threshold (``-c``) otherwise."""
+
+    max_latency: float
+
+    window: Optional[tuple[dtime, dtime]]
+
+    interval: float
+
+    paused: dict[str, int]
+    """The pools paused by the governor and their time to go in seconds when
+    they were paused. The output of a paused scrub has no time to go."""
+
+    def __init__(
+        self,
+        max_latency: float,
+        interval: float,
+        window: Optional[tuple[dtime, dtime]] = None,
+    ) -> None:
+        """
+        :param max_latency: The limit of the average latency in seconds.
+        :param interval: The latency is measured over so many seconds.
+        :param window: Scrubs are only paused within this time of the day."""
+        self.max_latency = max_latency
+        self.interval = interval
+        self.window = window
+        self.paused = {}
+
+    def affordable(self, status: PoolScrubStatus, time_to_go: int) -> bool:
+        """Whether the scrub can be paused for another interval and still
+        finish before its start is ``-c`` seconds ago."""
+        if status.last_scrub is None:
+            return False
+        finish = datetime.now().timestamp() + 2 * self.interval + time_to_go
+        return finish < status.last_scrub.timestamp() + check_zpool_scrub.opts.critical
+
+    def step(self) -> None:
+        """Measure the load and pause or resume the scrubs."""
+        deadline: Optional[float] = None
+        if check_zpool_scrub.opts.timeout is not None:
+            deadline = time.monotonic() + self.interval + check_zpool_scrub.opts.timeout
+        iostat = Iostat(
+            None,
+            self.interval,
+            None if deadline is None else deadline - time.monotonic(),
+        )
+        results = _collect(deadline=deadline)
+        load = iostat.result()
+        in_window = self.window is None or _in_window(
+            datetime.now().time(), self.window
+        )
+        for pool, result in results.items():
+            if not isinstance(result, PoolScrubStatus) or result.progress is None:
+                # Finished, canceled or exported.
+                self.paused.pop(pool, None)
+                continue
+            latency = _latency(load.get(pool))
+            if result.paused:
+                if pool not in self.paused:
+                    # Paused by someone else.
+                    continue
+                reason: Optional[str] = None
+                if not in_window:
+                    reason = "outside the pause window"
+                elif not self.affordable(result, self.paused[pool]):
+                    reason = "it has to finish before the critical threshold"
+                elif latency is None or latency < self.max_latency * _RESUME_RATIO:
+                    reason = "the load dropped"
+                if reason is not None and _zpool_scrub(pool):
+                    del self.paused[pool]
+                    print(f"Resumed the scrub of the pool “{pool}”: {reason}")
+            elif in_window and latency is not None and latency > self.max_latency:
+                if result.time_to_go is None or not self.affordable(
+                    result, result.time_to_go
+                ):
+                    log.info("The scrub of %s cannot be paused", pool)
+                    continue
+                if _zpool_scrub(pool, pause=True):
+                    self.paused[pool] = result.time_to_go
+                    print(
+                        f"Paused the scrub of the pool “{pool}”: latency "
+                        f"{latency:g}s > {self.max_latency:g}s"
+                    )
+
+    def run(self, stop: threading.Event) -> None:
+        """Govern until ``stop`` is set. A step takes at least the interval of
+        the measurement."""
+        while not stop.is_set():
+            begin = time.monotonic()
+            try:
+                self.step()
+            except _PROBE_ERRORS as e:
+                log.warning("Governing the scrubs failed: %s", e)
+            except Exception:
+                log.exception("Governing the scrubs failed")
+            stop.wait(max(self.interval - (time.monotonic() - begin), 0))
@@ -0,0 +1,231 @@
+"""A persistent scrub history per pool in a fixed-size ring buffer file.
+
+Each probe of a scrub in progress appends a sample of 18 bytes. The file is
+memory-mapped and never grows beyond its capacity, the oldest samples are
+overwritten."""
+
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import statistics
+import struct
+import typing
+import urllib.parse
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Optional
+
+if typing.TYPE_CHECKING:
+    from typing_extensions import Self
+
+_MAGIC: bytes = b"ZSRH"
+
+_HEADER: struct.Struct = struct.Struct("<4sII")
+"""Magic, capacity (number of samples), number of samples appended so far."""
+
+_SAMPLE: struct.Struct = struct.Struct("<IIHQ")
+"""Start time of the scrub, time of the sample (Unix timestamps), progress in
+hundredths of a percent, issued bytes."""
+
+
+@dataclass(frozen=True, slots=True)
+class Sample:
+    start: int
+    """The start time of the scrub as a Unix timestamp. It identifies the
+    scrub."""
+
+    time: int
+    """The time of the sample as a Unix timestamp."""
+
+    progress: float
+    """From ``0`` to ``1``."""
+
+    issued: int
+    """Bytes issued so far."""
+
+
+@dataclass(frozen=True, slots=True)
+class Trend:
+    """Values derived from the history of a scrub in progress."""
+
+    measured_speed: Optional[float] = None
+    """MB per second issued since the previous sample."""
+
+    smoothed_time_to_go: Optional[int] = None
+    """Time to go in seconds, extrapolated from the progress over
+    :data:`WINDOW` seconds."""
+
+    speed_ratio: Optional[float] = None
+    """The average speed of the current scrub divided by the median average
+    speed of the past scrubs in the history."""
+
+
+WINDOW: int = 6 * 3600
+"""The smoothed time to go is based on the samples of this many seconds."""
+
+
+class RingBuffer:
+    """The samples of a pool in a memory-mapped file of constant size.
+
+    Use it as a context manager, the file is locked exclusively meanwhile."""
+
+    path: str
+
+    capacity: int
+
+    __file: Optional[typing.BinaryIO]
+
+    __map: Optional[mmap.mmap]
+
+    def __init__(self, path: str, capacity: int = 1024) -> None:
+        """
+        :param capacity: The number of samples of a new file. An existing file
+          keeps its capacity."""
+        self.path = path
+        self.capacity = capacity
+        self.__file = None
+        self.__map = None
+
+    def __enter__(self) -> Self:
+        file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            size = os.fstat(file.fileno()).st_size
+            if size >= _HEADER.size:
+                magic, capacity, _ = _HEADER.unpack(
+                    os.pread(file.fileno(), _HEADER.size, 0)
+                )
+                if magic != _MAGIC or size != _HEADER.size + capacity * _SAMPLE.size:
+                    raise ValueError(f"{self.path} is not a scrub history file")
+                self.capacity = capacity
+            else:
+                file.truncate(_HEADER.size + self.capacity * _SAMPLE.size)
+                os.pwrite(file.fileno(), _HEADER.pack(_MAGIC, self.capacity, 0), 0)
+            self.__map = mmap.mmap(file.fileno(), 0)
+        except BaseException:
+            file.close()
+            raise
+        self.__file = file
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    @property
+    def __mmap(self) -> mmap.mmap:
+        if self.__map is None:
+            raise RuntimeError("The ring buffer is not open")
+        return self.__map
+
+    @property
+    def count(self) -> int:
+        """The number of samples appended since the file was created."""
+        return _HEADER.unpack_from(self.__mmap)[2]
+
+    def append(self, sample: Sample) -> None:
+        count = self.count
+        _SAMPLE.pack_into(
+            self.__mmap,
+            _HEADER.size + count % self.capacity * _SAMPLE.size,
+            sample.start,
+            sample.time,
+            round(sample.progress * 10000),
+            sample.issued,
+        )
+        _HEADER.pack_into(self.__mmap, 0, _MAGIC, self.capacity, count + 1)
+
+    def samples(self) -> list[Sample]:
+        """The stored samples, the oldest first."""
+        count = self.count
+        first = max(count - self.capacity, 0)
+        samples: list[Sample] = []
+        for index in range(first, count):
+            start, time, progress, issued = _SAMPLE.unpack_from(
+                self.__mmap, _HEADER.size + index % self.capacity * _SAMPLE.size
+            )
+            samples.append(Sample(start, time, progress / 10000, issued))
+        return samples
+
+
+def history_file(directory: str, pool: str) -> str:
+    return os.path.join(directory, urllib.parse.quote(pool, safe="") + ".ring")
+
+
+def _speed(first: Sample, last: Sample) -> Optional[float]:
+    """Bytes issued per second between two samples of the same scrub."""
+    if last.time <= first.time or last.issued < first.issued:
+        return None
+    return (last.issued - first.issued) / (last.time - first.time)
+
+
+def trend(samples: list[Sample]) -> Trend:
+    """Derive the trend of the scrub of the last sample."""
+    if not samples:
+        return Trend()
+    last = samples[-1]
+    current = [sample for sample in samples if sample.start == last.start]
+
+    measured_speed: Optional[float] = None
+    if len(current) >= 2:
+        speed = _speed(current[-2], last)
+        if speed is not None:
+            measured_speed = round(speed / 1024**2, 2)
+
+    smoothed_time_to_go: Optional[int] = None
+    window = [sample for sample in current if sample.time >= last.time - WINDOW]
+    if len(window) >= 2 and last.time > window[0].time:
+        rate = (last.progress - window[0].progress) / (last.time - window[0].time)
+        if rate > 0:
+            smoothed_time_to_go = round((1 - last.progress) / rate)
+
+    speed_ratio: Optional[float] = None
+    past: list[float] = []
+    scrubs: dict[int, list[Sample]] = {}
+    for sample in samples:
+        scrubs.setdefault(sample.start, []).append(sample)
+    for start, scrub in scrubs.items():
+        if start == last.start:
+            continue
+        speed = _speed(scrub[0], scrub[-1])
+        if speed:
+            past.append(speed)
+    current_speed = _speed(current[0], last)
+    if past and current_speed is not None:
+        speed_ratio = round(current_speed / statistics.median(past), 2)
+
+    return Trend(measured_speed, smoothed_time_to_go, speed_ratio)
+
+
+def record(
+    directory: str,
+    pool: str,
+    sample: Sample,
+    capacity: int = 1024,
+) -> Trend:
+    """Append a sample to the history of a pool and derive the trend.
+
+    A sample equal to the last one (for example from the cache) is not
+    appended again. The directory is created if it does not exist."""
+    os.makedirs(directory, exist_ok=True)
+    with RingBuffer(history_file(directory, pool), capacity) as buffer:
+        samples = buffer.samples()
+        if (
+            not samples
+            or (samples[-1].start, samples[-1].progress, samples[-1].issued)
+            != (sample.start, round(sample.progress, 4), sample.issued)
+        ) and (not samples or sample.time > samples[-1].time):
+            buffer.append(sample)
+            samples = buffer.samples()
+        return trend(samples)
@@ -0,0 +1,129 @@
+"""Submit the results of all pools as passive check results to the Icinga 2
+API, one service per pool, instead of running one active check per pool."""
+
+from __future__ import annotations
+
+import base64
+import http.client
+import json
+import socket
+import ssl
+import typing
+import urllib.parse
+from typing import Optional
+
+from mplugin import log
+
+from check_zpool_scrub import PoolResource, _evaluate
+
+
+class _IcingaClient:
+    """Sends the requests over a single keep-alive connection."""
+
+    connection: http.client.HTTPConnection
+
+    path: str
+
+    headers: dict[str, str]
+
+    def __init__(
+        self,
+        url: str,
+        user: str,
+        password: str,
+        ca_file: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        :param url: The base URL of the API, for example
+          ``https://icinga.example.com:5665``. ``http`` is accepted for a proxy
+          that terminates TLS.
+        :param ca_file: Verify the certificate of the API with this CA
+          certificate (the ``ca.crt`` of the Icinga PKI) instead of the
+          system's CA certificates."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.hostname is None or parts.scheme not in ("http", "https"):
+            raise ValueError(f"Invalid URL of the Icinga 2 API: '{url}'")
+        if parts.scheme == "https":
+            self.connection = http.client.HTTPSConnection(
+                parts.hostname,
+                parts.port or 5665,
+                timeout=timeout,
+                context=ssl.create_default_context(cafile=ca_file),
+            )
+        else:
+            self.connection = http.client.HTTPConnection(
+                parts.hostname, parts.port or 80, timeout=timeout
+            )
+        self.path = parts.path.rstrip("/") + "/v1/actions/process-check-result"
+        credentials = base64.b64encode(f"{user}:{password}".encode()).decode()
+        self.headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Basic {credentials}",
+        }
+
+    def post(self, body: dict[str, typing.Any]) -> tuple[int, str]:
+        """
+        :return: The HTTP status and the response body."""
+        data = json.dumps(body).encode()
+        for attempt in range(2):
+            try:
+                self.connection.request("POST", self.path, data, self.headers)
+                response = self.connection.getresponse()
+                return response.status, response.read().decode(errors="replace")
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the idle connection, open a new one.
+                self.connection.close()
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _submit(
+    resources: list[PoolResource],
+    url: str,
+    user: str,
+    password: str,
+    host: Optional[str] = None,
+    service: str = "zpool_scrub_{pool}",
+    ca_file: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> list[str]:
+    """Submit one passive check result per pool
+    (``/v1/actions/process-check-result``).
+
+    :param host: The name of the host object (default: the FQDN).
+    :param service: The name of the service object, ``{pool}`` is replaced by
+      the name of the pool.
+
+    :return: An error message for each pool whose result was not accepted."""
+    source = socket.getfqdn()
+    if host is None:
+        host = source
+    client = _IcingaClient(url, user, password, ca_file, timeout)
+    errors: list[str] = []
+    try:
+        for resource in resources:
+            exit_status, output, perfdata = _evaluate(resource)
+            name = service.format(pool=resource.pool)
+            status, content = client.post(
+                {
+                    "type": "Service",
+                    "filter": "host.name == h && service.name == s",
+                    "filter_vars": {"h": host, "s": name},
+                    "exit_status": exit_status,
+                    "plugin_output": output,
+                    "performance_data": perfdata,
+                    "check_source": source,
+                }
+            )
+            log.debug("Response to the result of %s!%s: %s", host, name, content)
+            if status != 200:
+                errors.append(f"{host}!{name}: {status} {content.strip()[:200]}")
+    finally:
+        client.close()
+    return errors
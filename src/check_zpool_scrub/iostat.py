@@ -0,0 +1,128 @@
+"""The I/O load of the pools from ``zpool iostat``, collected in the
+background while the scrub status is probed."""
+
+from __future__ import annotations
+
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from mplugin import log
+
+
+@dataclass(frozen=True, slots=True)
+class IostatRecord:
+    """The averages of one ``zpool iostat`` interval of a pool. The latencies
+    are in seconds."""
+
+    read_ops: Optional[int] = None
+    write_ops: Optional[int] = None
+    read_bandwidth: Optional[int] = None
+    """Bytes per second."""
+    write_bandwidth: Optional[int] = None
+    """Bytes per second."""
+    total_wait_read: Optional[float] = None
+    total_wait_write: Optional[float] = None
+    disk_wait_read: Optional[float] = None
+    disk_wait_write: Optional[float] = None
+    syncq_wait_read: Optional[float] = None
+    syncq_wait_write: Optional[float] = None
+    asyncq_wait_read: Optional[float] = None
+    asyncq_wait_write: Optional[float] = None
+    scrub_wait: Optional[float] = None
+    """The time I/O of the scrub waits in the scrub queue."""
+
+
+_COUNTERS: tuple[str, ...] = (
+    "read_ops",
+    "write_ops",
+    "read_bandwidth",
+    "write_bandwidth",
+)
+
+_LATENCIES: tuple[str, ...] = (
+    "total_wait_read",
+    "total_wait_write",
+    "disk_wait_read",
+    "disk_wait_write",
+    "syncq_wait_read",
+    "syncq_wait_write",
+    "asyncq_wait_read",
+    "asyncq_wait_write",
+    "scrub_wait",
+)
+
+
+def _parse_iostat(output: str) -> dict[str, IostatRecord]:
+    """Parse the output of ``zpool iostat -H -p -l``.
+
+    The columns are the name, the allocated and the free bytes, the counters
+    and the latencies in nanoseconds. Newer versions append further latencies
+    (``trim_wait``, ``rebuild_wait``), which are ignored. Values that are not
+    available are printed as ``-``. If a pool occurs more than once, the last
+    line wins."""
+    records: dict[str, IostatRecord] = {}
+    for line in output.splitlines():
+        columns = line.split("\t")
+        if len(columns) < 3 + len(_COUNTERS):
+            continue
+        # The integer counters and the float latencies.
+        values: dict[str, Any] = {}
+        for name, value in zip(_COUNTERS, columns[3:], strict=False):
+            if value != "-":
+                values[name] = int(value)
+        for name, value in zip(_LATENCIES, columns[3 + len(_COUNTERS) :], strict=False):
+            if value != "-":
+                values[name] = int(value) / 1e9
+        records[columns[0]] = IostatRecord(**values)
+    return records
+
+
+class Iostat:
+    """Run ``zpool iostat`` in a background thread.
+
+    ``zpool iostat -y`` omits the statistics since the import of the pool, so
+    the single report covers the interval only."""
+
+    args: list[str]
+
+    records: dict[str, IostatRecord]
+
+    __thread: threading.Thread
+
+    __timeout: Optional[float]
+
+    def __init__(
+        self, pool: Optional[str], interval: float, timeout: Optional[float] = None
+    ) -> None:
+        """
+        :param pool: All pools if ``None``.
+        :param timeout: Kill the command after so many seconds."""
+        self.args = ["zpool", "iostat", "-H", "-p", "-l", "-y"]
+        if pool is not None:
+            self.args.append(pool)
+        self.args += [f"{interval:g}", "1"]
+        self.records = {}
+        self.__timeout = timeout
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self) -> None:
+        try:
+            output: str = subprocess.check_output(
+                self.args,
+                encoding="UTF-8",
+                stderr=subprocess.DEVNULL,
+                timeout=self.__timeout,
+            )
+            log.debug("Output from %s: %s", " ".join(self.args), output)
+            self.records = _parse_iostat(output)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            # The load is an addition, the check does not fail without it.
+            log.info("%s failed: %s", " ".join(self.args), e)
+
+    def result(self) -> dict[str, IostatRecord]:
+        """Wait for the command and return the records by pool name."""
+        self.__thread.join()
+        return self.records
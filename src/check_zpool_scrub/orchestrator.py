@@ -0,0 +1,111 @@
+"""Start the scrubs of the pools that are due one after another instead of all
+at once, so pools on a shared controller or enclosure do not compete for its
+bandwidth."""
+
+from __future__ import annotations
+
+import fnmatch
+import math
+import threading
+import time
+import typing
+from typing import Optional
+
+from mplugin import log
+
+import check_zpool_scrub
+from check_zpool_scrub import PoolScrubStatus, _collect, _zpool_scrub
+
+
+def _parse_domain(value: str) -> tuple[str, str]:
+    """Parse the argument of ``--domain PATTERN=DOMAIN``."""
+    pattern, separator, domain = value.partition("=")
+    if not separator or not pattern or not domain:
+        raise ValueError(f"Expected PATTERN=DOMAIN, got '{value}'")
+    return pattern, domain
+
+
+def _domain(pool: str, domains: list[tuple[str, str]]) -> str:
+    """The contention domain of a pool: the domain of the first matching
+    pattern or the pool itself."""
+    for pattern, domain in domains:
+        if fnmatch.fnmatchcase(pool, pattern):
+            return domain
+    return pool
+
+
+def _due_pools(
+    results: dict[str, typing.Union[PoolScrubStatus, str]], due: float
+) -> list[str]:
+    """The pools whose last scrub is older than ``due`` seconds, ranked by the
+    time left until ``--warning``. Pools that have never been scrubbed come
+    first, pools with a scrub in progress and pools that could not be probed
+    are left out."""
+    margins: dict[str, float] = {}
+    for pool, result in results.items():
+        if not isinstance(result, PoolScrubStatus) or result.progress is not None:
+            continue
+        timespan = result.last_scrub_timespan
+        if timespan is None:
+            margins[pool] = -math.inf
+        elif timespan >= due:
+            margins[pool] = check_zpool_scrub.opts.warning - timespan
+    return sorted(margins, key=margins.__getitem__)
+
+
+def _orchestrate(
+    max_scrubs: int,
+    domains: list[tuple[str, str]],
+    due: float,
+    interval: float,
+    stop: Optional[threading.Event] = None,
+) -> list[str]:
+    """Scrub the pools that are due, at most ``max_scrubs`` at a time and at
+    most one per contention domain. Scrubs in progress, also those started by
+    someone else, count against both limits.
+
+    Return as soon as the last scrub is started.
+
+    :param interval: Check every so many seconds whether a scrub has
+      finished.
+    :param stop: Return early if set.
+
+    :return: The pools whose scrub has been started."""
+    queue: Optional[list[str]] = None
+    started: list[str] = []
+    while True:
+        deadline: Optional[float] = None
+        if check_zpool_scrub.opts.timeout is not None:
+            deadline = time.monotonic() + check_zpool_scrub.opts.timeout
+        results = _collect(deadline=deadline)
+        if queue is None:
+            queue = _due_pools(results, due)
+            log.info("Pools to scrub: %s", ", ".join(queue) or "none")
+        # An exported pool is not scrubbed.
+        queue = [pool for pool in queue if pool in results]
+        running = [
+            pool
+            for pool, result in results.items()
+            if isinstance(result, PoolScrubStatus) and result.progress is not None
+        ]
+        busy = {_domain(pool, domains) for pool in running}
+        for pool in list(queue):
+            if len(running) >= max_scrubs:
+                break
+            domain = _domain(pool, domains)
+            if domain in busy:
+                continue
+            queue.remove(pool)
+            if not _zpool_scrub(pool):
+                continue
+            print(f"Started the scrub of the pool “{pool}”")
+            started.append(pool)
+            running.append(pool)
+            busy.add(domain)
+        if not queue:
+            return started
+        if stop is not None:
+            if stop.wait(interval):
+                return started
+        else:
+            time.sleep(interval)
@@ -0,0 +1,41 @@
+"""Profile a single run of the plugin with cProfile and tracemalloc, enabled
+by the environment variable ``CHECK_ZPOOL_SCRUB_PROFILE=PATH``."""
+
+from __future__ import annotations
+
+import atexit
+import cProfile
+import pstats
+import tracemalloc
+
+_TOP: int = 30
+"""The number of functions and allocation sites in the report."""
+
+
+def _write_report(profiler: cProfile.Profile, path: str) -> None:
+    """Stop profiling and write the functions with the highest cumulative
+    time and the lines that allocated the most memory to ``path``."""
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(path, "w", encoding="utf-8") as report:
+        report.write("cProfile: functions by cumulative time\n\n")
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(_TOP)
+        report.write(
+            f"tracemalloc: {current} bytes allocated, {peak} bytes at the peak\n\n"
+        )
+        report.writelines(
+            f"{statistic}\n" for statistic in snapshot.statistics("lineno")[:_TOP]
+        )
+
+
+def _start_profiler(path: str) -> cProfile.Profile:
+    """Profile the rest of the run, the report is written when the
+    interpreter exits."""
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    atexit.register(_write_report, profiler, path)
+    return profiler
@@ -0,0 +1,212 @@
+"""Read the vdev tree of a pool, the ``config:`` section of ``zpool status``
+or the ``vdevs`` objects of its JSON output, into parallel arrays.
+
+A pool with thousands of disks is read in linear time, one line after
+another, and needs a few bytes per vdev besides its name."""
+
+from __future__ import annotations
+
+import typing
+from array import array
+from typing import Optional
+
+VDEV_STATES: tuple[str, ...] = (
+    "ONLINE",
+    "AVAIL",
+    "INUSE",
+    "OFFLINE",
+    "DEGRADED",
+    "REMOVED",
+    "UNAVAIL",
+    "FAULTED",
+)
+"""The states of the vdevs from the best to the worst. The state of a vdev
+in the tree is stored as its index."""
+
+_STATE_CODES: dict[str, int] = {state: code for code, state in enumerate(VDEV_STATES)}
+
+NO_STATE: int = -1
+"""The code of the lines without a state, for example ``logs`` or
+``spares``."""
+
+_JSON_SECTIONS: tuple[str, ...] = ("dedup", "special", "logs", "l2cache", "spares")
+"""The classes of vdevs that the JSON output lists next to ``vdevs``."""
+
+_UNITS: str = "KMGTPE"
+
+
+def _to_count(value: typing.Union[str, int]) -> int:
+    """Read an error counter. ``zpool status`` abbreviates large numbers, for
+    example ``1.2K``."""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return round(float(value[:-1]) * 1024 ** (_UNITS.index(value[-1]) + 1))
+    except ValueError:
+        return 0
+
+
+class VdevTree:
+    """The vdevs of a pool in the order of the output. Vdev ``i`` is
+    described by the ``i``-th entry of each array. The pool itself is the
+    root."""
+
+    names: list[str]
+
+    parents: array[int]
+    """The index of the parent vdev, ``-1`` for the root and the classes of
+    vdevs like ``logs``."""
+
+    states: array[int]
+    """The index of the state in :data:`VDEV_STATES` or :data:`NO_STATE`."""
+
+    read_errors: array[int]
+
+    write_errors: array[int]
+
+    checksum_errors: array[int]
+
+    _stack: list[tuple[int, int]]
+    """The depth and the index of the ancestors of the next vdev."""
+
+    def __init__(self) -> None:
+        self.names = []
+        self.parents = array("i")
+        self.states = array("b")
+        self.read_errors = array("q")
+        self.write_errors = array("q")
+        self.checksum_errors = array("q")
+        self._stack = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(
+        self,
+        name: str,
+        depth: int,
+        state: Optional[str],
+        read: int = 0,
+        write: int = 0,
+        checksum: int = 0,
+    ) -> None:
+        """Append a vdev below the last vdev with a smaller depth."""
+        stack = self._stack
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        stack.append((depth, len(self.names)))
+        self.names.append(name)
+        self.parents.append(stack[-2][1] if len(stack) > 1 else -1)
+        self.states.append(
+            NO_STATE if state is None else _STATE_CODES.get(state, NO_STATE)
+        )
+        self.read_errors.append(read)
+        self.write_errors.append(write)
+        self.checksum_errors.append(checksum)
+
+    def add_line(self, line: str) -> None:
+        """Add a line of the ``config:`` section, for example
+        ``\\t    sda  ONLINE  0  0  0``. The column headers and all lines
+        that are not indented by a tab are skipped."""
+        if not line.startswith("\t"):
+            return
+        body = line[1:].rstrip("\n")
+        columns = body.split()
+        if not columns or columns[:2] == ["NAME", "STATE"]:
+            return
+        depth = (len(body) - len(body.lstrip(" "))) // 2
+        if len(columns) >= 5:
+            self.add(
+                columns[0],
+                depth,
+                columns[1],
+                _to_count(columns[2]),
+                _to_count(columns[3]),
+                _to_count(columns[4]),
+            )
+        else:
+            # A spare (``sdc  AVAIL``) or a class of vdevs (``logs``).
+            self.add(columns[0], depth, columns[1] if len(columns) > 1 else None)
+
+    @classmethod
+    def from_json(cls, pool: dict[str, typing.Any]) -> VdevTree:
+        """Read the vdevs of a pool object of ``zpool status -j``."""
+        tree = cls()
+        stack: list[tuple[int, dict[str, typing.Any]]] = []
+        for section in reversed(_JSON_SECTIONS):
+            if pool.get(section):
+                stack.append((-1, {"name": section, "vdevs": pool[section]}))
+        stack.extend((0, vdev) for vdev in reversed(pool.get("vdevs", {}).values()))
+        while stack:
+            depth, vdev = stack.pop()
+            if depth < 0:
+                # A class of vdevs, its vdevs are top-level vdevs.
+                tree.add(vdev["name"], 0, None)
+                depth = 0
+            else:
+                tree.add(
+                    vdev.get("name", ""),
+                    depth,
+                    vdev.get("state"),
+                    _to_count(vdev.get("read_errors", 0)),
+                    _to_count(vdev.get("write_errors", 0)),
+                    _to_count(vdev.get("checksum_errors", 0)),
+                )
+            stack.extend(
+                (depth + 1, child) for child in reversed(vdev.get("vdevs", {}).values())
+            )
+        return tree
+
+    def dump(self) -> dict[str, list[typing.Any]]:
+        """The arrays as lists, for example for a cache entry."""
+        return {
+            "names": self.names,
+            "parents": self.parents.tolist(),
+            "states": self.states.tolist(),
+            "read_errors": self.read_errors.tolist(),
+            "write_errors": self.write_errors.tolist(),
+            "checksum_errors": self.checksum_errors.tolist(),
+        }
+
+    @classmethod
+    def load(cls, data: dict[str, list[typing.Any]]) -> VdevTree:
+        """Restore a tree from :meth:`dump`."""
+        tree = cls()
+        tree.names = list(data["names"])
+        tree.parents = array("i", data["parents"])
+        tree.states = array("b", data["states"])
+        tree.read_errors = array("q", data["read_errors"])
+        tree.write_errors = array("q", data["write_errors"])
+        tree.checksum_errors = array("q", data["checksum_errors"])
+        return tree
+
+    def leaves(self) -> typing.Iterator[int]:
+        """The indices of the devices: the vdevs with a state but without
+        children."""
+        has_children = bytearray(len(self.names))
+        for parent in self.parents:
+            if parent >= 0:
+                has_children[parent] = 1
+        for index, state in enumerate(self.states):
+            if not has_children[index] and state != NO_STATE:
+                yield index
+
+    def errors(self) -> tuple[int, int, int]:
+        """The read, write and checksum errors summed over the devices."""
+        read = write = checksum = 0
+        for index in self.leaves():
+            read += self.read_errors[index]
+            write += self.write_errors[index]
+            checksum += self.checksum_errors[index]
+        return read, write, checksum
+
+    def worst(self) -> Optional[tuple[int, str]]:
+        """The code of the worst state and the first vdev in this state."""
+        worst = max(self.states, default=NO_STATE)
+        if worst == NO_STATE:
+            return None
+        return worst, self.names[self.states.index(worst)]
@@ -0,0 +1,112 @@
+"""Block until the scrubs of the pools have finished, so a maintenance
+pipeline does not have to run the plugin in a sleep loop."""
+
+from __future__ import annotations
+
+import queue
+import subprocess
+import threading
+import time
+import typing
+from datetime import timedelta
+from typing import Optional
+
+from mplugin import log
+
+from check_zpool_scrub import _PROBE_ERRORS, PoolScrubStatus, _collect
+
+
+def _progress_line(status: PoolScrubStatus) -> Optional[str]:
+    """``Pool “tank”: 52.05% done, 67.2 MB/s, 1:01:21 to go``, ``None`` if
+    the pool does not scrub."""
+    if status.progress is None:
+        return None
+    line = f"Pool “{status.pool}”: {status.progress * 100:.2f}% done"
+    if status.paused:
+        line += ", paused"
+    elif status.speed is not None:
+        line += f", {status.speed:g} MB/s"
+    if status.time_to_go is not None:
+        line += f", {timedelta(seconds=status.time_to_go)} to go"
+    return line
+
+
+def _report_progress(pools: typing.Collection[str]) -> None:
+    try:
+        results = _collect(next(iter(pools)) if len(pools) == 1 else None)
+    except _PROBE_ERRORS as e:
+        log.info("The progress could not be probed: %s", e)
+        return
+    except Exception:
+        # Only the progress lines are missing, the wait goes on.
+        log.exception("The progress could not be probed")
+        return
+    for pool, result in results.items():
+        if pool in pools and isinstance(result, PoolScrubStatus):
+            line = _progress_line(result)
+            if line is not None:
+                print(line, flush=True)
+
+
+def _wait(
+    pools: list[str], progress_interval: float, timeout: Optional[float] = None
+) -> list[str]:
+    """Wait for the scrubs with one ``zpool wait -t scrub POOL`` process per
+    pool. The processes block in the kernel, waiting costs no CPU time.
+
+    :param progress_interval: Print the progress of the scrubs every so many
+      seconds, ``0`` for never. Each report runs ``zpool status`` once.
+    :param timeout: Stop waiting after so many seconds.
+
+    :return: The pools that were still scrubbing when the timeout expired."""
+    processes: dict[str, subprocess.Popen[str]] = {}
+    finished: queue.Queue[tuple[str, int]] = queue.Queue()
+
+    def wait(pool: str, process: subprocess.Popen[str]) -> None:
+        finished.put((pool, process.wait()))
+
+    for pool in pools:
+        args = ["zpool", "wait", "-t", "scrub", pool]
+        processes[pool] = subprocess.Popen(
+            args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, encoding="UTF-8"
+        )
+        threading.Thread(target=wait, args=(pool, processes[pool]), daemon=True).start()
+
+    deadline: Optional[float] = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    next_report: Optional[float] = None
+    if progress_interval > 0:
+        next_report = time.monotonic() + progress_interval
+    pending: set[str] = set(processes)
+    try:
+        while pending:
+            until = min(
+                (t for t in (deadline, next_report) if t is not None), default=None
+            )
+            try:
+                pool, returncode = finished.get(
+                    timeout=None if until is None else max(until - time.monotonic(), 0)
+                )
+            except queue.Empty:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    log.info("Stopped waiting for %s", ", ".join(sorted(pending)))
+                    break
+                if next_report is not None and now >= next_report:
+                    _report_progress(pending)
+                    next_report = now + progress_interval
+                continue
+            pending.discard(pool)
+            if returncode != 0:
+                stderr = processes[pool].stderr
+                message = stderr.read().strip() if stderr is not None else ""
+                log.warning("zpool wait -t scrub %s failed: %s", pool, message)
+    finally:
+        for process in processes.values():
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            if process.stderr is not None:
+                process.stderr.close()
+    return sorted(pending)
@@ -0,0 +1,216 @@
+"""Benchmarks that run without ZFS on synthetic ``zpool`` outputs.
+
+Run ``python -m tests.benchmark --output benchmark.json`` and compare two
+versions with ``python -m tests.benchmark --compare old.json``."""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import timeit
+import typing
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime
+from unittest import mock
+
+import check_zpool_scrub
+from check_zpool_scrub import (
+    PoolResource,
+    PoolScrubStatus,
+    _contexts,
+    _parse_scan_stats,
+    _scan_pools,
+)
+from tests import helper
+
+CASES: list[tuple[int, int]] = [(1, 10), (1, 5000), (10, 100), (100, 100), (1000, 10)]
+"""The default cases as tuples of the number of pools and the number of vdevs
+per pool."""
+
+
+def measure(function: typing.Callable[[], typing.Any], repeat: int) -> dict[str, float]:
+    """Measure the time of one call of ``function`` in seconds."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [time / number for time in timer.repeat(repeat, number)]
+    return {
+        "number": number,
+        "repeat": repeat,
+        "best": min(times),
+        "mean": statistics.fmean(times),
+    }
+
+
+def run_main(argv: list[str]) -> None:
+    with (
+        mock.patch("sys.exit"),
+        mock.patch("sys.argv", ["check_zpool_scrub", *argv]),
+        redirect_stdout(io.StringIO()),
+        redirect_stderr(io.StringIO()),
+    ):
+        check_zpool_scrub.main()
+
+
+def benchmark_case(
+    pools: int, vdevs: int, repeat: int
+) -> typing.Iterator[dict[str, typing.Any]]:
+    status = helper.synthetic_zpool_status(pools, vdevs)
+    status_json = helper.synthetic_zpool_status_json(pools, vdevs)
+    output = "".join(status.values())
+    output_json = json.dumps({"pools": status_json})
+
+    def parse_text() -> dict[str, PoolScrubStatus]:
+        return {
+            pool: PoolScrubStatus(pool, record=record)
+            for pool, record in _scan_pools(io.StringIO(output)).items()
+        }
+
+    def parse_json() -> dict[str, PoolScrubStatus]:
+        return {
+            pool: PoolScrubStatus(
+                pool, record=_parse_scan_stats(data.get("scan_stats"))
+            )
+            for pool, data in json.loads(output_json)["pools"].items()
+        }
+
+    yield {"name": "parse_text", **measure(parse_text, repeat)}
+    yield {"name": "parse_json", **measure(parse_json, repeat)}
+
+    resources = [PoolResource(pool, status) for pool, status in parse_text().items()]
+    metrics = [
+        (metric, resource) for resource in resources for metric in resource.probe()
+    ]
+    for context in _contexts():
+        selected = [
+            (metric, resource)
+            for metric, resource in metrics
+            if metric.context == context.name and metric.value is not None
+        ]
+
+        def evaluate(
+            context: typing.Any = context, selected: typing.Any = selected
+        ) -> None:
+            for metric, resource in selected:
+                context.evaluate(metric, resource)
+                context.performance(metric, resource)
+
+        yield {"name": f"context_{context.name}", **measure(evaluate, repeat)}
+
+    with mock.patch.multiple(
+        helper,
+        ZPOOL_LIST=list(status),
+        ZPOOL_STATUS=status,
+        ZPOOL_STATUS_JSON=status_json,
+    ):
+        with helper.fake_zpool(json_output=False):
+            yield {"name": "main_text", **measure(lambda: run_main([]), repeat)}
+        with helper.fake_zpool(json_output=True):
+            yield {"name": "main_json", **measure(lambda: run_main([]), repeat)}
+
+
+def run(cases: list[tuple[int, int]], repeat: int) -> dict[str, typing.Any]:
+    results: list[dict[str, typing.Any]] = []
+    options = check_zpool_scrub.get_argparser().parse_args([])
+    with mock.patch("check_zpool_scrub.opts", options):
+        for pools, vdevs in cases:
+            for result in benchmark_case(pools, vdevs, repeat):
+                result = {"pools": pools, "vdevs": vdevs, **result}
+                print(
+                    f"{result['name']:<30} pools={pools:<5} vdevs={vdevs:<5} "
+                    f"{result['best'] * 1000:10.3f} ms",
+                    file=sys.stderr,
+                )
+                results.append(result)
+    return {
+        "version": check_zpool_scrub.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+def compare(
+    old: dict[str, typing.Any], new: dict[str, typing.Any], threshold: float
+) -> bool:
+    """Print the ratio of the new to the old best times.
+
+    :return: ``False`` if a benchmark got slower than the threshold."""
+
+    def key(result: dict[str, typing.Any]) -> tuple[str, int, int]:
+        return result["name"], result["pools"], result["vdevs"]
+
+    old_results = {key(result): result for result in old["results"]}
+    success = True
+    for result in new["results"]:
+        if key(result) not in old_results:
+            continue
+        ratio = result["best"] / old_results[key(result)]["best"]
+        slower = ratio > threshold
+        success = success and not slower
+        print(
+            f"{result['name']:<30} pools={result['pools']:<5} "
+            f"vdevs={result['vdevs']:<5} {ratio:6.2f}x{' SLOWER' if slower else ''}"
+        )
+    return success
+
+
+def parse_case(value: str) -> tuple[int, int]:
+    pools, vdevs = value.split(":")
+    return int(pools), int(vdevs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.benchmark", description=__doc__
+    )
+    parser.add_argument(
+        "--case",
+        metavar="POOLS:VDEVS",
+        action="append",
+        type=parse_case,
+        help="The number of pools and of vdevs per pool, can be specified multiple "
+        f"times (default: {' '.join(f'{p}:{v}' for p, v in CASES)}).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Repeat each measurement so many times (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--output", metavar="PATH", help="Write the results as JSON to a file."
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="PATH",
+        help="Compare the results with the results of a previous run.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Exit with 1 if a benchmark is slower than the previous run by this "
+        "factor (default: %(default)s).",
+    )
+    args = parser.parse_args()
+
+    results = run(args.case or CASES, args.repeat)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as file:
+            if not compare(json.load(file), results, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,26 @@
 from __future__ import annotations
 
 import io
+import json
+import os
 import subprocess
+import tempfile
+import threading
 import typing
-from contextlib import redirect_stderr, redirect_stdout
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from pathlib import Path
+from types import TracebackType
 from unittest import mock
 
+import pytest
 from freezegun import freeze_time
 from mplugin.testing import MockResult
 
 import check_zpool_scrub
 
+if typing.TYPE_CHECKING:
+    from typing_extensions import Self
+
 
 def run(args: list[str]) -> subprocess.CompletedProcess[str]:
     return subprocess.run(
@@ -21,18 +31,11 @@ def run(args: list[str]) -> subprocess.CompletedProcess[str]:
     )
 
 
-def execute_main(
-    argv: list[str] = ["check_zpool_scrub"],
-    time: str = "2017-08-17 10:25:48",
-) -> MockResult:
-    def perform_subprocess_output(args: list[str], **kwargs: typing.Any) -> str:
-        command: str = " ".join(args)
-
-        if command == "zpool status unknown_zpool":
-            return ""
-
-        elif command == "zpool status first_ok_zpool":
-            return """  pool: first_ok_zpool
+ZPOOL_STATUS: dict[str, str] = {
+    "unknown_zpool": """  pool: unknown_zpool
+ state: ONLINE
+""",
+    "first_ok_zpool": """  pool: first_ok_zpool
  state: ONLINE
   scan: scrub in progress since Thu Aug 17 10:25:48 2017
     9,12T scanned out of 9,48T at 1,90M/s, 55h33m to go
@@ -45,9 +48,8 @@ config:
 	    ata-ST3000DM001-1CH166_Z1F324L3  ONLINE       0     0     0
 
 errors: No known data errors
-"""
-        elif command == "zpool status last_ok_zpool":
-            return """  pool: first_ok_zpool
+""",
+    "last_ok_zpool": """  pool: last_ok_zpool
  state: ONLINE
   scan: scrub in progress since Mon Jul 17 10:25:48 2017
     9,12T scanned out of 9,48T at 1,90M/s, 55h33m to go
@@ -60,9 +62,8 @@ config:
 	    ata-ST3000DM001-1CH166_Z1F324L3  ONLINE       0     0     0
 
 errors: No known data errors
-"""
-        elif command == "zpool status first_warning_zpool":
-            return """  pool: data
+""",
+    "first_warning_zpool": """  pool: first_warning_zpool
  state: ONLINE
   scan: scrub in progress since Mon Jul 17 10:25:47 2017
     7,34T scanned out of 10,1T at 57,4M/s, 14h12m to go
@@ -75,9 +76,8 @@ config:
 	    ata-WDC_WD30EZRX-00SPEB0_WD-WCC4EHYCFSFV  ONLINE       0     0     0
 
 errors: No known data errors
-"""
-        elif command == "zpool status last_warning_zpool":
-            return """  pool: data
+""",
+    "last_warning_zpool": """  pool: last_warning_zpool
  state: ONLINE
   scan: scrub in progress since Fri Jun 16 10:25:48 2017
     7,34T scanned out of 10,1T at 57,4M/s, 14h12m to go
@@ -91,9 +91,8 @@ config:
 
 errors: No known data errors
 
-"""
-        elif command == "zpool status first_critical_zpool":
-            return """  pool: data
+""",
+    "first_critical_zpool": """  pool: first_critical_zpool
  state: ONLINE
   scan: scrub repaired 0 in 266h29m with 0 errors on Fri Jun 16 10:25:47 2017
 config:
@@ -104,9 +103,8 @@ config:
 	    ata-TOSHIBA_MD04ACA400_9614KMR9FSAA  ONLINE       0     0     0
 
 errors: No known data errors
-"""
-        elif command == "zpool status never_scrubbed_zpool":
-            return """  pool: never_scrubbed_zpool
+""",
+    "never_scrubbed_zpool": """  pool: never_scrubbed_zpool
  state: ONLINE
   scan: none requested
 config:
@@ -118,10 +116,9 @@ config:
 	    ada1p3     ONLINE       0     0     0
 
 errors: No known data errors
-"""
-        # see https://github.com/Josef-Friedrich/check_zpool_scrub/issues/11
-        elif command == "zpool status days_to_go":
-            return """  pool: days_to_go
+""",
+    # see https://github.com/Josef-Friedrich/check_zpool_scrub/issues/11
+    "days_to_go": """  pool: days_to_go
  state: ONLINE
   scan: scrub in progress since Thu Aug 17 10:25:48 2017
         461G scanned at 120M/s, 258G issued at 67.2M/s, 496G total
@@ -134,11 +131,9 @@ config:
             ata-SanDisk_SDSSD            ONLINE       0     0     0  (trimming)
             ata-SanDisk_SDSSD            ONLINE       0     0     0  (trimming)
 
-"""
-        # https://github.com/Josef-Friedrich/check_zpool_scrub/issues/11#issuecomment-850798342
-
-        elif command == "zpool status time_to_go_colons":
-            return """  pool: time_to_go_colons
+""",
+    # https://github.com/Josef-Friedrich/check_zpool_scrub/issues/11#issuecomment-850798342
+    "time_to_go_colons": """  pool: time_to_go_colons
  state: ONLINE
   scan: scrub in progress since Thu Aug 17 10:25:48 2017
         461G scanned at 120M/s, 258G issued at 67.2M/s, 496G total
@@ -151,18 +146,451 @@ config:
             ata-SanDisk_SDSSD            ONLINE       0     0     0  (trimming)
             ata-SanDisk_SDSSD            ONLINE       0     0     0  (trimming)
 
+""",
+}
+
+
+ZPOOL_LIST: list[str] = [
+    "unknown_zpool",
+    "never_scrubbed_zpool",
+    "first_ok_zpool",
+    "last_ok_zpool",
+    "first_warning_zpool",
+    "last_warning_zpool",
+    "first_critical_zpool",
+]
+"""The pools that ``zpool list -H -o name`` and ``zpool status`` (without a
+pool argument) report."""
+
+
+ZPOOL_IOSTAT: dict[str, str] = {
+    # OpenZFS 2.2: name, alloc, free, ops, bandwidth, total_wait, disk_wait,
+    # syncq_wait, asyncq_wait (read and write), scrub_wait, trim_wait,
+    # rebuild_wait. The latencies are in nanoseconds.
+    "first_ok_zpool": "first_ok_zpool\t1099511627776\t2199023255552\t120\t30"
+    "\t125829120\t1048576\t8500000\t2000000\t4000000\t1500000\t-\t-"
+    "\t3000000\t400000\t25000000\t-\t-",
+    "last_ok_zpool": "last_ok_zpool\t1099511627776\t2199023255552\t0\t0\t0"
+    "\t0\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-",
+}
+"""The output of ``zpool iostat -H -p -l -y``."""
+
+
+ZPOOL_STATUS_JSON: dict[str, typing.Any] = {
+    # now: 1502965548 (2017-08-17 10:25:48)
+    "json_in_progress_zpool": {
+        "name": "json_in_progress_zpool",
+        "state": "ONLINE",
+        "scan_stats": {
+            "function": "SCRUB",
+            "state": "SCANNING",
+            "start_time": 1502961948,
+            "end_time": 0,
+            "to_examine": 100 * 1024**3,
+            "examined": 60 * 1024**3,
+            "skipped": 0,
+            "processed": 0,
+            "errors": 0,
+            "bytes_per_scan": 60 * 1024**3,
+            "pass_start": 1502961948,
+            "scrub_pause": 0,
+            "scrub_spent_paused": 0,
+            "issued_bytes_per_scan": 50 * 1024**3,
+            "issued": 50 * 1024**3,
+        },
+    },
+    "json_finished_zpool": {
+        "name": "json_finished_zpool",
+        "state": "ONLINE",
+        "scan_stats": {
+            "function": "SCRUB",
+            "state": "FINISHED",
+            "start_time": 1500279948,
+            "end_time": 1500287148,
+            "to_examine": 100 * 1024**3,
+            "examined": 100 * 1024**3,
+            "skipped": 0,
+            "processed": 0,
+            "errors": 0,
+            "bytes_per_scan": 100 * 1024**3,
+            "pass_start": 1500279948,
+            "scrub_pause": 0,
+            "scrub_spent_paused": 0,
+            "issued_bytes_per_scan": 100 * 1024**3,
+            "issued": 100 * 1024**3,
+        },
+    },
+    "json_never_scrubbed_zpool": {
+        "name": "json_never_scrubbed_zpool",
+        "state": "ONLINE",
+    },
+}
+"""The ``pools`` object of the output of ``zpool status -j --json-int``
+(OpenZFS 2.3+)."""
+
+
+def synthetic_zpool_status(pools: int, vdevs: int) -> dict[str, str]:
+    """Generate the output of ``zpool status`` for many pools with many vdevs,
+    for example for benchmarks.
+
+    The ``scan:`` blocks are taken in turn from the pools of
+    :data:`ZPOOL_STATUS`, the ``config:`` sections contain ``vdevs`` disks in
+    raidz2 groups of ten.
+
+    :return: The sections of the output with the pool names as keys."""
+    sections: dict[str, str] = {}
+    for i in range(pools):
+        template = ZPOOL_LIST[i % len(ZPOOL_LIST)]
+        name = f"pool{i:04d}"
+        head = ZPOOL_STATUS[template].split("config:")[0]
+        lines: list[str] = [
+            head.replace(f"pool: {template}", f"pool: {name}"),
+            "config:\n\n",
+            "\tNAME                                 STATE     READ WRITE CKSUM\n",
+            f"\t{name:<36} ONLINE       0     0     0\n",
+        ]
+        for vdev in range(vdevs):
+            if vdev % 10 == 0:
+                lines.append(
+                    f"\t  raidz2-{vdev // 10:<28} ONLINE       0     0     0\n"
+                )
+            lines.append(
+                f"\t    ata-ST3000DM001-1CH166_Z{vdev:07d}  ONLINE       0     0     0\n"
+            )
+        lines.append("\nerrors: No known data errors\n")
+        sections[name] = "".join(lines)
+    return sections
+
+
+def synthetic_zpool_status_json(pools: int, vdevs: int) -> dict[str, typing.Any]:
+    """Generate the ``pools`` object of ``zpool status -j --json-int`` for
+    many pools with many vdevs, see :func:`synthetic_zpool_status`."""
+    templates = list(ZPOOL_STATUS_JSON.values())
+    result: dict[str, typing.Any] = {}
+    for i in range(pools):
+        name = f"pool{i:04d}"
+        groups: dict[str, typing.Any] = {}
+        for vdev in range(vdevs):
+            group = groups.setdefault(
+                f"raidz2-{vdev // 10}",
+                {"name": f"raidz2-{vdev // 10}", "vdev_type": "raidz", "vdevs": {}},
+            )
+            disk = f"ata-ST3000DM001-1CH166_Z{vdev:07d}"
+            group["vdevs"][disk] = {
+                "name": disk,
+                "vdev_type": "disk",
+                "state": "ONLINE",
+                "read_errors": 0,
+                "write_errors": 0,
+                "checksum_errors": 0,
+            }
+        result[name] = {
+            **templates[i % len(templates)],
+            "name": name,
+            "vdevs": {name: {"name": name, "vdev_type": "root", "vdevs": groups}},
+        }
+    return result
+
+
+ZPOOL_EVENTS: str = """Aug 17 2017 09:25:48.000000000\tsysevent.fs.zfs.scrub_start
+        version = 0x0
+        class = "sysevent.fs.zfs.scrub_start"
+        pool = "first_ok_zpool"
+        pool_guid = 0x2a7c7c3a3ea6ac1b
+        pool_state = 0x0
+        pool_context = 0x0
+        time = 0x5995611c 0x0
+        eid = 0x1
+
+Aug 17 2017 10:26:48.000000000\tsysevent.fs.zfs.config_sync
+        version = 0x0
+        class = "sysevent.fs.zfs.config_sync"
+        pool = "last_ok_zpool"
+        time = 0x59956f68 0x0
+        eid = 0x2
+
+Aug 17 2017 10:26:48.500000000\tsysevent.fs.zfs.scrub_finish
+        version = 0x0
+        class = "sysevent.fs.zfs.scrub_finish"
+        pool = "first_ok_zpool"
+        pool_guid = 0x2a7c7c3a3ea6ac1b
+        pool_state = 0x0
+        pool_context = 0x0
+        time = 0x59956f68 0x1dcd6500
+        eid = 0x3
+
+Aug 17 2017 10:26:48.600000000\tsysevent.fs.zfs.pool_export
+        version = 0x0
+        class = "sysevent.fs.zfs.pool_export"
+        pool = "last_ok_zpool"
+        time = 0x59956f68 0x23c34600
+        eid = 0x4
+
 """
-        elif command == "zpool list -H -o name":
-            return """unknown_zpool
-never_scrubbed_zpool
-first_ok_zpool
-last_ok_zpool
-first_warning_zpool
-last_warning_zpool
-first_critical_zpool"""
+"""The output of ``zpool events -f -v -H``: a scrub start an hour before
+:func:`execute_main`'s time, a config sync, a scrub finish and an export a
+minute after it."""
+
+ZPOOL_HISTORY: dict[str, str] = {
+    "first_ok_zpool": """History for 'first_ok_zpool':
+2017-06-16.08:00:00 zpool create first_ok_zpool raidz1 sda sdb sdc
+2017-06-17.10:00:00 [txg:100] scan setup func=1 mintxg=0 maxtxg=100 [on host]
+2017-06-17.10:00:00 zpool scrub first_ok_zpool [user 0 (root) on host:linux]
+2017-06-17.14:00:00 [txg:200] scan done errors=0 [on host]
+2017-07-01.02:00:00 [txg:300] scan setup func=2 mintxg=3 maxtxg=300 [on host]
+2017-07-01.03:00:00 [txg:310] scan done errors=0 [on host]
+2017-07-17.10:00:00 [txg:400] scan setup func=1 mintxg=0 maxtxg=400 [on host]
+2017-07-17.11:00:00 [txg:410] scan cancelled errors=0 [on host]
+2017-07-17.12:00:00 [internal pool scrub txg:420] func=1 mintxg=0 maxtxg=420
+2017-07-17.18:00:00 [internal pool scrub done txg:500] complete=1
+2017-08-17.10:25:48 [txg:600] scan setup func=1 mintxg=0 maxtxg=600 [on host]
+""",
+}
+"""The output of ``zpool history -il POOL``: a scrub of 4 hours, a resilver,
+a canceled scrub, a scrub of 6 hours in the format of older releases and the
+scrub in progress."""
+
+HUNG_ZPOOL: str = "hung_zpool"
+"""``zpool status`` blocks on this pool until the command is killed."""
+
+json_supported: bool = False
+"""Whether the mocked ``zpool`` command supports the JSON output."""
+
+executed_commands: list[str] = []
+"""The commands that have been executed by the last call of
+:func:`execute_main`."""
+
+
+def perform_subprocess_output(args: list[str], **kwargs: typing.Any) -> str:
+    command: str = " ".join(args)
+    executed_commands.append(command)
+
+    if "-j" in args:
+        if not json_supported:
+            # usage error of older zpool versions: invalid option 'j'
+            raise subprocess.CalledProcessError(2, args)
+        if args[-1] == HUNG_ZPOOL:
+            raise subprocess.TimeoutExpired(args, kwargs.get("timeout") or 0)
+        pools = ZPOOL_STATUS_JSON
+        if args[-1] != "--json-int":
+            if args[-1] not in ZPOOL_STATUS_JSON:
+                raise subprocess.CalledProcessError(1, args)
+            pools = {args[-1]: ZPOOL_STATUS_JSON[args[-1]]}
+        return json.dumps(
+            {
+                "output_version": {
+                    "command": "zpool status",
+                    "vers_major": 0,
+                    "vers_minor": 1,
+                },
+                "pools": pools,
+            }
+        )
+
+    elif command.startswith("zpool iostat "):
+        selected = [arg for arg in args[2:-2] if not arg.startswith("-")]
+        return "\n".join(
+            line
+            for pool, line in ZPOOL_IOSTAT.items()
+            if not selected or pool in selected
+        )
+
+    elif command.startswith("zpool history -il "):
+        return ZPOOL_HISTORY.get(args[-1], f"History for '{args[-1]}':\n")
+
+    elif command == "zpool events -f -v -H":
+        return ZPOOL_EVENTS
+
+    elif command == "zpool list -H -o name":
+        return "\n".join(ZPOOL_LIST)
+
+    elif command == "zpool status":
+        return "".join(ZPOOL_STATUS[pool] for pool in ZPOOL_LIST)
+
+    elif command.startswith("zpool status "):
+        pool = args[-1]
+        if pool not in ZPOOL_STATUS:
+            raise subprocess.CalledProcessError(1, args)
+        return ZPOOL_STATUS[pool]
+
+    return ""
+
+
+class HangingOutput:
+    """The output of a command that blocks until it is killed."""
+
+    killed: threading.Event
+
+    def __init__(self) -> None:
+        self.killed = threading.Event()
+
+    def __iter__(self) -> typing.Iterator[str]:
+        self.killed.wait(timeout=10)
+        return iter(())
+
+    def read1(self, size: int = -1) -> bytes:
+        self.killed.wait(timeout=10)
+        return b""
+
+
+class FakePopen:
+    """Replaces :class:`subprocess.Popen` and serves the output of
+    :func:`perform_subprocess_output` line by line, or as bytes if no
+    encoding is specified."""
+
+    args: list[str]
+    stdout: typing.Union[io.StringIO, io.BytesIO, HangingOutput]
+    stderr: io.StringIO
+    returncode: typing.Optional[int]
+    terminated: bool
+
+    def __init__(self, args: list[str], **kwargs: typing.Any) -> None:
+        self.args = args
+        self.stderr = io.StringIO()
+        self.returncode = None
+        self.terminated = False
+        if args[-1] == HUNG_ZPOOL:
+            executed_commands.append(" ".join(args))
+            self.stdout = HangingOutput()
+            self.__exitcode = 0
+            return
+        output: str = ""
+        try:
+            output = perform_subprocess_output(args)
+            self.__exitcode = 0
+        except subprocess.CalledProcessError as e:
+            self.__exitcode = e.returncode
+        if kwargs.get("encoding") is None:
+            self.stdout = io.BytesIO(output.encode())
+        else:
+            self.stdout = io.StringIO(output)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: typing.Optional[type[BaseException]],
+        exc: typing.Optional[BaseException],
+        traceback: typing.Optional[TracebackType],
+    ) -> None:
+        self.wait()
+
+    def poll(self) -> typing.Optional[int]:
+        return self.returncode
+
+    def terminate(self) -> None:
+        self.terminated = True
+        self.__exitcode = -15
+
+    def kill(self) -> None:
+        self.terminated = True
+        self.__exitcode = -9
+        if isinstance(self.stdout, HangingOutput):
+            self.stdout.killed.set()
+
+    def wait(self, timeout: typing.Optional[float] = None) -> int:
+        self.returncode = self.__exitcode
+        return self.returncode
+
+
+@contextmanager
+def no_pool_discovery() -> typing.Iterator[None]:
+    """Hide the pools of the host running the tests, so the pools are always
+    listed by the mocked ``zpool list``."""
+    with (
+        mock.patch("check_zpool_scrub._KSTAT_DIR", "/nonexistent/kstat/zfs"),
+        mock.patch("check_zpool_scrub._ZPOOL_CACHE", "/nonexistent/zpool.cache"),
+    ):
+        yield
+
+
+@contextmanager
+def runtime_directory() -> typing.Iterator[None]:
+    """Keep the default cache file of each run apart, so a run does not take
+    the JSON support of the ``zpool`` of an earlier test."""
+    with (
+        tempfile.TemporaryDirectory() as directory,
+        mock.patch.dict(os.environ, {"RUNTIME_DIRECTORY": directory}),
+    ):
+        yield
+
 
-        return ""
+@contextmanager
+def fake_zpool(json_output: bool = False) -> typing.Iterator[None]:
+    """Replace the ``zpool`` command by the fixtures of this module.
 
+    :param json_output: Simulate a ``zpool`` command that supports the JSON
+      output (OpenZFS 2.3+)."""
+    global json_supported
+    json_supported = json_output
+    executed_commands.clear()
+    with (
+        runtime_directory(),
+        mock.patch(
+            "check_zpool_scrub.subprocess.check_output",
+            side_effect=perform_subprocess_output,
+        ),
+        mock.patch("check_zpool_scrub.subprocess.Popen", FakePopen),
+        mock.patch("check_zpool_scrub._zpool_status_json_supported", None),
+        no_pool_discovery(),
+    ):
+        yield
+
+
+FAKE_ZPOOL_DIR: str = os.path.join(os.path.dirname(__file__), "fake_zpool")
+"""The directory of the ``zpool`` simulator."""
+
+
+@contextmanager
+def zpool_simulator(**config: typing.Any) -> typing.Iterator[None]:
+    """Put the ``zpool`` simulator in front of ``PATH``, so the plugin runs the
+    real subprocesses.
+
+    :param config: The configuration of the simulator, for example
+      ``pools=100`` for the environment variable ``FAKE_ZPOOL_POOLS=100``. See
+      ``tests/fake_zpool/zpool``."""
+    environ = {f"FAKE_ZPOOL_{key.upper()}": str(value) for key, value in config.items()}
+    environ["PATH"] = FAKE_ZPOOL_DIR + os.pathsep + os.environ.get("PATH", "")
+    with (
+        runtime_directory(),
+        mock.patch.dict(os.environ, environ),
+        mock.patch("check_zpool_scrub._zpool_status_json_supported", None),
+        no_pool_discovery(),
+    ):
+        yield
+
+
+def write_scenario(tmp_path: Path, *pools: dict[str, object]) -> Path:
+    """Write a scenario file for the ``zpool`` simulator, see
+    ``FAKE_ZPOOL_SCENARIO`` in ``tests/fake_zpool/zpool``."""
+    path = tmp_path / "scenario.json"
+    path.write_text(json.dumps({"pools": list(pools)}))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def options() -> typing.Iterator[None]:
+    """The default options for the tests that call the functions of the plugin
+    directly instead of :func:`check_zpool_scrub.main`. Import it to use it
+    in a test module."""
+    # The dates parsed under freeze_time are instances of FakeDatetime.
+    check_zpool_scrub._parse_ctime.cache_clear()
+    with mock.patch(
+        "check_zpool_scrub.opts", check_zpool_scrub.get_argparser().parse_args([])
+    ):
+        yield
+    check_zpool_scrub._parse_ctime.cache_clear()
+
+
+def execute_main(
+    argv: list[str] = ["check_zpool_scrub"],
+    time: str = "2017-08-17 10:25:48",
+    json_output: bool = False,
+) -> MockResult:
+    """
+    :param json_output: Simulate a ``zpool`` command that supports the JSON
+      output (OpenZFS 2.3+)."""
     if not argv or argv[0] != "check_zpool_scrub":
         argv.insert(0, "check_zpool_scrub")
 
@@ -171,10 +599,7 @@ first_critical_zpool"""
 
     with (
         mock.patch("sys.exit") as sys_exit,
-        mock.patch(
-            "check_zpool_scrub.subprocess.check_output",
-            side_effect=perform_subprocess_output,
-        ),
+        fake_zpool(json_output),
         mock.patch("sys.argv", argv),
         freeze_time(time),
         redirect_stdout(file_stdout),
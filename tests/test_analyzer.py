@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+import tarfile
+import typing
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from freezegun import freeze_time
+
+from check_zpool_scrub.analyzer import (
+    _analyze,
+    _analyze_all,
+    _read_inputs,
+    _write_rows,
+)
+from tests.helper import (
+    ZPOOL_STATUS,
+    ZPOOL_STATUS_JSON,
+    execute_main,
+    options,  # noqa: F401 (autouse)
+)
+
+
+def capture(*pools: str) -> bytes:
+    return "".join(ZPOOL_STATUS[pool] for pool in pools).encode()
+
+
+def write_corpus(tmp_path: Path) -> Path:
+    corpus = tmp_path / "corpus"
+    (corpus / "rack1").mkdir(parents=True)
+    (corpus / "rack1" / "host1").write_bytes(
+        capture("first_ok_zpool", "first_critical_zpool")
+    )
+    (corpus / "rack1" / "host2").write_bytes(capture("last_warning_zpool"))
+    (corpus / "host3.json").write_text(json.dumps({"pools": ZPOOL_STATUS_JSON}))
+    return corpus
+
+
+def states(rows: typing.Iterable[dict[str, typing.Any]]) -> list[tuple[str, ...]]:
+    return [(row["source"], row["pool"], row["state"]) for row in rows]
+
+
+@freeze_time("2017-08-17 10:25:48")
+def test_directory(tmp_path: Path) -> None:
+    corpus = write_corpus(tmp_path)
+    rows = list(_analyze_all(_read_inputs([str(corpus)]), 1))
+    text = states(rows)[-3:]
+    assert text == [
+        (f"{corpus}/rack1/host1", "first_ok_zpool", "ok"),
+        (f"{corpus}/rack1/host1", "first_critical_zpool", "critical"),
+        (f"{corpus}/rack1/host2", "last_warning_zpool", "warning"),
+    ]
+    assert {row["source"] for row in rows[:-3]} == {f"{corpus}/host3.json"}
+    assert {row["pool"] for row in rows[:-3]} == set(ZPOOL_STATUS_JSON)
+    assert rows[-2]["last_scrub"] == "2017-06-16T10:25:47"
+    assert rows[-2]["last_scrub_timespan"] == 5356801
+
+
+@freeze_time("2017-08-17 10:25:48")
+def test_tar_stream_from_stdin(tmp_path: Path) -> None:
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        data = capture("first_ok_zpool")
+        info = tarfile.TarInfo("hosts/host1")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        tar.addfile(tarfile.TarInfo("empty"))
+    stdin = mock.Mock(buffer=io.BufferedReader(io.BytesIO(archive.getvalue())))
+    with mock.patch("sys.stdin", stdin):
+        rows = list(_analyze_all(_read_inputs(["-"]), 1))
+    assert states(rows) == [
+        ("-:hosts/host1", "first_ok_zpool", "ok"),
+        ("-:empty", "", "unknown"),
+    ]
+    assert rows[1]["output"] == "No pool found"
+
+
+@pytest.mark.parametrize(
+    "capture",
+    [
+        {"pools": []},
+        {"pools": {"tank": "ONLINE"}},
+        {"pools": {"tank": {"scan_stats": {"function": "SCRUB"}}}},
+    ],
+)
+def test_malformed_json(capture: dict[str, typing.Any]) -> None:
+    rows = _analyze("host1.json", json.dumps(capture).encode())
+    assert states(rows) == [("host1.json", "", "unknown")]
+    assert rows[0]["output"].startswith("Invalid capture: ")
+
+
+def test_process_pool(tmp_path: Path) -> None:
+    corpus = write_corpus(tmp_path)
+    for index in range(10):
+        (corpus / f"host{index:02d}").write_bytes(capture("never_scrubbed_zpool"))
+    inputs = list(_read_inputs([str(corpus)]))
+    assert states(_analyze_all(inputs, 3)) == states(_analyze_all(inputs, 1))
+
+
+@freeze_time("2017-08-17 10:25:48")
+def test_csv(tmp_path: Path) -> None:
+    out = io.StringIO()
+    rows = _analyze_all(_read_inputs([str(write_corpus(tmp_path) / "rack1")]), 1)
+    counts = _write_rows(rows, "csv", out)
+    assert counts == {"ok": 1, "warning": 1, "critical": 1, "unknown": 0}
+    out.seek(0)
+    table = list(csv.DictReader(out))
+    assert table[0]["progress"] == "0.9619"
+    assert table[1]["progress"] == ""
+    assert table[1]["output"].startswith("ZPOOL_SCRUB CRITICAL - ")
+
+
+def test_main(tmp_path: Path) -> None:
+    corpus = write_corpus(tmp_path)
+    result = execute_main(
+        ["--analyze", str(corpus / "rack1"), "--analyze-format", "jsonl", "--jobs", "1"]
+    )
+    assert result.stdout is not None
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [row["state"] for row in rows] == ["ok", "critical", "warning"]
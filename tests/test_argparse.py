@@ -11,6 +11,7 @@ class TestWithSubprocess:
         process = run(["--help"])
         assert process.returncode == 3
         assert "usage: check_zpool_scrub" in process.stdout
+        assert "@" not in process.stdout.replace("josef@friedrich.rocks", "")
 
     def test_version(self) -> None:
         process = run(
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from check_zpool_scrub import PoolResource
+from check_zpool_scrub.checkmk import _format_line
+from tests.helper import execute_main, executed_commands
+
+
+def test_all_pools() -> None:
+    result = execute_main(["--checkmk"])
+    assert result.stdout is not None
+    lines = result.stdout.splitlines()
+    assert lines[0] == "<<<zpool_scrub:sep(9)>>>"
+    assert [line.split("\t")[0] for line in lines[1:]] == [
+        "unknown_zpool",
+        "never_scrubbed_zpool",
+        "first_ok_zpool",
+        "last_ok_zpool",
+        "first_warning_zpool",
+        "last_warning_zpool",
+        "first_critical_zpool",
+    ]
+    assert lines[3].split("\t") == [
+        "first_ok_zpool",
+        "progress=0.9619",
+        "speed=1.9",
+        "time_to_go=199980",
+        "last_scrub_timestamp=1502965548",
+        "last_scrub_timespan=0",
+        "scanned=10027546045317",
+        "total=10423370231316",
+        "repaired=0",
+    ]
+    # One agent run covers all pools with a single 'zpool status'.
+    assert executed_commands == ["zpool status -j --json-int", "zpool status"]
+
+
+def test_cached(tmp_path: Path) -> None:
+    argv = ["-p", "first_ok_zpool", "--checkmk", "--cache-ttl", "300"]
+    argv += ["--cache-file", str(tmp_path / "cache.json")]
+    first = execute_main(list(argv), time="2017-08-17 10:25:48")
+    assert first.stdout is not None
+    assert first.stdout.splitlines()[0] == (
+        "<<<zpool_scrub:sep(9):cached(1502965548,300)>>>"
+    )
+    second = execute_main(list(argv), time="2017-08-17 10:26:18")
+    # Served from the same cache as the check.
+    assert executed_commands == []
+    assert second.stdout is not None
+    assert "time_to_go=199950" in second.stdout
+    # The section is as old as the cache entry.
+    assert second.stdout.splitlines()[0] == (
+        "<<<zpool_scrub:sep(9):cached(1502965548,300)>>>"
+    )
+
+
+def test_error() -> None:
+    line = _format_line(PoolResource("tank", error="no answer\nwithin 0.1s"))
+    assert line == "tank\terror=Pool “tank”: no answer within 0.1s"
@@ -0,0 +1,133 @@
+import json
+import typing
+from pathlib import Path
+from unittest import mock
+
+from check_zpool_scrub.durations import (
+    ScrubDurations,
+    _Parser,
+    checkpoint_file,
+)
+from tests.helper import ZPOOL_HISTORY, ZPOOL_STATUS, execute_main, executed_commands
+
+HOURS: int = 3600
+
+HISTORY: str = ZPOOL_HISTORY["first_ok_zpool"]
+
+FINISH: str = "2017-08-17.16:25:48 [txg:700] scan done errors=0 [on host]\n"
+
+FINISHED: str = ZPOOL_STATUS["first_ok_zpool"].replace(
+    """scrub in progress since Thu Aug 17 10:25:48 2017
+    9,12T scanned out of 9,48T at 1,90M/s, 55h33m to go
+    0 repaired, 96,19% done""",
+    "scrub repaired 0 in 6h0m with 0 errors on Thu Aug 17 16:25:48 2017",
+)
+"""``zpool status`` after the scrub in progress has finished."""
+
+CANCEL: str = "2017-08-17.11:25:48 [txg:650] scan cancelled errors=0 [on host]\n"
+
+CANCELED: str = FINISHED.replace(
+    "scrub repaired 0 in 6h0m with 0 errors on Thu Aug 17 16:25:48 2017",
+    "scrub canceled on Thu Aug 17 11:25:48 2017",
+)
+"""``zpool status`` after the scrub in progress has been canceled."""
+
+
+def parse(output: str, parser: typing.Optional[_Parser] = None) -> _Parser:
+    parser = parser or _Parser()
+    parser.feed(output.splitlines(keepends=True))
+    return parser
+
+
+def test_durations() -> None:
+    parser = parse(HISTORY)
+    assert parser.durations() == ScrubDurations(
+        last=6 * HOURS, mean=5 * HOURS, interval=30 * 24 * HOURS + 2 * HOURS
+    )
+    # The scrub in progress
+    assert parser.start is not None
+    assert (parser.time, parser.seen) == ("2017-08-17.10:25:48", 1)
+
+
+def test_no_scrub() -> None:
+    assert parse("History for 'tank':\n").durations() == ScrubDurations()
+
+
+def test_checkpoint() -> None:
+    checkpoint = parse(HISTORY).checkpoint()
+    # The events before the checkpoint are not parsed again.
+    history = HISTORY.replace("scan done errors=0", "scan cancelled errors=0", 1)
+    parser = parse(history + FINISH, _Parser(json.loads(json.dumps(checkpoint))))
+    assert len(parser.scrubs) == 3
+    assert parser.durations().last == 6 * HOURS
+    assert parser.start is None
+
+
+def test_same_second() -> None:
+    lines = HISTORY.splitlines(keepends=True)
+    # The checkpoint is taken between two lines of the same second.
+    checkpoint = parse("".join(lines[:3])).checkpoint()
+    assert (checkpoint["time"], checkpoint["seen"]) == ("2017-06-17.10:00:00", 1)
+    parser = parse(HISTORY, _Parser(checkpoint))
+    assert parser.durations() == parse(HISTORY).durations()
+
+
+def test_main(tmp_path: Path) -> None:
+    directory = tmp_path / "durations"
+    argv = ["-p", "first_ok_zpool", "--durations-dir", str(directory)]
+    result = execute_main(list(argv))
+    assert result.first_line is not None
+    for perfdata in (
+        "'first_ok_zpool: last_scrub_duration'=21600s",
+        "'first_ok_zpool: mean_scrub_duration'=18000s",
+        "'first_ok_zpool: scrub_interval'=2599200s",
+    ):
+        assert perfdata in result.first_line
+    assert Path(checkpoint_file(str(directory), "first_ok_zpool")).exists()
+
+    with (
+        mock.patch.dict(
+            "tests.helper.ZPOOL_HISTORY", {"first_ok_zpool": HISTORY + FINISH}
+        ),
+        mock.patch.dict("tests.helper.ZPOOL_STATUS", {"first_ok_zpool": FINISHED}),
+    ):
+        result = execute_main(list(argv), time="2017-08-17 16:30:00")
+    assert result.first_line is not None
+    assert "'first_ok_zpool: mean_scrub_duration'=19200s" in result.first_line
+    assert "'first_ok_zpool: scrub_interval'=2635974s" in result.first_line
+
+
+def test_checkpoint_covers_last_scrub(tmp_path: Path) -> None:
+    argv = ["-p", "first_ok_zpool", "--durations-dir", str(tmp_path)]
+    execute_main(list(argv))
+    assert "zpool history -il first_ok_zpool" in executed_commands
+    # The checkpoint already has the start of the scrub in progress.
+    with mock.patch("check_zpool_scrub.durations.subprocess.Popen") as popen:
+        second = execute_main(list(argv), time="2017-08-17 10:30:00")
+    popen.assert_not_called()
+    assert second.first_line is not None
+    assert "'first_ok_zpool: scrub_interval'=2599200s" in second.first_line
+
+
+def test_checkpoint_covers_canceled_scrub(tmp_path: Path) -> None:
+    argv = ["-p", "first_ok_zpool", "--durations-dir", str(tmp_path)]
+    with (
+        mock.patch.dict(
+            "tests.helper.ZPOOL_HISTORY", {"first_ok_zpool": HISTORY + CANCEL}
+        ),
+        mock.patch.dict("tests.helper.ZPOOL_STATUS", {"first_ok_zpool": CANCELED}),
+    ):
+        execute_main(list(argv), time="2017-08-17 12:00:00")
+        assert "zpool history -il first_ok_zpool" in executed_commands
+        second = execute_main(list(argv), time="2017-08-17 12:05:00")
+        assert "zpool history -il first_ok_zpool" not in executed_commands
+    assert second.first_line is not None
+    assert "'first_ok_zpool: last_scrub_duration'=21600s" in second.first_line
+
+
+def test_checkpoint_covers_never_scrubbed_pool(tmp_path: Path) -> None:
+    argv = ["-p", "never_scrubbed_zpool", "--durations-dir", str(tmp_path)]
+    execute_main(list(argv))
+    assert "zpool history -il never_scrubbed_zpool" in executed_commands
+    execute_main(list(argv), time="2017-08-17 10:30:00")
+    assert "zpool history -il never_scrubbed_zpool" not in executed_commands
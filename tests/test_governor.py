@@ -0,0 +1,100 @@
+"""Test the scrub governor against the ``zpool`` simulator in
+``tests/fake_zpool``."""
+
+import json
+import time
+from datetime import time as dtime
+from pathlib import Path
+
+import pytest
+
+import check_zpool_scrub
+from check_zpool_scrub.governor import Governor, _in_window, _parse_window
+from tests.helper import (
+    options,  # noqa: F401 (autouse)
+    write_scenario,
+    zpool_simulator,
+)
+
+DAY: int = 24 * 3600
+
+
+def test_window() -> None:
+    window = _parse_window("08:00-18:30")
+    assert window == (dtime(8), dtime(18, 30))
+    assert _in_window(dtime(12), window)
+    assert not _in_window(dtime(18, 30), window)
+    night = _parse_window("22:00-06:00")
+    assert _in_window(dtime(23), night)
+    assert _in_window(dtime(5), night)
+    assert not _in_window(dtime(12), night)
+    with pytest.raises(ValueError):
+        _parse_window("08:00")
+
+
+def db(**values: object) -> dict[str, object]:
+    """The pool of the scenarios, by default with a scrub in progress."""
+    return {"name": "db", "scrub": "in_progress", "start": time.time() - 3600, **values}
+
+
+def state(path: Path) -> str:
+    return json.loads(path.read_text(encoding="utf-8"))["pools"][0]["scrub"]
+
+
+def update(path: Path, **values: object) -> None:
+    scenario = json.loads(path.read_text(encoding="utf-8"))
+    scenario["pools"][0].update(values)
+    path.write_text(json.dumps(scenario), encoding="utf-8")
+
+
+def test_pause_and_resume(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    path = write_scenario(tmp_path, db(duration=2 * DAY, wait=0.2, idle_wait=0.2))
+    governor = Governor(0.05, 0.1)
+    with zpool_simulator(scenario=path):
+        governor.step()
+        assert state(path) == "paused"
+        assert "db" in governor.paused
+        # Still loaded without the scrub
+        governor.step()
+        assert state(path) == "paused"
+        update(path, idle_wait=0.001)
+        governor.step()
+        assert state(path) == "in_progress"
+    assert governor.paused == {}
+    assert capsys.readouterr().out.splitlines() == [
+        "Paused the scrub of the pool “db”: latency 0.2s > 0.05s",
+        "Resumed the scrub of the pool “db”: the load dropped",
+    ]
+
+
+def test_no_pause_near_critical(tmp_path: Path) -> None:
+    critical = check_zpool_scrub.opts.critical
+    path = write_scenario(
+        tmp_path,
+        db(start=time.time() - critical + DAY, duration=critical + DAY, wait=0.2),
+    )
+    with zpool_simulator(scenario=path):
+        Governor(0.05, 0.1).step()
+    assert state(path) == "in_progress"
+
+
+def test_resume_outside_window(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    path = write_scenario(
+        tmp_path, db(scrub="paused", pause=time.time(), idle_wait=0.2)
+    )
+    # An empty window, the governor never pauses.
+    governor = Governor(0.05, 0.1, (dtime(0), dtime(0)))
+    governor.paused["db"] = DAY
+    with zpool_simulator(scenario=path):
+        governor.step()
+    assert state(path) == "in_progress"
+    assert "outside the pause window" in capsys.readouterr().out
+
+
+def test_paused_by_someone_else(tmp_path: Path) -> None:
+    path = write_scenario(tmp_path, db(scrub="paused", pause=time.time()))
+    with zpool_simulator(scenario=path):
+        Governor(0.05, 0.1).step()
+    assert state(path) == "paused"
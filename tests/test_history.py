@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from check_zpool_scrub.history import (
+    RingBuffer,
+    Sample,
+    Trend,
+    history_file,
+    record,
+    trend,
+)
+
+MB: int = 1024**2
+
+
+class TestRingBuffer:
+    def test_wraps_around(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "tank.ring")
+        with RingBuffer(path, capacity=4) as buffer:
+            for index in range(10):
+                buffer.append(Sample(1, index, index / 10, index * MB))
+            assert buffer.count == 10
+            assert [sample.time for sample in buffer.samples()] == [6, 7, 8, 9]
+        assert os.path.getsize(path) == 12 + 4 * 18
+
+    def test_reopen(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "tank.ring")
+        with RingBuffer(path, capacity=4) as buffer:
+            buffer.append(Sample(1, 2, 0.1234, 5 * 1024**4))
+        # An existing file keeps its capacity.
+        with RingBuffer(path, capacity=100) as buffer:
+            assert buffer.capacity == 4
+            assert buffer.samples() == [Sample(1, 2, 0.1234, 5 * 1024**4)]
+
+    def test_invalid_file(self, tmp_path: Path) -> None:
+        path = tmp_path / "tank.ring"
+        path.write_bytes(b"no history file")
+        with (
+            pytest.raises(ValueError, match="is not a scrub history file"),
+            RingBuffer(str(path)),
+        ):
+            pass
+
+    def test_invalid_file_is_closed(self, tmp_path: Path) -> None:
+        path = tmp_path / "tank.ring"
+        path.write_bytes(b"no history file")
+        descriptors = len(os.listdir("/proc/self/fd"))
+        with pytest.raises(ValueError), RingBuffer(str(path)):
+            pass
+        assert len(os.listdir("/proc/self/fd")) == descriptors
+
+
+def test_history_file() -> None:
+    assert history_file("/var/lib", "tank/1") == "/var/lib/tank%2F1.ring"
+
+
+class TestTrend:
+    def test_empty(self) -> None:
+        assert trend([]) == Trend()
+
+    def test_single_sample(self) -> None:
+        assert trend([Sample(1, 100, 0.5, 100 * MB)]) == Trend()
+
+    def test_current_scrub(self) -> None:
+        samples = [
+            Sample(1, 0, 0.0, 0),
+            Sample(1, 3600, 0.1, 3600 * 20 * MB),
+            Sample(1, 7200, 0.2, 3600 * 30 * MB),
+        ]
+        assert trend(samples) == Trend(
+            measured_speed=10.0, smoothed_time_to_go=28800, speed_ratio=None
+        )
+
+    def test_window(self) -> None:
+        samples = [
+            Sample(1, 0, 0.0, 0),
+            Sample(1, 3 * 3600, 0.3, 0),
+            Sample(1, 9 * 3600, 0.4, 0),
+        ]
+        # Only the progress of the last 6 hours counts.
+        assert trend(samples).smoothed_time_to_go == 6 * 6 * 3600
+
+    def test_slower_than_past_scrubs(self) -> None:
+        samples = [
+            Sample(1, 0, 0.0, 0),
+            Sample(1, 1000, 1.0, 1000 * 100 * MB),
+            Sample(2, 5000, 0.0, 0),
+            Sample(2, 6000, 1.0, 1000 * 300 * MB),
+            Sample(3, 9000, 0.0, 0),
+            Sample(3, 10000, 0.1, 1000 * 50 * MB),
+        ]
+        assert trend(samples).speed_ratio == 0.25
+
+
+def test_record_creates_directory(tmp_path: Path) -> None:
+    directory = str(tmp_path / "history" / "zpool")
+    record(directory, "tank", Sample(1, 2, 0.1, MB))
+    assert os.path.exists(history_file(directory, "tank"))
+
+
+def test_record_skips_repeated_samples(tmp_path: Path) -> None:
+    sample = Sample(1, 100, 0.5, 100 * MB)
+    record(str(tmp_path), "tank", sample)
+    record(str(tmp_path), "tank", Sample(1, 400, 0.5, 100 * MB))
+    with RingBuffer(history_file(str(tmp_path), "tank")) as buffer:
+        assert buffer.samples() == [sample]
@@ -6,7 +6,7 @@ def test_first_ok_zpool() -> None:
     assert result.exitcode == 0
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB OK | 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s"
+        "ZPOOL_SCRUB OK | 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: repaired'=0B 'first_ok_zpool: scanned'=10027546045317B 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s 'first_ok_zpool: total'=10423370231316B"
         == result.first_line
     )
 
@@ -16,7 +16,7 @@ def test_last_ok_zpool() -> None:
     assert result.exitcode == 0
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB OK | 'last_ok_zpool: last_scrub_timespan'=2678400s 'last_ok_zpool: last_scrub_timestamp'=1500287148 'last_ok_zpool: progress'=96.19% 'last_ok_zpool: speed'=1.9m/s 'last_ok_zpool: time_to_go'=199980s"
+        "ZPOOL_SCRUB OK | 'last_ok_zpool: last_scrub_timespan'=2678400s 'last_ok_zpool: last_scrub_timestamp'=1500287148 'last_ok_zpool: progress'=96.19% 'last_ok_zpool: repaired'=0B 'last_ok_zpool: scanned'=10027546045317B 'last_ok_zpool: speed'=1.9m/s 'last_ok_zpool: time_to_go'=199980s 'last_ok_zpool: total'=10423370231316B"
         == result.first_line
     )
 
@@ -26,7 +26,7 @@ def test_first_warning_zpool() -> None:
     assert result.exitcode == 1
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB WARNING - Pool “first_warning_zpool”: 2678401 >= 5356800 | 'first_warning_zpool: last_scrub_timespan'=2678401s 'first_warning_zpool: last_scrub_timestamp'=1500287147 'first_warning_zpool: progress'=72.38% 'first_warning_zpool: speed'=57.4m/s 'first_warning_zpool: time_to_go'=51120s"
+        "ZPOOL_SCRUB WARNING - Pool “first_warning_zpool”: 2678401 >= 5356800 | 'first_warning_zpool: last_scrub_timespan'=2678401s 'first_warning_zpool: last_scrub_timestamp'=1500287147 'first_warning_zpool: progress'=72.38% 'first_warning_zpool: repaired'=0B 'first_warning_zpool: scanned'=8070415347876B 'first_warning_zpool: speed'=57.4m/s 'first_warning_zpool: time_to_go'=51120s 'first_warning_zpool: total'=11105067440538B"
         == result.first_line
     )
 
@@ -36,7 +36,7 @@ def test_last_warning_zpool() -> None:
     assert result.exitcode == 1
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB WARNING - Pool “last_warning_zpool”: 5356800 >= 5356800 | 'last_warning_zpool: last_scrub_timespan'=5356800s 'last_warning_zpool: last_scrub_timestamp'=1497608748 'last_warning_zpool: progress'=72.38% 'last_warning_zpool: speed'=57.4m/s 'last_warning_zpool: time_to_go'=51120s"
+        "ZPOOL_SCRUB WARNING - Pool “last_warning_zpool”: 5356800 >= 5356800 | 'last_warning_zpool: last_scrub_timespan'=5356800s 'last_warning_zpool: last_scrub_timestamp'=1497608748 'last_warning_zpool: progress'=72.38% 'last_warning_zpool: repaired'=0B 'last_warning_zpool: scanned'=8070415347876B 'last_warning_zpool: speed'=57.4m/s 'last_warning_zpool: time_to_go'=51120s 'last_warning_zpool: total'=11105067440538B"
         == result.first_line
     )
 
@@ -46,7 +46,7 @@ def test_first_critical_zpool() -> None:
     assert result.exitcode == 2
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB CRITICAL - Pool “first_critical_zpool”: 5356801 >= 5356800 | 'first_critical_zpool: last_scrub_timespan'=5356801s 'first_critical_zpool: last_scrub_timestamp'=1497608747"
+        "ZPOOL_SCRUB CRITICAL - Pool “first_critical_zpool”: 5356801 >= 5356800 | 'first_critical_zpool: last_scrub_timespan'=5356801s 'first_critical_zpool: last_scrub_timestamp'=1497608747 'first_critical_zpool: repaired'=0B"
         == result.first_line
     )
 
@@ -56,7 +56,7 @@ def test_all_pools() -> None:
     assert result.exitcode == 3
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB UNKNOWN - The pool “unknown_zpool” has never had a scrub. | 'first_critical_zpool: last_scrub_timespan'=5356801s 'first_critical_zpool: last_scrub_timestamp'=1497608747 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s 'first_warning_zpool: last_scrub_timespan'=2678401s 'first_warning_zpool: last_scrub_timestamp'=1500287147 'first_warning_zpool: progress'=72.38% 'first_warning_zpool: speed'=57.4m/s 'first_warning_zpool: time_to_go'=51120s 'last_ok_zpool: last_scrub_timespan'=2678400s 'last_ok_zpool: last_scrub_timestamp'=1500287148 'last_ok_zpool: progress'=96.19% 'last_ok_zpool: speed'=1.9m/s 'last_ok_zpool: time_to_go'=199980s 'last_warning_zpool: last_scrub_timespan'=5356800s 'last_warning_zpool: last_scrub_timestamp'=1497608748 'last_warning_zpool: progress'=72.38% 'last_warning_zpool: speed'=57.4m/s 'last_warning_zpool: time_to_go'=51120s"
+        "ZPOOL_SCRUB UNKNOWN - The pool “unknown_zpool” has never had a scrub. | 'first_critical_zpool: last_scrub_timespan'=5356801s 'first_critical_zpool: last_scrub_timestamp'=1497608747 'first_critical_zpool: repaired'=0B 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: repaired'=0B 'first_ok_zpool: scanned'=10027546045317B 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s 'first_ok_zpool: total'=10423370231316B 'first_warning_zpool: last_scrub_timespan'=2678401s 'first_warning_zpool: last_scrub_timestamp'=1500287147 'first_warning_zpool: progress'=72.38% 'first_warning_zpool: repaired'=0B 'first_warning_zpool: scanned'=8070415347876B 'first_warning_zpool: speed'=57.4m/s 'first_warning_zpool: time_to_go'=51120s 'first_warning_zpool: total'=11105067440538B 'last_ok_zpool: last_scrub_timespan'=2678400s 'last_ok_zpool: last_scrub_timestamp'=1500287148 'last_ok_zpool: progress'=96.19% 'last_ok_zpool: repaired'=0B 'last_ok_zpool: scanned'=10027546045317B 'last_ok_zpool: speed'=1.9m/s 'last_ok_zpool: time_to_go'=199980s 'last_ok_zpool: total'=10423370231316B 'last_warning_zpool: last_scrub_timespan'=5356800s 'last_warning_zpool: last_scrub_timestamp'=1497608748 'last_warning_zpool: progress'=72.38% 'last_warning_zpool: repaired'=0B 'last_warning_zpool: scanned'=8070415347876B 'last_warning_zpool: speed'=57.4m/s 'last_warning_zpool: time_to_go'=51120s 'last_warning_zpool: total'=11105067440538B"
         == result.first_line
     )
 
@@ -66,7 +66,7 @@ def test_warning() -> None:
     assert result.exitcode == 0
     assert result.stdout
     assert (
-        "ZPOOL_SCRUB OK | 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s"
+        "ZPOOL_SCRUB OK | 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: repaired'=0B 'first_ok_zpool: scanned'=10027546045317B 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s 'first_ok_zpool: total'=10423370231316B"
         == result.first_line
     )
 
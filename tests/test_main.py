@@ -1,9 +1,31 @@
+import http.server
+import io
+import json
+import os
+import socket
+import stat
+import threading
+import time
+import typing
+import urllib.error
+import urllib.request
 from importlib import metadata
+from pathlib import Path
+from unittest import mock
 
-from tests.helper import execute_main
+import pytest
+from freezegun import freeze_time
+
+import check_zpool_scrub
+import check_zpool_scrub.daemon
+from check_zpool_scrub.history import RingBuffer, Sample, history_file
+from tests import helper
+from tests.helper import execute_main, executed_commands, fake_zpool
 
 version: str = metadata.version("check_zpool_scrub")
 
+MB: int = 1024**2
+
 
 def test_help_long() -> None:
     result = execute_main(["--help"])
@@ -41,3 +63,578 @@ def test_pool_long_unknown() -> None:
         result.first_line
         == "ZPOOL_SCRUB UNKNOWN: ValueError: Unknown pool 'xxx'. Available pools: 'unknown_zpool', 'never_scrubbed_zpool', 'first_ok_zpool', 'last_ok_zpool', 'first_warning_zpool', 'last_warning_zpool', 'first_critical_zpool'"
     )
+
+
+def test_single_subprocess_call_for_all_pools() -> None:
+    execute_main([])
+    # The first call detects that JSON output is not supported.
+    assert executed_commands == ["zpool status -j --json-int", "zpool status"]
+
+
+def test_single_subprocess_call_for_one_pool() -> None:
+    execute_main(["--pool", "first_ok_zpool"])
+    assert executed_commands == [
+        "zpool status -j --json-int first_ok_zpool",
+        "zpool status first_ok_zpool",
+    ]
+
+
+class TestJson:
+    def test_in_progress(self) -> None:
+        result = execute_main(["-p", "json_in_progress_zpool"], json_output=True)
+        assert result.exitcode == 0
+        assert (
+            "ZPOOL_SCRUB OK | 'json_in_progress_zpool: issue_speed'=14.22m/s 'json_in_progress_zpool: issued'=53687091200B 'json_in_progress_zpool: last_scrub_timespan'=3600s 'json_in_progress_zpool: last_scrub_timestamp'=1502961948 'json_in_progress_zpool: progress'=50.0% 'json_in_progress_zpool: repaired'=0B 'json_in_progress_zpool: scanned'=64424509440B 'json_in_progress_zpool: speed'=17.07m/s 'json_in_progress_zpool: time_to_go'=3600s 'json_in_progress_zpool: total'=107374182400B"
+            == result.first_line
+        )
+
+    def test_all_pools(self) -> None:
+        result = execute_main([], json_output=True)
+        assert result.exitcode == 3
+        assert (
+            "ZPOOL_SCRUB UNKNOWN - The pool “json_never_scrubbed_zpool” has never had a scrub. | 'json_finished_zpool: last_scrub_timespan'=2678400s 'json_finished_zpool: last_scrub_timestamp'=1500287148 'json_finished_zpool: repaired'=0B 'json_in_progress_zpool: issue_speed'=14.22m/s 'json_in_progress_zpool: issued'=53687091200B 'json_in_progress_zpool: last_scrub_timespan'=3600s 'json_in_progress_zpool: last_scrub_timestamp'=1502961948 'json_in_progress_zpool: progress'=50.0% 'json_in_progress_zpool: repaired'=0B 'json_in_progress_zpool: scanned'=64424509440B 'json_in_progress_zpool: speed'=17.07m/s 'json_in_progress_zpool: time_to_go'=3600s 'json_in_progress_zpool: total'=107374182400B"
+            == result.first_line
+        )
+        assert executed_commands == ["zpool status -j --json-int"]
+
+    def test_unknown_pool(self) -> None:
+        result = execute_main(["-p", "xxx"], json_output=True)
+        assert result.exitcode == 3
+        assert result.first_line is not None
+        assert "Unknown pool 'xxx'" in result.first_line
+
+
+class TestPoolTimeout:
+    def test_hung_pool(self) -> None:
+        with mock.patch(
+            "check_zpool_scrub._list_pools",
+            return_value=["first_ok_zpool", "hung_zpool"],
+        ):
+            result = execute_main(["--pool-timeout", "0.1"])
+        assert result.exitcode == 3
+        assert (
+            "ZPOOL_SCRUB UNKNOWN - Pool “hung_zpool”: no answer within 0.1s | 'first_ok_zpool: last_scrub_timespan'=0s 'first_ok_zpool: last_scrub_timestamp'=1502965548 'first_ok_zpool: progress'=96.19% 'first_ok_zpool: repaired'=0B 'first_ok_zpool: scanned'=10027546045317B 'first_ok_zpool: speed'=1.9m/s 'first_ok_zpool: time_to_go'=199980s 'first_ok_zpool: total'=10423370231316B"
+            == result.first_line
+        )
+
+    def test_hung_pool_json(self) -> None:
+        with mock.patch(
+            "check_zpool_scrub._list_pools",
+            return_value=["json_finished_zpool", "hung_zpool"],
+        ):
+            result = execute_main(["--pool-timeout", "0.1"], json_output=True)
+        assert result.exitcode == 3
+        assert (
+            "ZPOOL_SCRUB UNKNOWN - Pool “hung_zpool”: no answer within 0.1s | 'json_finished_zpool: last_scrub_timespan'=2678400s 'json_finished_zpool: last_scrub_timestamp'=1500287148 'json_finished_zpool: repaired'=0B"
+            == result.first_line
+        )
+
+    def test_all_pools_answer(self) -> None:
+        result = execute_main(["--pool-timeout", "5", "--jobs", "2"])
+        assert result.exitcode == 3
+        assert result.first_line is not None
+        assert result.first_line.startswith(
+            "ZPOOL_SCRUB UNKNOWN - The pool “unknown_zpool” has never had a scrub."
+        )
+
+
+class TestCache:
+    def test_second_run_is_served_from_cache(self, tmp_path: Path) -> None:
+        argv = ["-p", "first_critical_zpool", "--cache-ttl", "300"]
+        argv += ["--cache-file", str(tmp_path / "cache.json")]
+        first = execute_main(list(argv), time="2017-08-17 10:25:48")
+        assert executed_commands
+        second = execute_main(list(argv), time="2017-08-17 10:29:48")
+        assert executed_commands == []
+        assert first.exitcode == second.exitcode == 2
+
+    def test_expired(self, tmp_path: Path) -> None:
+        argv = ["--cache-ttl", "300", "--cache-file", str(tmp_path / "cache.json")]
+        execute_main(list(argv), time="2017-08-17 10:25:48")
+        execute_main(list(argv), time="2017-08-17 10:30:49")
+        assert executed_commands == ["zpool status -j --json-int", "zpool status"]
+
+    def test_ttl_shrinks_while_scrubbing(self, tmp_path: Path) -> None:
+        argv = ["-p", "first_ok_zpool", "--cache-ttl", "300"]
+        argv += ["--cache-file", str(tmp_path / "cache.json")]
+        execute_main(list(argv), time="2017-08-17 10:25:48")
+        result = execute_main(list(argv), time="2017-08-17 10:26:18")
+        assert executed_commands == []
+        # The time to go is reduced by the age of the cache entry.
+        assert result.first_line is not None
+        assert "'first_ok_zpool: time_to_go'=199950s" in result.first_line
+        execute_main(list(argv), time="2017-08-17 10:26:49")
+        assert executed_commands != []
+
+    def test_corrupt_cache_file(self, tmp_path: Path) -> None:
+        cache_file = tmp_path / "cache.json"
+        cache_file.write_text('{"first_critical_zpool": {"time": ')
+        argv = ["-p", "first_critical_zpool", "--cache-ttl", "300"]
+        result = execute_main(argv + ["--cache-file", str(cache_file)])
+        assert result.exitcode == 2
+        assert executed_commands
+
+    def test_cache_file_not_writable(self, tmp_path: Path) -> None:
+        cache_file = tmp_path / "nonexistent" / "cache.json"
+        argv = ["-p", "first_critical_zpool", "--cache-ttl", "300"]
+        result = execute_main(argv + ["--cache-file", str(cache_file)])
+        assert result.exitcode == 2
+        assert result.first_line is not None
+        assert result.first_line.startswith("ZPOOL_SCRUB CRITICAL")
+
+    @pytest.mark.parametrize("ttl", [["--cache-ttl", "0"], []])
+    def test_json_support_is_kept(self, tmp_path: Path, ttl: list[str]) -> None:
+        # Also without --cache-ttl
+        argv = ["-p", "first_ok_zpool", *ttl]
+        argv += ["--cache-file", str(tmp_path / "cache.json")]
+        zpool = tmp_path / "zpool"
+        zpool.touch()
+        with mock.patch("check_zpool_scrub.shutil.which", return_value=str(zpool)):
+            execute_main(list(argv))
+            assert executed_commands == [
+                "zpool status -j --json-int first_ok_zpool",
+                "zpool status first_ok_zpool",
+            ]
+            execute_main(list(argv))
+            assert executed_commands == ["zpool status first_ok_zpool"]
+            # An upgrade of zpool
+            os.utime(zpool, ns=(0, 0))
+            execute_main(list(argv))
+            assert executed_commands[0] == "zpool status -j --json-int first_ok_zpool"
+
+
+class TestHistory:
+    def test_first_sample(self, tmp_path: Path) -> None:
+        argv = ["-p", "last_ok_zpool", "--history-dir", str(tmp_path)]
+        result = execute_main(argv)
+        assert result.exitcode == 0
+        with RingBuffer(history_file(str(tmp_path), "last_ok_zpool")) as buffer:
+            assert len(buffer.samples()) == 1
+
+    def test_not_writable(self, tmp_path: Path) -> None:
+        directory = tmp_path / "history"
+        directory.write_text("")
+        result = execute_main(["-p", "last_ok_zpool", "--history-dir", str(directory)])
+        assert result.exitcode == 0
+        assert result.first_line is not None
+        assert "'last_ok_zpool: measured_speed'" not in result.first_line
+
+    def test_foreign_file(self, tmp_path: Path) -> None:
+        history_path = history_file(str(tmp_path), "last_ok_zpool")
+        Path(history_path).write_bytes(b"no history file")
+        result = execute_main(["-p", "last_ok_zpool", "--history-dir", str(tmp_path)])
+        assert result.exitcode == 0
+        assert Path(history_path).read_bytes() == b"no history file"
+
+    def test_slowdown(self, tmp_path: Path) -> None:
+        argv = ["-p", "last_ok_zpool", "--history-dir", str(tmp_path)]
+        execute_main(list(argv))
+        path = history_file(str(tmp_path), "last_ok_zpool")
+        with RingBuffer(path) as buffer:
+            current = buffer.samples()[0]
+        os.remove(path)
+        with RingBuffer(path) as buffer:
+            # A past scrub at 100 MB/s
+            buffer.append(Sample(1000, 1000, 0.0, 0))
+            buffer.append(Sample(1000, 4600, 1.0, 3600 * 100 * MB))
+            # The scrub in progress issued 10 MB/s during the last hour.
+            buffer.append(
+                Sample(
+                    current.start,
+                    current.time - 3600,
+                    current.progress - 0.01,
+                    current.issued - 3600 * 10 * MB,
+                )
+            )
+            buffer.append(current)
+        result = execute_main(list(argv))
+        assert result.exitcode == 1
+        assert result.first_line is not None
+        assert "'last_ok_zpool: measured_speed'=10.0m/s" in result.first_line
+        assert "'last_ok_zpool: smoothed_time_to_go'=13716s" in result.first_line
+        assert "'last_ok_zpool: speed_ratio'=" in result.first_line
+
+
+class TestIostat:
+    def test_metrics(self) -> None:
+        result = execute_main(["-p", "first_ok_zpool", "--iostat", "5"])
+        assert executed_commands == [
+            "zpool iostat -H -p -l -y first_ok_zpool 5 1",
+            "zpool status -j --json-int first_ok_zpool",
+            "zpool status first_ok_zpool",
+        ]
+        assert result.first_line is not None
+        for perfdata in (
+            "'first_ok_zpool: read_ops'=120",
+            "'first_ok_zpool: write_bandwidth'=1048576B",
+            "'first_ok_zpool: total_wait_read'=0.0085s",
+            "'first_ok_zpool: asyncq_wait_write'=0.0004s",
+            "'first_ok_zpool: scrub_wait'=0.025s",
+        ):
+            assert perfdata in result.first_line
+        assert "'first_ok_zpool: syncq_wait_read'" not in result.first_line
+
+    def test_all_pools(self) -> None:
+        result = execute_main(["--iostat", "1"])
+        assert executed_commands[0] == "zpool iostat -H -p -l -y 1 1"
+        assert result.first_line is not None
+        assert "'last_ok_zpool: read_ops'=0" in result.first_line
+
+    def test_unexpected_output_is_ignored(self) -> None:
+        with mock.patch(
+            "tests.helper.ZPOOL_IOSTAT",
+            {"first_ok_zpool": "first_ok_zpool\t1T\t2T\tmany\tfew\t1G\t1M"},
+        ):
+            result = execute_main(["-p", "first_ok_zpool", "--iostat", "5"])
+        assert result.exitcode == 0
+        assert result.first_line is not None
+        assert "read_ops" not in result.first_line
+
+
+class TestDaemon:
+    @pytest.fixture
+    def socket_path(self, tmp_path: Path) -> typing.Iterator[str]:
+        path = str(tmp_path / "check_zpool_scrub.sock")
+        options = check_zpool_scrub.get_argparser().parse_args([])
+        with (
+            mock.patch("check_zpool_scrub.opts", options),
+            fake_zpool(),
+            freeze_time("2017-08-17 10:25:48"),
+        ):
+            collector = check_zpool_scrub.daemon.Collector(300)
+            collector.refresh()
+        server = check_zpool_scrub.daemon._SocketServer(path, collector)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield path
+        server.shutdown()
+        server.server_close()
+
+    def test_client(self, socket_path: str) -> None:
+        result = execute_main(["-p", "last_ok_zpool", "--socket", socket_path])
+        assert executed_commands == []
+        assert result.exitcode == 0
+        assert (
+            "ZPOOL_SCRUB OK | 'last_ok_zpool: last_scrub_timespan'=2678400s 'last_ok_zpool: last_scrub_timestamp'=1500287148 'last_ok_zpool: progress'=96.19% 'last_ok_zpool: repaired'=0B 'last_ok_zpool: scanned'=10027546045317B 'last_ok_zpool: speed'=1.9m/s 'last_ok_zpool: time_to_go'=199980s 'last_ok_zpool: total'=10423370231316B"
+            == result.first_line
+        )
+
+    def test_client_unknown_pool(self, socket_path: str) -> None:
+        result = execute_main(["-p", "xxx", "--socket", socket_path])
+        assert executed_commands == []
+        assert result.exitcode == 3
+        assert result.first_line is not None
+        assert "Unknown pool 'xxx'" in result.first_line
+
+    def test_no_daemon(self, tmp_path: Path) -> None:
+        result = execute_main(
+            ["-p", "last_ok_zpool", "--socket", str(tmp_path / "missing.sock")]
+        )
+        assert executed_commands != []
+        assert result.exitcode == 0
+
+    def test_stale_daemon(self, socket_path: str) -> None:
+        # Twice the refresh interval of 300 seconds has passed.
+        result = execute_main(
+            ["-p", "last_ok_zpool", "--socket", socket_path],
+            time="2017-08-17 10:35:49",
+        )
+        assert executed_commands != []
+        probed = execute_main(["-p", "last_ok_zpool"], time="2017-08-17 10:35:49")
+        assert result.first_line == probed.first_line
+
+    def test_socket_mode(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "check_zpool_scrub.sock")
+        server = check_zpool_scrub.daemon._SocketServer(
+            path, check_zpool_scrub.daemon.Collector(300), mode=0o660
+        )
+        try:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o660
+        finally:
+            server.server_close()
+
+    def test_argument_socket_mode(self) -> None:
+        options = check_zpool_scrub.get_argparser().parse_args(["--socket-mode", "660"])
+        assert options.socket_mode == 0o660
+
+    def test_hung_daemon(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "check_zpool_scrub.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            # Accepted by the kernel, but never answered
+            server.bind(path)
+            server.listen()
+            begin = time.monotonic()
+            result = execute_main(["-p", "last_ok_zpool", "--socket", path])
+            elapsed = time.monotonic() - begin
+        # Well within the default --timeout of 50 seconds
+        assert elapsed < 10
+        assert executed_commands != []
+        assert result.exitcode == 0
+
+    def test_stale_socket(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "check_zpool_scrub.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as previous:
+            previous.bind(path)
+        server = check_zpool_scrub.daemon._SocketServer(
+            path, check_zpool_scrub.daemon.Collector(300)
+        )
+        server.server_close()
+
+    def test_socket_in_use(self, socket_path: str) -> None:
+        with pytest.raises(FileExistsError, match="in use by a running daemon"):
+            check_zpool_scrub.daemon._SocketServer(
+                socket_path, check_zpool_scrub.daemon.Collector(300)
+            )
+        assert os.path.exists(socket_path)
+
+    def test_no_socket(self, tmp_path: Path) -> None:
+        path = tmp_path / "check_zpool_scrub.sock"
+        path.write_text("")
+        with pytest.raises(SystemExit, match="exists and is not a socket"):
+            check_zpool_scrub.daemon._run_daemon(300, socket_path=str(path))
+        assert path.exists()
+
+
+class TestEvents:
+    @pytest.fixture
+    def collector(self) -> typing.Iterator[check_zpool_scrub.daemon.Collector]:
+        options = check_zpool_scrub.get_argparser().parse_args([])
+        with (
+            mock.patch("check_zpool_scrub.opts", options),
+            mock.patch.dict(helper.ZPOOL_STATUS),
+            mock.patch.object(helper, "ZPOOL_LIST", list(helper.ZPOOL_LIST)),
+            fake_zpool(),
+            freeze_time("2017-08-17 10:25:48") as frozen,
+        ):
+            collector = check_zpool_scrub.daemon.Collector(300)
+            collector.refresh()
+            frozen.tick(60)
+            # The pool is exported before the events are read.
+            del helper.ZPOOL_STATUS["last_ok_zpool"]
+            helper.ZPOOL_LIST.remove("last_ok_zpool")
+            executed_commands.clear()
+            yield collector
+
+    def test_parse_events(self) -> None:
+        events = list(
+            check_zpool_scrub.daemon._parse_events(helper.ZPOOL_EVENTS.splitlines(True))
+        )
+        assert events == [
+            ("sysevent.fs.zfs.scrub_start", "first_ok_zpool", 1502961948),
+            ("sysevent.fs.zfs.config_sync", "last_ok_zpool", 1502965608),
+            ("sysevent.fs.zfs.scrub_finish", "first_ok_zpool", 1502965608.5),
+            ("sysevent.fs.zfs.pool_export", "last_ok_zpool", 1502965608.6),
+        ]
+
+    def test_follow(self, collector: check_zpool_scrub.daemon.Collector) -> None:
+        watcher = check_zpool_scrub.daemon.EventWatcher(collector)
+        watcher.start = 1502965548
+        watcher.follow(io.StringIO(helper.ZPOOL_EVENTS))
+        # The scrub start is older than the watcher, the config sync does not
+        # change the scrub status.
+        assert executed_commands == [
+            "zpool status first_ok_zpool",
+            "zpool status last_ok_zpool",
+            "zpool list -H -o name",
+        ]
+        assert "last_ok_zpool" not in collector.results
+        dump = collector.dump()
+        assert dump["time"] == 1502965548
+        assert dump["pools"]["first_ok_zpool"]["time"] == 1502965608
+        assert "time" not in dump["pools"]["first_warning_zpool"]
+
+    def test_run(self, collector: check_zpool_scrub.daemon.Collector) -> None:
+        stop = threading.Event()
+        watcher = check_zpool_scrub.daemon.EventWatcher(collector, restart_delay=0)
+        watcher.start = 1502965548
+        collector.listeners.append(lambda results: stop.set())
+        watcher.run(stop)
+        assert executed_commands[0] == "zpool events -f -v -H"
+        assert "zpool status first_ok_zpool" in executed_commands
+
+
+class TestPrometheus:
+    def test_textfile(self, tmp_path: Path) -> None:
+        path = tmp_path / "zpool_scrub.prom"
+        execute_main(["--textfile", str(path)])
+        assert list(tmp_path.iterdir()) == [path]
+        metrics = path.read_text()
+        assert 'zpool_scrub_up{pool="first_ok_zpool"} 1\n' in metrics
+        assert 'zpool_scrub_progress_ratio{pool="first_ok_zpool"} 0.9619\n' in metrics
+        assert (
+            'zpool_scrub_last_scrub_timestamp_seconds{pool="last_ok_zpool"} 1500287148\n'
+            in metrics
+        )
+        assert 'zpool_scrub_time_to_go_seconds{pool="never_scrubbed_zpool"}' not in (
+            metrics
+        )
+
+    def test_http(self) -> None:
+        options = check_zpool_scrub.get_argparser().parse_args([])
+        with (
+            mock.patch("check_zpool_scrub.opts", options),
+            fake_zpool(),
+            freeze_time("2017-08-17 10:25:48"),
+        ):
+            collector = check_zpool_scrub.daemon.Collector(300)
+            collector.refresh()
+            server = check_zpool_scrub.daemon._ExporterServer(
+                ("127.0.0.1", 0), collector
+            )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                metrics = response.read().decode()
+            assert (
+                'zpool_scrub_speed_mebibytes_per_second{pool="first_ok_zpool"} 1.9\n'
+                in (metrics)
+            )
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class _IcingaHandler(http.server.BaseHTTPRequestHandler):
+    """A stand-in for the Icinga 2 API that records the requests."""
+
+    server: "_IcingaServer"
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        if body["filter_vars"]["s"] == "zpool_scrub_unknown_zpool":
+            status, response = 404, {"error": 404, "status": "No objects found."}
+        else:
+            status, response = 200, {"results": [{"code": 200.0}]}
+        content = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        pass
+
+
+class _IcingaServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    connections: int
+
+    requests: list[tuple[str, dict[str, str], dict[str, typing.Any]]]
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.requests = []
+        super().__init__(("127.0.0.1", 0), _IcingaHandler)
+
+
+class TestIcinga:
+    @pytest.fixture
+    def server(self) -> typing.Iterator[_IcingaServer]:
+        server = _IcingaServer()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def url(self, server: _IcingaServer) -> str:
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def test_submit(self, server: _IcingaServer) -> None:
+        with mock.patch.dict("os.environ", {"ICINGA_API_PASSWORD": "secret"}):
+            result = execute_main(
+                ["-p", "last_warning_zpool", "--icinga-url", self.url(server)]
+                + ["--icinga-user", "zfs", "--icinga-host", "nas"]
+            )
+        assert result.first_line == (
+            f"Submitted the results of 1 pools to {self.url(server)}"
+        )
+        [(path, headers, body)] = server.requests
+        assert path == "/v1/actions/process-check-result"
+        assert headers["Authorization"] == "Basic emZzOnNlY3JldA=="
+        assert body["type"] == "Service"
+        assert body["filter_vars"] == {
+            "h": "nas",
+            "s": "zpool_scrub_last_warning_zpool",
+        }
+        assert body["exit_status"] == 1
+        assert body["plugin_output"].startswith("ZPOOL_SCRUB WARNING - ")
+        assert (
+            "'last_warning_zpool: last_scrub_timespan'=5356800s"
+            in body["performance_data"]
+        )
+
+    def test_single_connection(self, server: _IcingaServer) -> None:
+        result = execute_main(
+            ["--icinga-url", self.url(server), "--icinga-host", "nas"]
+        )
+        # unknown_zpool has no service object.
+        assert result.exitcode == 3
+        assert result.first_line is not None
+        assert "did not accept 1 of 7 results" in result.first_line
+        assert "nas!zpool_scrub_unknown_zpool: 404" in result.first_line
+        assert len(server.requests) == 7
+        assert server.connections == 1
+        exit_status = {
+            body["filter_vars"]["s"]: body["exit_status"]
+            for _, _, body in server.requests
+        }
+        assert exit_status["zpool_scrub_first_ok_zpool"] == 0
+        assert exit_status["zpool_scrub_first_critical_zpool"] == 2
+        assert exit_status["zpool_scrub_never_scrubbed_zpool"] == 3
+
+
+class TestSelfTiming:
+    def test_single_pool(self) -> None:
+        result = execute_main(["-p", "first_ok_zpool", "--self-timing"])
+        assert result.exitcode == 0
+        assert result.first_line is not None
+        for label in (
+            "argparse_seconds",
+            "'first_ok_zpool: zpool_exec_seconds'",
+            "parse_seconds",
+            "check_duration",
+        ):
+            assert f" {label}=" in result.first_line
+        assert "zpool_list_seconds" not in result.first_line
+
+    def test_pool_timeout(self) -> None:
+        result = execute_main(["--pool-timeout", "5", "--self-timing"])
+        assert result.first_line is not None
+        assert " zpool_list_seconds=" in result.first_line
+        assert " 'last_ok_zpool: zpool_exec_seconds'=" in result.first_line
+
+    def test_disabled(self) -> None:
+        result = execute_main(["-p", "first_ok_zpool"])
+        assert result.first_line is not None
+        assert "check_duration" not in result.first_line
+
+    def test_profile(self, tmp_path: Path) -> None:
+        from check_zpool_scrub.profiling import _write_report
+
+        path = tmp_path / "profile.txt"
+        with (
+            mock.patch.dict(os.environ, {"CHECK_ZPOOL_SCRUB_PROFILE": str(path)}),
+            mock.patch("atexit.register") as register,
+        ):
+            execute_main(["-p", "first_ok_zpool"])
+        function, profiler, report = register.call_args.args
+        assert function is _write_report
+        assert report == str(path)
+        function(profiler, report)
+        text = path.read_text()
+        assert "function calls" in text
+        assert "tracemalloc:" in text
@@ -0,0 +1,116 @@
+"""Test the scrub orchestrator against the ``zpool`` simulator in
+``tests/fake_zpool``."""
+
+import json
+import time
+import typing
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from check_zpool_scrub import PoolScrubStatus, ScrubRecord
+from check_zpool_scrub.orchestrator import (
+    _domain,
+    _due_pools,
+    _orchestrate,
+    _parse_domain,
+)
+from tests.helper import (
+    options,  # noqa: F401 (autouse)
+    write_scenario,
+    zpool_simulator,
+)
+
+DAY: int = 24 * 3600
+
+
+def status(
+    pool: str, days: typing.Optional[int], progress: typing.Optional[float] = None
+) -> PoolScrubStatus:
+    last_scrub = None if days is None else datetime.now() - timedelta(days=days)
+    return PoolScrubStatus(
+        pool, record=ScrubRecord(progress=progress, last_scrub=last_scrub)
+    )
+
+
+def test_due_pools() -> None:
+    results: dict[str, typing.Union[PoolScrubStatus, str]] = {
+        "recent": status("recent", 2),
+        "old": status("old", 20),
+        "older": status("older", 40),
+        "never": status("never", None),
+        "scrubbing": status("scrubbing", 0, 0.5),
+        "broken": "no answer within 5s",
+    }
+    assert _due_pools(results, 10 * DAY) == ["never", "older", "old"]
+
+
+def test_domain() -> None:
+    domains = [_parse_domain("tank*=hba0"), _parse_domain("*-backup=hba1")]
+    assert _domain("tank1", domains) == "hba0"
+    assert _domain("data-backup", domains) == "hba1"
+    assert _domain("data", domains) == "data"
+    with pytest.raises(ValueError):
+        _parse_domain("tank")
+
+
+def finished(name: str, days: int) -> dict[str, object]:
+    end = time.time() - days * DAY
+    return {"name": name, "scrub": "finished", "start": end - 3600, "end": end}
+
+
+def starts(path: Path) -> dict[str, float]:
+    return {
+        pool["name"]: pool["start"]
+        for pool in json.loads(path.read_text(encoding="utf-8"))["pools"]
+        if pool.get("scrub") == "in_progress"
+    }
+
+
+def test_one_at_a_time(tmp_path: Path) -> None:
+    path = write_scenario(
+        tmp_path,
+        {**finished("old", 20), "duration": 0.5},
+        {**finished("older", 40), "duration": 0.5},
+        {**finished("recent", 2), "duration": 0.5},
+    )
+    with zpool_simulator(scenario=path):
+        started = _orchestrate(1, [], 10 * DAY, 0.1)
+    assert started == ["older", "old"]
+    times = starts(path)
+    assert set(times) == {"older", "old"}
+    assert times["old"] - times["older"] >= 0.5
+
+
+def test_contention_domains(tmp_path: Path) -> None:
+    path = write_scenario(
+        tmp_path,
+        {**finished("a1", 40), "duration": 0.5},
+        {**finished("a2", 30), "duration": 0.5},
+        {**finished("b1", 20), "duration": 0.5},
+    )
+    with zpool_simulator(scenario=path):
+        started = _orchestrate(2, [("a*", "A")], 10 * DAY, 0.1)
+    # a2 waits for a1 on the same controller, although a slot is free.
+    assert started == ["a1", "b1", "a2"]
+    times = starts(path)
+    assert times["b1"] - times["a1"] < 0.5
+    assert times["a2"] - times["a1"] >= 0.5
+
+
+def test_running_scrub_takes_a_slot(tmp_path: Path) -> None:
+    path = write_scenario(
+        tmp_path,
+        {
+            "name": "busy",
+            "scrub": "in_progress",
+            "start": time.time(),
+            "duration": 0.5,
+        },
+        {**finished("old", 20), "duration": 0.5},
+    )
+    with zpool_simulator(scenario=path):
+        begin = time.monotonic()
+        assert _orchestrate(1, [], 10 * DAY, 0.1) == ["old"]
+    assert time.monotonic() - begin >= 0.4
@@ -0,0 +1,156 @@
+"""Run the real subprocesses against the ``zpool`` simulator in
+``tests/fake_zpool``."""
+
+import subprocess
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from check_zpool_scrub import (
+    PoolScrubStatus,
+    _list_pools,
+    _probe_pools,
+    _probe_pools_concurrently,
+)
+from tests.helper import run, write_scenario, zpool_simulator
+
+NOW: int = 1502965548
+
+
+def test_list_pools() -> None:
+    with zpool_simulator(pools=5):
+        assert _list_pools() == [f"pool000{i}" for i in range(5)]
+
+
+@pytest.mark.parametrize("json_output", [0, 1])
+def test_finished_scrub(tmp_path: Path, json_output: int) -> None:
+    scenario = write_scenario(
+        tmp_path,
+        {"name": "tank", "scrub": "finished", "start": NOW - 7200, "end": NOW - 3600},
+    )
+    with zpool_simulator(scenario=scenario, json=json_output):
+        status = _probe_pools("tank")["tank"]
+    assert status.last_scrub is not None
+    assert round(status.last_scrub.timestamp()) == NOW - 3600
+    assert status.progress is None
+
+
+@pytest.mark.parametrize("scrub", ["finished", "canceled"])
+def test_same_record_text_and_json(tmp_path: Path, scrub: str) -> None:
+    scenario = write_scenario(
+        tmp_path,
+        {"name": "tank", "scrub": scrub, "start": NOW - 7200, "end": NOW - 3600},
+    )
+    records = []
+    for json_output in (0, 1):
+        with zpool_simulator(scenario=scenario, json=json_output):
+            records.append(_probe_pools("tank")["tank"].record)
+    assert records[0] == records[1]
+
+
+@pytest.mark.parametrize("scan_format", ["new", "old"])
+def test_scrub_in_progress_text(tmp_path: Path, scan_format: str) -> None:
+    scenario = write_scenario(
+        tmp_path,
+        {
+            "name": "tank",
+            "scrub": "in_progress",
+            "start": NOW - 3600,
+            "progress": 0.25,
+            "format": scan_format,
+        },
+    )
+    with zpool_simulator(scenario=scenario, json=0, now=NOW):
+        status = _probe_pools("tank")["tank"]
+    assert status.progress == 0.25
+    assert status.speed is not None
+    # 3 hours to go for the remaining 75%
+    assert status.time_to_go is not None
+    assert abs(status.time_to_go - 3 * 3600) <= 60
+
+
+def test_many_pools_with_many_vdevs() -> None:
+    with zpool_simulator(pools=300, vdevs=200, json=0):
+        statuses = _probe_pools()
+    assert len(statuses) == 300
+
+
+def test_stop_reading_after_the_scan_block() -> None:
+    with zpool_simulator(pools=1, vdevs=100000, json=0):
+        start = time.monotonic()
+        _probe_pools("pool0000")
+        assert time.monotonic() - start < 5
+
+
+def test_timeout() -> None:
+    with zpool_simulator(delay=10), pytest.raises(subprocess.TimeoutExpired):
+        _probe_pools(timeout=0.5)
+
+
+@pytest.mark.parametrize("json_output", [0, 1])
+def test_hung_pool(json_output: int) -> None:
+    with zpool_simulator(pools=4, hang="pool0002", json=json_output):
+        start = time.monotonic()
+        results = _probe_pools_concurrently(_list_pools(), 1, 4)
+        assert time.monotonic() - start < 5
+    assert results["pool0002"] == "no answer within 1s"
+    for pool in ("pool0000", "pool0001", "pool0003"):
+        assert isinstance(results[pool], PoolScrubStatus)
+
+
+def test_probe_bug() -> None:
+    with (
+        patch("check_zpool_scrub._probe_pools", side_effect=KeyError("tank")),
+        patch("check_zpool_scrub.log") as log,
+    ):
+        results = _probe_pools_concurrently(["tank"], 1, 1)
+    assert results == {"tank": "KeyError: 'tank'"}
+    log.exception.assert_called_once_with("Probing the pool %s failed", "tank")
+
+
+def test_stuck_pool() -> None:
+    # The killed zpool process leaves its output open.
+    with zpool_simulator(pools=3, stuck="pool0001"):
+        begin = time.monotonic()
+        process = run(["--pool-timeout", "0.5", "--timeout", "2"])
+        elapsed = time.monotonic() - begin
+    assert elapsed < 10
+    assert process.returncode == 3
+    assert process.stdout.startswith(
+        "ZPOOL_SCRUB UNKNOWN - Pool “pool0001”: no answer within the overall timeout"
+    )
+    assert "'pool0000: last_scrub_timestamp'" in process.stdout
+
+
+def test_command_line(tmp_path: Path) -> None:
+    scenario = write_scenario(
+        tmp_path,
+        {"name": "tank", "scrub": "finished", "start": NOW - 7200, "end": NOW - 3600},
+    )
+    with zpool_simulator(scenario=scenario):
+        process = run(["-p", "tank", "-w", "1", "-c", "2"])
+    assert process.returncode == 2
+    assert process.stdout.startswith("ZPOOL_SCRUB CRITICAL - Pool “tank”")
+
+
+def test_iostat_in_parallel(tmp_path: Path) -> None:
+    scenario = write_scenario(
+        tmp_path,
+        {
+            "name": "tank",
+            "scrub": "in_progress",
+            "start": time.time() - 3600,
+            "delay": 0.5,
+        },
+    )
+    with zpool_simulator(scenario=scenario):
+        begin = time.monotonic()
+        process = run(["-p", "tank", "--iostat", "0.5"])
+        elapsed = time.monotonic() - begin
+    assert process.returncode == 0
+    assert "'tank: read_ops'=400" in process.stdout
+    assert "'tank: scrub_wait'=0.02s" in process.stdout
+    # Both commands take half a second.
+    assert elapsed < 1.5
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET: float = 0.5
+"""The maximum cumulative import time of the module in seconds, as measured
+by ``python -X importtime``. Most of it is spent in the standard library and
+in mplugin."""
+
+
+def import_module(code: str = "") -> subprocess.CompletedProcess[str]:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import check_zpool_scrub{code}"],
+        capture_output=True,
+        encoding="utf-8",
+        check=True,
+    )
+
+
+def test_import_time_budget() -> None:
+    # import time: self [us] | cumulative | imported package
+    lines = import_module().stderr.splitlines()
+    cumulative = [
+        int(line.split("|")[1])
+        for line in lines
+        if line.split("|")[-1].strip() == "check_zpool_scrub"
+    ]
+    assert len(cumulative) == 1
+    assert cumulative[0] / 1_000_000 < IMPORT_TIME_BUDGET
+
+
+def test_deferred_imports() -> None:
+    process = import_module(
+        "; import sys; print(sorted(set(sys.modules) & "
+        "{'concurrent.futures', 'http.server', 'socketserver', "
+        "'check_zpool_scrub.daemon', 'check_zpool_scrub.history', 'mmap', "
+        "'check_zpool_scrub.iostat', 'check_zpool_scrub.orchestrator', "
+        "'check_zpool_scrub.governor', 'check_zpool_scrub.icinga', 'http.client', "
+        "'check_zpool_scrub.analyzer', 'check_zpool_scrub.vdevs', "
+        "'check_zpool_scrub.wait', 'check_zpool_scrub.durations', "
+        "'check_zpool_scrub.checkmk', 'tarfile', 'cProfile', 'tracemalloc', "
+        "'mplugin.cli', 'mplugin.timespan'}))"
+    )
+    assert process.stdout == "[]\n"
+
+
+def test_lazy_version() -> None:
+    process = import_module(
+        "; print('__version__' in vars(check_zpool_scrub)); "
+        "check_zpool_scrub.__version__; "
+        "print('__version__' in vars(check_zpool_scrub))"
+    )
+    assert process.stdout == "False\nTrue\n"
@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from freezegun import freeze_time
+
+import check_zpool_scrub
+import check_zpool_scrub.daemon
+from check_zpool_scrub import _scan_pools
+from check_zpool_scrub.vdevs import NO_STATE, VDEV_STATES, VdevTree
+from tests.helper import (
+    execute_main,
+    executed_commands,
+    fake_zpool,
+    synthetic_zpool_status,
+    synthetic_zpool_status_json,
+)
+
+DEGRADED: str = """  pool: tank
+ state: DEGRADED
+status: One or more devices has experienced an unrecoverable error.
+  scan: scrub repaired 1.50M in 04:12:09 with 0 errors on Sun Aug 13 04:36:10 2017
+config:
+
+	NAME                        STATE     READ WRITE CKSUM
+	tank                        DEGRADED     0     0     0
+	  mirror-0                  DEGRADED     0     0     0
+	    sda                     ONLINE       0     0     0
+	    sdb                     FAULTED      3   120  1.2K  too many errors
+	  mirror-1                  ONLINE       0     0     2
+	    sdc                     ONLINE       0     0     7  (repairing)
+	    sdd                     ONLINE       1     0     0
+	logs
+	  sde                       ONLINE       0     0     0
+	spares
+	  sdf                       AVAIL
+
+errors: No known data errors
+"""
+
+
+def parse(output: str) -> VdevTree:
+    trees: dict[str, VdevTree] = {}
+    _scan_pools(output.splitlines(keepends=True), "tank", trees)
+    return trees["tank"]
+
+
+def test_tree() -> None:
+    tree = parse(DEGRADED)
+    assert tree.names == [
+        *("tank", "mirror-0", "sda", "sdb", "mirror-1", "sdc", "sdd"),
+        *("logs", "sde", "spares", "sdf"),
+    ]
+    assert list(tree.parents) == [-1, 0, 1, 1, 0, 4, 4, -1, 7, -1, 9]
+    assert [VDEV_STATES[s] if s != NO_STATE else None for s in tree.states] == [
+        *("DEGRADED", "DEGRADED", "ONLINE", "FAULTED", "ONLINE", "ONLINE"),
+        *("ONLINE", None, "ONLINE", None, "AVAIL"),
+    ]
+    assert list(tree.leaves()) == [2, 3, 5, 6, 8, 10]
+    # The checksum errors of mirror-1 itself are not counted twice.
+    assert tree.errors() == (4, 120, 1229 + 7)
+    assert tree.worst() == (VDEV_STATES.index("FAULTED"), "sdb")
+
+
+def test_json_matches_text() -> None:
+    text = parse(synthetic_zpool_status(1, 25)["pool0000"].replace("pool0000", "tank"))
+    pool = synthetic_zpool_status_json(1, 25)["pool0000"]
+    pool["vdevs"] = {"tank": {**pool["vdevs"]["pool0000"], "name": "tank"}}
+    pool["spares"] = {"sdf": {"name": "sdf", "state": "AVAIL"}}
+    tree = VdevTree.from_json(json.loads(json.dumps(pool)))
+    assert tree.names[: len(text)] == text.names
+    assert list(tree.parents[: len(text)]) == list(text.parents)
+    assert tree.names[len(text) :] == ["spares", "sdf"]
+    assert list(tree.parents[len(text) :]) == [-1, len(text)]
+    assert tree.errors() == (0, 0, 0)
+
+
+def test_linear_time() -> None:
+    def measure(vdevs: int) -> float:
+        lines = synthetic_zpool_status(1, vdevs)["pool0000"].splitlines(keepends=True)
+        begin = time.perf_counter()
+        trees: dict[str, VdevTree] = {}
+        _scan_pools(lines, vdevs=trees)
+        assert len(trees["pool0000"]) == 1 + vdevs + vdevs // 10
+        return time.perf_counter() - begin
+
+    measure(1000)
+    assert min(measure(20000) for _ in range(3)) < 40 * min(
+        measure(2000) for _ in range(3)
+    )
+
+
+def test_main() -> None:
+    with mock.patch.dict("tests.helper.ZPOOL_STATUS", {"tank": DEGRADED}):
+        result = execute_main(["-p", "tank", "--vdevs"], time="2017-08-20 10:25:48")
+    assert result.exitcode == 2
+    assert result.first_line is not None
+    assert result.first_line.startswith(
+        "ZPOOL_SCRUB CRITICAL - Pool “tank”: vdev “sdb” is FAULTED"
+    )
+    for perfdata in (
+        "'tank: read_errors'=4",
+        "'tank: write_errors'=120",
+        "'tank: checksum_errors'=1236",
+        "'tank: vdev_state'=7",
+    ):
+        assert perfdata in result.first_line
+
+
+def test_disabled() -> None:
+    with mock.patch.dict("tests.helper.ZPOOL_STATUS", {"tank": DEGRADED}):
+        result = execute_main(["-p", "tank"], time="2017-08-20 10:25:48")
+    assert result.exitcode == 0
+
+
+def test_dump() -> None:
+    trees: dict[str, VdevTree] = {}
+    _scan_pools(DEGRADED.splitlines(keepends=True), vdevs=trees)
+    tree = VdevTree.load(json.loads(json.dumps(trees["tank"].dump())))
+    assert tree.dump() == trees["tank"].dump()
+    assert tree.worst() == trees["tank"].worst()
+
+
+def test_cache(tmp_path: Path) -> None:
+    argv = ["-p", "tank", "--vdevs", "--cache-ttl", "300"]
+    argv += ["--cache-file", str(tmp_path / "cache.json")]
+    with mock.patch.dict("tests.helper.ZPOOL_STATUS", {"tank": DEGRADED}):
+        # A cache entry without the vdevs does not serve --vdevs.
+        execute_main(argv[:1] + argv[2:], time="2017-08-20 10:25:48")
+        miss = execute_main(list(argv), time="2017-08-20 10:25:48")
+        assert executed_commands != []
+        hit = execute_main(list(argv), time="2017-08-20 10:25:48")
+        assert executed_commands == []
+    assert miss.exitcode == hit.exitcode == 2
+    assert miss.first_line == hit.first_line
+
+
+class TestDaemon:
+    def serve(self, path: str, *args: str) -> check_zpool_scrub.daemon._SocketServer:
+        options = check_zpool_scrub.get_argparser().parse_args(list(args))
+        with (
+            mock.patch("check_zpool_scrub.opts", options),
+            mock.patch.dict("tests.helper.ZPOOL_STATUS", {"tank": DEGRADED}),
+            mock.patch("tests.helper.ZPOOL_LIST", ["tank"]),
+            fake_zpool(),
+            freeze_time("2017-08-20 10:25:48"),
+        ):
+            collector = check_zpool_scrub.daemon.Collector(300)
+            collector.refresh()
+        server = check_zpool_scrub.daemon._SocketServer(path, collector)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_vdevs(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "check_zpool_scrub.sock")
+        server = self.serve(path, "--vdevs")
+        try:
+            argv = ["-p", "tank", "--vdevs"]
+            with mock.patch.dict("tests.helper.ZPOOL_STATUS", {"tank": DEGRADED}):
+                probed = execute_main(list(argv), time="2017-08-20 10:25:48")
+                served = execute_main(
+                    argv + ["--socket", path], time="2017-08-20 10:25:48"
+                )
+            assert executed_commands == []
+            assert served.first_line == probed.first_line
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_daemon_without_vdevs(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "check_zpool_scrub.sock")
+        server = self.serve(path)
+        try:
+            with mock.patch.dict("tests.helper.ZPOOL_STATUS", {"tank": DEGRADED}):
+                result = execute_main(
+                    ["-p", "tank", "--vdevs", "--socket", path],
+                    time="2017-08-20 10:25:48",
+                )
+            # Probed itself
+            assert executed_commands != []
+            assert result.exitcode == 2
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,73 @@
+"""Test the wait mode against the ``zpool`` simulator in
+``tests/fake_zpool``."""
+
+import time
+from pathlib import Path
+
+import pytest
+
+from check_zpool_scrub import PoolScrubStatus, ScrubRecord
+from check_zpool_scrub.wait import _progress_line, _wait
+from tests.helper import (
+    options,  # noqa: F401 (autouse)
+    run,
+    write_scenario,
+    zpool_simulator,
+)
+
+
+def scrub(name: str, **values: object) -> dict[str, object]:
+    return {"name": name, "scrub": "in_progress", "start": time.time(), **values}
+
+
+def test_progress_line() -> None:
+    status = PoolScrubStatus(
+        "tank", record=ScrubRecord(progress=0.5205, speed=67.2, time_to_go=3681)
+    )
+    assert (
+        _progress_line(status) == "Pool “tank”: 52.05% done, 67.2 MB/s, 1:01:21 to go"
+    )
+    assert _progress_line(PoolScrubStatus("tank", record=ScrubRecord())) is None
+
+
+def test_several_pools(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    path = write_scenario(
+        tmp_path,
+        scrub("fast", duration=0.3),
+        scrub("slow", duration=1.2),
+        {"name": "idle", "scrub": "none"},
+    )
+    with zpool_simulator(scenario=path):
+        begin = time.monotonic()
+        assert _wait(["fast", "slow", "idle"], 0.5) == []
+        elapsed = time.monotonic() - begin
+    # Concurrently, not one after another.
+    assert 1.2 <= elapsed < 2.5
+    lines = capsys.readouterr().out.splitlines()
+    assert lines
+    assert all(line.startswith("Pool “slow”: ") for line in lines)
+
+
+def test_timeout(tmp_path: Path) -> None:
+    path = write_scenario(tmp_path, scrub("endless"), scrub("fast", duration=0.1))
+    with zpool_simulator(scenario=path):
+        begin = time.monotonic()
+        assert _wait(["endless", "fast"], 0, timeout=0.5) == ["endless"]
+    assert time.monotonic() - begin < 1.5
+
+
+def test_unknown_pool(tmp_path: Path) -> None:
+    path = write_scenario(tmp_path, {"name": "tank", "scrub": "none"})
+    with zpool_simulator(scenario=path):
+        assert _wait(["xxx"], 0) == []
+
+
+def test_command_line(tmp_path: Path) -> None:
+    path = write_scenario(tmp_path, scrub("tank", duration=1))
+    with zpool_simulator(scenario=str(path)):
+        process = run(["-p", "tank", "--wait", "--progress-interval", "0.4"])
+    assert process.returncode == 0
+    lines = process.stdout.splitlines()
+    assert lines[0].startswith("Pool “tank”: ")
+    assert lines[-1].startswith("ZPOOL_SCRUB OK")
+    assert "progress" not in lines[-1]
@@ -1,11 +1,40 @@
 """Test the class PoolScrubStatus"""
 
+import io
+import json
+import os
 from datetime import datetime
+from pathlib import Path
+from subprocess import CalledProcessError
+from typing import Any
 from unittest.mock import Mock, patch
 
+import pytest
 from freezegun import freeze_time
 
-from check_zpool_scrub import PoolScrubStatus, _list_pools  # type: ignore
+import check_zpool_scrub
+from check_zpool_scrub import (  # type: ignore
+    PoolScrubStatus,
+    ScrubRecord,
+    _contexts,
+    _discover_pools,
+    _list_pools,
+    _parse_ctime,
+    _parse_scan_stats,
+    _parse_zpool_status,
+    _scan_pools,
+    _scan_record,
+    _zpool_status_json,
+    _zpool_status_stream,
+)
+from tests import benchmark
+from tests.helper import (
+    ZPOOL_LIST,
+    ZPOOL_STATUS,
+    ZPOOL_STATUS_JSON,
+    FakePopen,
+    synthetic_zpool_status_json,
+)
 
 
 @patch("check_zpool_scrub.subprocess.check_output")
@@ -31,6 +60,135 @@ first_critical_zpool
     ]
 
 
+class TestDiscoverPools:
+    @pytest.fixture
+    def kstat(self, tmp_path: Path) -> Path:
+        kstat = tmp_path / "kstat"
+        for pool in ("tank", "backup"):
+            (kstat / pool).mkdir(parents=True)
+        (kstat / "arcstats").write_text("")
+        return kstat
+
+    @patch("check_zpool_scrub._list_pools")
+    def test_kstat(self, list_pools: Mock, kstat: Path) -> None:
+        with patch("check_zpool_scrub._KSTAT_DIR", str(kstat)):
+            assert _discover_pools() == ["backup", "tank"]
+        list_pools.assert_not_called()
+
+    @patch("check_zpool_scrub._list_pools", return_value=["tank"])
+    def test_cached(self, list_pools: Mock, tmp_path: Path) -> None:
+        zpool_cache = tmp_path / "zpool.cache"
+        zpool_cache.write_bytes(b"")
+        cache_file = str(tmp_path / "pools.json")
+        with (
+            patch("check_zpool_scrub._KSTAT_DIR", str(tmp_path / "nonexistent")),
+            patch("check_zpool_scrub._ZPOOL_CACHE", str(zpool_cache)),
+        ):
+            assert _discover_pools(cache_file=cache_file) == ["tank"]
+            assert _discover_pools(cache_file=cache_file) == ["tank"]
+            assert list_pools.call_count == 1
+            # A pool has been imported.
+            list_pools.return_value = ["backup", "tank"]
+            os.utime(zpool_cache, ns=(0, 0))
+            assert _discover_pools(cache_file=cache_file) == ["backup", "tank"]
+            assert list_pools.call_count == 2
+
+    @patch("check_zpool_scrub._list_pools", return_value=["tank"])
+    def test_no_source(self, list_pools: Mock, tmp_path: Path) -> None:
+        cache_file = tmp_path / "pools.json"
+        with (
+            patch("check_zpool_scrub._KSTAT_DIR", str(tmp_path / "nonexistent")),
+            patch("check_zpool_scrub._ZPOOL_CACHE", str(tmp_path / "nonexistent")),
+        ):
+            assert _discover_pools(cache_file=str(cache_file)) == ["tank"]
+            assert _discover_pools(cache_file=str(cache_file)) == ["tank"]
+        assert list_pools.call_count == 2
+        assert not cache_file.exists()
+
+
+class TestScanPools:
+    def test_all_pools(self) -> None:
+        records = _scan_pools(
+            "".join(ZPOOL_STATUS[pool] for pool in ZPOOL_LIST).splitlines(keepends=True)
+        )
+        assert list(records.keys()) == ZPOOL_LIST
+        for pool in ZPOOL_LIST:
+            assert records[pool] == _parse_zpool_status(ZPOOL_STATUS[pool])
+
+    def test_stop_after_scan_block(self) -> None:
+        lines = iter(ZPOOL_STATUS["first_ok_zpool"].splitlines(keepends=True))
+        records = _scan_pools(lines, "first_ok_zpool")
+        assert records["first_ok_zpool"].progress == 0.9619
+        # The config section has not been read.
+        assert next(lines) == "\n"
+
+
+class TestZpoolStatusStream:
+    def test_terminate(self) -> None:
+        processes: list[FakePopen] = []
+
+        def popen(args: list[str], **kwargs: Any) -> FakePopen:
+            processes.append(FakePopen(args, **kwargs))
+            return processes[-1]
+
+        with patch("check_zpool_scrub.subprocess.Popen", side_effect=popen):
+            records = _zpool_status_stream("first_ok_zpool")
+        assert records["first_ok_zpool"].progress == 0.9619
+        assert processes[0].terminated
+
+    def test_unknown_pool(self) -> None:
+        with (
+            patch("check_zpool_scrub.subprocess.Popen", FakePopen),
+            pytest.raises(CalledProcessError),
+        ):
+            _zpool_status_stream("xxx")
+
+
+class TestStreamScanStatsJson:
+    def test_terminate(self) -> None:
+        processes: list[FakePopen] = []
+
+        def popen(args: list[str], **kwargs: Any) -> FakePopen:
+            processes.append(FakePopen(args, **kwargs))
+            return processes[-1]
+
+        pool = synthetic_zpool_status_json(1, 5000)["pool0000"]
+        output = json.dumps({"pools": {"tank": {**pool, "name": "tank"}}})
+        with (
+            patch("tests.helper.json_supported", True),
+            patch.dict("tests.helper.ZPOOL_STATUS_JSON", {"tank": pool}),
+            patch("check_zpool_scrub.subprocess.Popen", side_effect=popen),
+            patch("check_zpool_scrub._zpool_status_json_supported", None),
+        ):
+            pools = _zpool_status_json("tank")
+        assert pools == {"tank": {"name": "tank", "scan_stats": pool["scan_stats"]}}
+        assert processes[0].terminated
+        # Only the first chunk of the output has been read.
+        stdout = processes[0].stdout
+        assert isinstance(stdout, io.BytesIO)
+        assert stdout.tell() < len(output) / 2
+
+    def test_vdevs_first(self) -> None:
+        pool = {"name": "tank", "vdevs": {}, **ZPOOL_STATUS_JSON["json_finished_zpool"]}
+        with (
+            patch("tests.helper.json_supported", True),
+            patch.dict("tests.helper.ZPOOL_STATUS_JSON", {"tank": pool}),
+            patch("check_zpool_scrub.subprocess.Popen", FakePopen),
+            patch("check_zpool_scrub._zpool_status_json_supported", None),
+        ):
+            pools = _zpool_status_json("tank")
+        assert pools is not None
+        assert pools["tank"]["scan_stats"]["state"] == "FINISHED"
+
+    def test_not_supported(self) -> None:
+        with (
+            patch("check_zpool_scrub.subprocess.Popen", FakePopen),
+            patch("check_zpool_scrub._zpool_status_json_supported", None),
+        ):
+            assert _zpool_status_json("first_ok_zpool") is None
+            assert not check_zpool_scrub._zpool_status_json_supported
+
+
 def get_status(check_output: str) -> PoolScrubStatus:
     with patch("check_zpool_scrub.subprocess.check_output") as mock_run:
         mock_run.return_value = check_output
@@ -100,3 +258,140 @@ errors: No known data errors
 
     def test_last_scrub_interval(self) -> None:
         assert self.status.last_scrub_timespan == 273850453
+
+
+@freeze_time("2017-08-17 10:25:48")
+class TestScanStats:
+    def test_in_progress(self) -> None:
+        record = _parse_scan_stats(
+            ZPOOL_STATUS_JSON["json_in_progress_zpool"]["scan_stats"]
+        )
+        assert record.progress == 0.5
+        assert record.speed == 17.07
+        assert record.time_to_go == 3600
+        assert record.last_scrub == datetime(2017, 8, 17, 9, 25, 48)
+
+    def test_finished(self) -> None:
+        record = _parse_scan_stats(
+            ZPOOL_STATUS_JSON["json_finished_zpool"]["scan_stats"]
+        )
+        assert record.progress is None
+        assert record.speed is None
+        assert record.time_to_go is None
+        assert record.last_scrub == datetime(2017, 7, 17, 10, 25, 48)
+
+    def test_never_scrubbed(self) -> None:
+        assert _parse_scan_stats(None) == ScrubRecord()
+
+
+class TestNewerOutputFormat:
+    def test_days_to_go(self) -> None:
+        assert _parse_zpool_status(ZPOOL_STATUS["days_to_go"]) == ScrubRecord(
+            progress=0.5205,
+            speed=120.0,
+            time_to_go=(60 + 1) * 60 + 21,
+            last_scrub=datetime(2017, 8, 17, 10, 25, 48),
+            scanned=461 * 1024**3,
+            issued=258 * 1024**3,
+            total=496 * 1024**3,
+            repaired=0,
+            issue_speed=67.2,
+        )
+
+    def test_old_format_counters(self) -> None:
+        record = _parse_zpool_status(ZPOOL_STATUS["first_ok_zpool"])
+        assert record.scanned == round(9.12 * 1024**4)
+        assert record.total == round(9.48 * 1024**4)
+        assert record.repaired == 0
+        assert record.issued is None
+
+    def test_repaired_finished_scrub(self) -> None:
+        record = _parse_zpool_status(
+            ZPOOL_STATUS["first_critical_zpool"].replace(
+                "repaired 0 in", "repaired 1,5M in"
+            )
+        )
+        assert record.repaired == round(1.5 * 1024**2)
+
+    def test_paused(self) -> None:
+        record = _parse_zpool_status(
+            "  pool: tank\n"
+            " state: ONLINE\n"
+            "  scan: scrub paused since Thu Aug 17 12:25:48 2017\n"
+            "\tscrub started on Thu Aug 17 10:25:48 2017\n"
+            "\t461G scanned, 258G issued, 496G total\n"
+            "\t0B repaired, 52.05% done\n"
+            "config:\n"
+        )
+        assert record.paused is True
+        assert record.last_scrub == datetime(2017, 8, 17, 10, 25, 48)
+        assert record.progress == 0.5205
+        assert record.time_to_go is None
+
+    def test_time_to_go_colons(self) -> None:
+        record = _parse_zpool_status(ZPOOL_STATUS["time_to_go_colons"])
+        assert record.progress == 0.5205
+        assert record.time_to_go == (60 + 1) * 60 + 21
+
+    def test_decimal_point(self) -> None:
+        record = _parse_zpool_status(
+            ZPOOL_STATUS["first_ok_zpool"].replace("1,90M/s", "1.90M/s")
+        )
+        assert record.speed == 1.9
+
+    def test_speed_in_gigabytes(self) -> None:
+        record = _parse_zpool_status(
+            ZPOOL_STATUS["days_to_go"].replace("120M/s", "1.5G/s")
+        )
+        assert record.speed == 1536.0
+
+
+class TestParseCtime:
+    def test_padded_day(self) -> None:
+        assert _parse_ctime("Tue Feb  3 04:05:06 2026") == datetime(2026, 2, 3, 4, 5, 6)
+
+    def test_cached(self) -> None:
+        _parse_ctime.cache_clear()
+        _parse_ctime("Fri Jun 16 10:25:47 2017")
+        _parse_ctime("Fri Jun 16 10:25:47 2017")
+        assert _parse_ctime.cache_info().hits == 1
+
+
+def test_parse_cost() -> None:
+    # A pool with many vdevs in the config section.
+    output = ZPOOL_STATUS["first_ok_zpool"].replace(
+        "errors:",
+        "".join(
+            f"\t    ata-ST3000DM001-1CH166_Z1F3{i:04d}  ONLINE       0     0     0\n"
+            for i in range(500)
+        )
+        + "\nerrors:",
+    )
+    _parse_ctime.cache_clear()
+    with (
+        patch("check_zpool_scrub._scan_record", wraps=_scan_record) as scan_record,
+        patch("check_zpool_scrub._parse_ctime", wraps=_parse_ctime) as parse_ctime,
+    ):
+        status = PoolScrubStatus("xxx", output)
+        assert status.last_scrub_timespan is not None
+        assert status.last_scrub is not None
+    # Only the scan: block is scanned, in a single pass.
+    assert scan_record.call_count == 1
+    block: str = scan_record.call_args.args[0]
+    assert block.startswith("scan: scrub in progress")
+    assert "config:" not in block
+    # The date is parsed once, not by each property.
+    assert parse_ctime.call_count == 1
+
+
+@pytest.mark.slow
+def test_benchmark_suite() -> None:
+    results = benchmark.run([(2, 3)], repeat=1)["results"]
+    assert [result["name"] for result in results] == [
+        "parse_text",
+        "parse_json",
+        *(f"context_{context.name}" for context in _contexts()),
+        "main_text",
+        "main_json",
+    ]
+    assert all(result["best"] > 0 for result in results)